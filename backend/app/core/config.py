@@ -1,2 +1,6 @@
-DATA_ROOT = Path(__file__).resolve().parents[2] / "data"
+import os
+from pathlib import Path
+
+# 可用环境变量 MEDITAG_DATA_ROOT 指向别的数据目录（基准测试 / 压测用合成数据）
+DATA_ROOT = Path(os.getenv("MEDITAG_DATA_ROOT") or Path(__file__).resolve().parents[2] / "data")
 # => backend/data
@@ -0,0 +1,243 @@
+"""
+进程内指标：计数器 + 直方图，按 Prometheus text format 输出（/metrics）。
+
+不依赖 prometheus_client / 外部服务；一次 observe 只是一次加锁和几次整数加法，
+可以放在热点路径上。
+
+    from app.core import metrics
+
+    with metrics.timer("build_kg"):
+        ...
+
+    @metrics.timed("subgraph")
+    def _subgraph(...): ...
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# 从 1ms 到 30s，覆盖接口延迟和 LLM / 构图这类慢阶段
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in items)
+    return "{" + inner + "}"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            lines.append(f"{self.name}{_fmt_labels(key)} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # key -> [每个桶的计数（非累计）..., +Inf 桶, sum, count]
+        self._series: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = [0.0] * (len(self.buckets) + 3)
+                self._series[key] = s
+            s[idx] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def snapshot(self) -> Dict[LabelKey, List[float]]:
+        with self._lock:
+            return {k: list(v) for k, v in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, s in self.snapshot().items():
+            cum = 0.0
+            for i, le in enumerate(self.buckets):
+                cum += s[i]
+                lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', _fmt_value(le)))} {_fmt_value(cum)}")
+            cum += s[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {_fmt_value(cum)}")
+            lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(s[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(key)} {_fmt_value(s[-1])}")
+        return lines
+
+
+# ---------- 全局指标 ----------
+
+REQUEST_LATENCY = Histogram(
+    "meditag_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+)
+REQUESTS_TOTAL = Counter(
+    "meditag_http_requests_total",
+    "HTTP requests by route template and status code.",
+)
+STAGE_LATENCY = Histogram(
+    "meditag_stage_duration_seconds",
+    "Latency of internal stages (jsonl load, build_kg, subgraph, linking, scoring, llm).",
+)
+CACHE_REQUESTS = Counter(
+    "meditag_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss).",
+)
+
+# 抓取时才计算的指标（例如 lru_cache 的 cache_info），返回 [(指标名, 标签, 值), ...]
+_collectors: List[Callable[[], List[Tuple[str, Dict[str, str], float]]]] = []
+_LRU_FAMILIES = (
+    ("meditag_lru_cache_hits_total", "counter"),
+    ("meditag_lru_cache_misses_total", "counter"),
+    ("meditag_lru_cache_size", "gauge"),
+    ("meditag_lru_cache_hit_ratio", "gauge"),
+)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    REQUEST_LATENCY.observe(seconds, method=method, route=route)
+    REQUESTS_TOTAL.inc(method=method, route=route, status=str(status))
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - t0, stage=stage)
+
+
+def timed(stage: str):
+    """函数装饰器版的 timer。"""
+
+    def deco(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_LATENCY.observe(time.perf_counter() - t0, stage=stage)
+
+        return wrapper
+
+    return deco
+
+
+def register_lru_cache(cache: str, cached_func) -> None:
+    """把 functools.lru_cache 的命中情况暴露成 hits / misses / 命中率。"""
+
+    def collect() -> List[Tuple[str, Dict[str, str], float]]:
+        info = cached_func.cache_info()
+        total = info.hits + info.misses
+        labels = {"cache": cache}
+        return [
+            ("meditag_lru_cache_hits_total", labels, info.hits),
+            ("meditag_lru_cache_misses_total", labels, info.misses),
+            ("meditag_lru_cache_size", labels, info.currsize),
+            ("meditag_lru_cache_hit_ratio", labels, info.hits / total if total else 0.0),
+        ]
+
+    _collectors.append(collect)
+
+
+def _cache_ratio_lines() -> List[str]:
+    hits: Dict[str, float] = {}
+    total: Dict[str, float] = {}
+    with CACHE_REQUESTS._lock:
+        items = list(CACHE_REQUESTS._values.items())
+    for key, v in items:
+        labels = dict(key)
+        name = labels.get("cache", "")
+        total[name] = total.get(name, 0.0) + v
+        if labels.get("result") == "hit":
+            hits[name] = hits.get(name, 0.0) + v
+    lines = [
+        "# HELP meditag_cache_hit_ratio Hit ratio of caches tracked via record_cache().",
+        "# TYPE meditag_cache_hit_ratio gauge",
+    ]
+    for name, t in total.items():
+        lines.append(f"meditag_cache_hit_ratio{_fmt_labels(_label_key({'cache': name}))} {_fmt_value(hits.get(name, 0.0) / t)}")
+    return lines
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for m in (REQUEST_LATENCY, REQUESTS_TOTAL, STAGE_LATENCY, CACHE_REQUESTS):
+        lines.extend(m.render())
+    lines.extend(_cache_ratio_lines())
+
+    # 同一个指标的样本必须连在一起输出，所以先收集再按指标名分组
+    samples: Dict[str, List[str]] = {name: [] for name, _ in _LRU_FAMILIES}
+    for collect in _collectors:
+        for name, labels, value in collect():
+            samples.setdefault(name, []).append(f"{name}{_fmt_labels(_label_key(labels))} {_fmt_value(value)}")
+    for name, mtype in _LRU_FAMILIES:
+        if samples.get(name):
+            lines.append(f"# TYPE {name} {mtype}")
+            lines.extend(samples[name])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,250 @@
+"""
+按需性能分析（默认关闭，不影响正常请求）：
+
+1) 单请求采样分析
+   - 请求头 X-Debug-Profile: <DEBUG_TOKEN>，或
+   - 环境变量 PROFILE_SAMPLE_RATE=0.01（按比例随机抽样请求）
+   命中后在请求期间起一个采样线程，每隔 PROFILE_INTERVAL_MS 抓一次各线程调用栈，
+   只保留包含该接口函数的栈（同步接口跑在线程池里，cProfile 抓不到）。
+   结果写到 PROFILE_DIR（默认 backend/profiles）：
+     <id>.folded  折叠栈，可直接拖进 speedscope / flamegraph.pl
+     <id>.json    元信息 + 自身耗时 / 累计耗时 Top 函数
+   目录里只保留最近 PROFILE_KEEP 份，旧的自动删除。
+
+2) tracemalloc 快照对比（见 take_memory_snapshot），用于定位内存增长。
+
+DEBUG_TOKEN 未设置时，请求头触发和管理接口都不可用。
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import DATA_ROOT
+
+PROFILE_HEADER = "x-debug-profile"
+ADMIN_HEADER = "x-debug-token"
+
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN") or ""
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE") or 0)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS") or 5)
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR") or DATA_ROOT.parent / "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP") or 50)
+
+FrameKey = Tuple[str, str, int]  # (filename, function, firstlineno)
+
+
+def token_ok(value: Optional[str]) -> bool:
+    return bool(DEBUG_TOKEN) and value == DEBUG_TOKEN
+
+
+def should_profile(header_value: Optional[str]) -> bool:
+    if header_value is not None and token_ok(header_value):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class StackSampler:
+    """统计型采样器：后台线程定期抓取所有线程的调用栈并计数。"""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.samples: Counter = Counter()  # (thread_id, stack) -> 次数
+        self.ticks = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.started_at = 0.0
+        self.duration = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.ticks += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack: List[FrameKey] = []
+                f = frame
+                while f is not None:
+                    code = f.f_code
+                    stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+                    f = f.f_back
+                stack.reverse()
+                self.samples[(tid, tuple(stack))] += 1
+
+    def stacks_for(self, endpoint: Any) -> Tuple[Counter, bool]:
+        """
+        只保留包含接口函数的栈；找不到（例如请求太快没采到）就返回全部栈。
+        返回 (stack -> 次数, 是否按接口过滤成功)。
+        """
+        code = getattr(endpoint, "__code__", None)
+        key = (code.co_filename, code.co_name, code.co_firstlineno) if code else None
+        out: Counter = Counter()
+        if key is not None:
+            for (_, stack), n in self.samples.items():
+                if key in stack:
+                    out[stack] += n
+            if out:
+                return out, True
+        for (_, stack), n in self.samples.items():
+            out[stack] += n
+        return out, False
+
+
+def _frame_label(fk: FrameKey) -> str:
+    filename, func, line = fk
+    return f"{func} ({Path(filename).name}:{line})"
+
+
+def _top(counter: Counter, total: int, limit: int = 30) -> List[Dict[str, Any]]:
+    return [
+        {"function": _frame_label(fk), "samples": n, "ratio": round(n / total, 4) if total else 0.0}
+        for fk, n in counter.most_common(limit)
+    ]
+
+
+def _rotate(directory: Path, keep: int) -> None:
+    metas = sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    for old in metas[: max(0, len(metas) - keep)]:
+        for p in (old, old.with_suffix(".folded")):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def write_profile(sampler: StackSampler, method: str, route: str, endpoint: Any, status: int) -> str:
+    """把一次采样结果写入 PROFILE_DIR，返回 profile id。"""
+    stacks, filtered = sampler.stacks_for(endpoint)
+    total = sum(stacks.values())
+
+    self_counts: Counter = Counter()
+    cum_counts: Counter = Counter()
+    for stack, n in stacks.items():
+        if stack:
+            self_counts[stack[-1]] += n
+        for fk in set(stack):
+            cum_counts[fk] += n
+
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_")[:60] or "root"
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{int(sampler.duration * 1000)}ms_{method}_{slug}_{random.randint(0, 0xFFFF):04x}"
+
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    with (PROFILE_DIR / f"{profile_id}.folded").open("w", encoding="utf-8") as f:
+        for stack, n in stacks.most_common():
+            f.write(";".join(_frame_label(fk) for fk in stack) + f" {n}\n")
+
+    meta = {
+        "id": profile_id,
+        "method": method,
+        "route": route,
+        "status": status,
+        "duration_ms": round(sampler.duration * 1000, 2),
+        "interval_ms": round(sampler.interval * 1000, 3),
+        "ticks": sampler.ticks,
+        "samples": total,
+        "filtered_to_endpoint": filtered,
+        "top_self": _top(self_counts, total),
+        "top_cumulative": _top(cum_counts, total),
+    }
+    (PROFILE_DIR / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    _rotate(PROFILE_DIR, PROFILE_KEEP)
+    return profile_id
+
+
+def list_profiles(limit: int = 50) -> List[Dict[str, Any]]:
+    if not PROFILE_DIR.exists():
+        return []
+    metas = sorted(PROFILE_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    out = []
+    for p in metas[:limit]:
+        try:
+            meta = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        out.append({k: meta.get(k) for k in ("id", "method", "route", "status", "duration_ms", "samples")})
+    return out
+
+
+# ====================== tracemalloc 快照 ======================
+
+_snapshot_lock = threading.Lock()
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def take_memory_snapshot(key_type: str = "lineno", limit: int = 30, frames: int = 10) -> Dict[str, Any]:
+    """
+    第一次调用：开启 tracemalloc 并记下基线快照。
+    之后每次调用：和上一次快照比较，返回增长最多的分配位置，并把当前快照作为新基线。
+    key_type: lineno / filename / traceback
+    """
+    global _last_snapshot
+    if key_type not in ("lineno", "filename", "traceback"):
+        raise ValueError(f"unsupported key_type: {key_type}")
+
+    with _snapshot_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _last_snapshot = None
+
+        snap = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        prev = _last_snapshot
+        _last_snapshot = snap
+
+    result: Dict[str, Any] = {
+        "tracing": True,
+        "traced_current_mb": round(current / (1024 * 1024), 3),
+        "traced_peak_mb": round(peak / (1024 * 1024), 3),
+        "baseline": prev is None,
+        "top": [],
+    }
+    if prev is None:
+        return result
+
+    diffs = snap.compare_to(prev, key_type)
+    for d in diffs[:limit]:
+        item: Dict[str, Any] = {
+            "size_diff_kb": round(d.size_diff / 1024, 2),
+            "size_kb": round(d.size / 1024, 2),
+            "count_diff": d.count_diff,
+            "count": d.count,
+        }
+        if key_type == "traceback":
+            item["traceback"] = [f"{fr.filename}:{fr.lineno}" for fr in d.traceback]
+        else:
+            fr = d.traceback[0]
+            item["where"] = f"{fr.filename}:{fr.lineno}" if key_type == "lineno" else fr.filename
+        result["top"].append(item)
+    return result
+
+
+def stop_memory_tracing() -> Dict[str, Any]:
+    global _last_snapshot
+    with _snapshot_lock:
+        was = tracemalloc.is_tracing()
+        if was:
+            tracemalloc.stop()
+        _last_snapshot = None
+    return {"tracing": False, "was_tracing": was}
@@ -0,0 +1,105 @@
+"""
+启动预热：服务起来后在后台线程里把指定项目的 KG / 布局 / 传播矩阵先算好，
+第一个用户请求不用再等几秒的冷启动构图。
+
+    KG_WARMUP_PROJECTS=proj_a,proj_b   # 逗号分隔；"*" 表示 data/projects 下的所有项目；不设则不预热
+
+预热进度和存活分开：/healthz 只要进程能响应就 200；
+/readyz 在预热完成前返回 503，并带上每个项目的进度（pending / running / ready / failed）。
+某个项目预热失败不会卡住就绪——失败记在进度里，这个项目的请求照常走冷启动路径。
+"""
+import os
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.utils.time_utils import now_str
+
+WARMUP_ENV = "KG_WARMUP_PROJECTS"
+
+# 一个预热步骤：(名字, fn(project_id))
+Step = Tuple[str, Callable[[str], Any]]
+
+
+def configured_projects(all_projects: Callable[[], List[str]]) -> List[str]:
+    raw = (os.getenv(WARMUP_ENV) or "").strip()
+    if not raw:
+        return []
+    if raw == "*":
+        return all_projects()
+    seen: Dict[str, None] = {}
+    for p in raw.split(","):
+        p = p.strip()
+        if p:
+            seen[p] = None
+    return list(seen)
+
+
+class Warmup:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.projects: Dict[str, Dict[str, Any]] = {}
+
+    def start(self, project_ids: Sequence[str], steps: Sequence[Step]) -> Optional[threading.Thread]:
+        """后台线程逐个项目跑 steps；重复调用不会重复启动。"""
+        with self._lock:
+            if self._thread is not None or not project_ids:
+                return self._thread
+            self.started_at = now_str()
+            self.projects = {
+                pid: {"status": "pending", "steps": {}, "seconds": None, "error": None}
+                for pid in project_ids
+            }
+            # daemon：预热没跑完也不挡进程退出
+            self._thread = threading.Thread(
+                target=self._run, args=(list(project_ids), list(steps)), name="kg-warmup", daemon=True
+            )
+        self._thread.start()
+        return self._thread
+
+    def _set(self, project_id: str, **fields: Any) -> None:
+        with self._lock:
+            self.projects[project_id].update(fields)
+
+    def _run(self, project_ids: List[str], steps: List[Step]) -> None:
+        for pid in project_ids:
+            self._set(pid, status="running")
+            t0 = time.perf_counter()
+            try:
+                for name, fn in steps:
+                    s0 = time.perf_counter()
+                    fn(pid)
+                    with self._lock:
+                        self.projects[pid]["steps"][name] = round(time.perf_counter() - s0, 4)
+            except Exception as e:
+                traceback.print_exc()
+                self._set(pid, status="failed", error=f"{type(e).__name__}: {e}",
+                          seconds=round(time.perf_counter() - t0, 4))
+                continue
+            self._set(pid, status="ready", seconds=round(time.perf_counter() - t0, 4))
+        with self._lock:
+            self.finished_at = now_str()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            projects = {pid: dict(p, steps=dict(p["steps"])) for pid, p in self.projects.items()}
+            started_at, finished_at = self.started_at, self.finished_at
+        counts: Dict[str, int] = {}
+        for p in projects.values():
+            counts[p["status"]] = counts.get(p["status"], 0) + 1
+        total = len(projects)
+        finished = counts.get("ready", 0) + counts.get("failed", 0)
+        return {
+            "ready": finished == total,
+            "progress": {"total": total, "finished": finished, **counts},
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "projects": projects,
+        }
+
+
+warmup = Warmup()
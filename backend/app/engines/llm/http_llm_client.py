@@ -0,0 +1,31 @@
+"""
+OpenAI 兼容接口（火山方舟 ARK）的客户端。
+
+openai SDK 光 import 就要几百毫秒（大量 pydantic 类型），而只有 LLM 解析症状的接口用得到，
+所以推迟到第一次真正调用时才导入；客户端按 (base_url, api_key) 缓存复用，连接池也跟着复用。
+"""
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Tuple
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+ARK_BASE_URL = os.getenv("ARK_BASE_URL") or "https://ark.cn-beijing.volces.com/api/v3"
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[str, str], "OpenAI"] = {}
+
+
+def get_client(api_key: str, base_url: str = ARK_BASE_URL) -> "OpenAI":
+    key = (base_url, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            from openai import OpenAI  # 延迟导入，见模块说明
+
+            client = _clients[key] = OpenAI(base_url=base_url, api_key=api_key)
+        return client
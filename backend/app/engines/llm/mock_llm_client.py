@@ -0,0 +1,83 @@
+"""
+本地 mock 的 LLM 客户端（压测 / 离线开发用），接口和 openai SDK 的 client.responses.create 一致。
+
+LLM_BACKEND=mock 时 main._get_ark_client() 返回它，不需要 ARK_API_KEY，也不走网络。
+不调模型，直接把 user 消息里 “文本：” 那一行按标点切开当作症状；
+“无 / 没有 / 否认” 开头的记成 absent。
+
+可用环境变量模拟真实调用的耗时和失败：
+    MOCK_LLM_LATENCY_MS   每次调用的平均耗时（毫秒，默认 0）
+    MOCK_LLM_JITTER_MS    在平均耗时上 ± 均匀抖动（毫秒，默认 0）
+    MOCK_LLM_ERROR_RATE   调用失败（抛 RuntimeError）的概率，0~1（默认 0）
+和真实客户端一样是同步阻塞调用（time.sleep），占着接口的工作线程，压测结果才有参考价值。
+"""
+import json
+import os
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+_text_line = re.compile(r"^文本[:：](.*)$", flags=re.MULTILINE)
+_separators = re.compile(r"[，,。.;；、\s]+")
+_negations = ("没有", "否认", "无")
+
+
+def _extract(text: str) -> Dict[str, Any]:
+    symptoms: List[Dict[str, Any]] = []
+    for part in _separators.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        polarity = "present"
+        for neg in _negations:
+            if part.startswith(neg) and len(part) > len(neg):
+                part = part[len(neg):]
+                polarity = "absent"
+                break
+        symptoms.append({"text": part, "polarity": polarity, "duration": None, "severity": None})
+    return {"symptoms": symptoms, "notes": "mock"}
+
+
+class _Responses:
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def create(self, model: str, input: List[Dict[str, str]], **kwargs: Any) -> SimpleNamespace:
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            raise RuntimeError("mock llm: simulated upstream error")
+
+        user = next((m.get("content") or "" for m in reversed(input) if m.get("role") == "user"), "")
+        m = _text_line.search(user)
+        parsed = _extract(m.group(1) if m else user)
+        return SimpleNamespace(output_text=json.dumps(parsed, ensure_ascii=False), model=model)
+
+
+class MockLLMClient:
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        jitter_ms: Optional[float] = None,
+        error_rate: Optional[float] = None,
+    ):
+        self.responses = _Responses(
+            latency_ms=float(os.getenv("MOCK_LLM_LATENCY_MS") or 0) if latency_ms is None else latency_ms,
+            jitter_ms=float(os.getenv("MOCK_LLM_JITTER_MS") or 0) if jitter_ms is None else jitter_ms,
+            error_rate=float(os.getenv("MOCK_LLM_ERROR_RATE") or 0) if error_rate is None else error_rate,
+        )
+
+
+_client: Optional[MockLLMClient] = None
+
+
+def get_client() -> MockLLMClient:
+    global _client
+    if _client is None:
+        _client = MockLLMClient()
+    return _client
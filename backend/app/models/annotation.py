@@ -0,0 +1,23 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class Annotation:
+    """一条人工标注结果，追加写入 labeling/annotations.jsonl。"""
+
+    project_id: str
+    sample_id: str
+    annotator: str
+    label: Optional[str] = None
+    cot_text: Optional[str] = None
+    source: str = "human"
+    lease_id: Optional[str] = None
+    created_at: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Annotation":
+        return cls(**{k: d.get(k) for k in cls.__dataclass_fields__ if k in d})
@@ -0,0 +1,45 @@
+from dataclasses import dataclass, field
+from typing import Dict, Set
+
+
+@dataclass
+class Lease:
+    """一次领取：annotator 在 expires_at（time.monotonic）之前持有 sample_id 的一个副本名额。"""
+
+    lease_id: str
+    project_id: str
+    sample_id: str
+    annotator: str
+    expires_at: float
+    heartbeats: int = 0
+
+    def to_dict(self, now: float) -> Dict[str, object]:
+        return {
+            "lease_id": self.lease_id,
+            "project_id": self.project_id,
+            "sample_id": self.sample_id,
+            "annotator": self.annotator,
+            "expires_in": round(max(0.0, self.expires_at - now), 3),
+            "heartbeats": self.heartbeats,
+        }
+
+
+@dataclass
+class AnnotationTask:
+    """一个样本的分发状态：需要 replicas 个不同标注员各标一次。"""
+
+    sample_id: str
+    replicas: int = 1
+    done_by: Set[str] = field(default_factory=set)
+    leased_to: Set[str] = field(default_factory=set)
+
+    @property
+    def open_slots(self) -> int:
+        return max(0, self.replicas - len(self.done_by) - len(self.leased_to))
+
+    @property
+    def finished(self) -> bool:
+        return len(self.done_by) >= self.replicas
+
+    def taken_by(self, annotator: str) -> bool:
+        return annotator in self.done_by or annotator in self.leased_to
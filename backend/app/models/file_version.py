@@ -0,0 +1,46 @@
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class ChunkRef:
+    """版本里的一个内容块：按内容 sha256 寻址，同样内容的块只存一份。"""
+
+    hash: str
+    bytes: int
+    records: int
+
+
+@dataclass
+class FileVersion:
+    """数据集（项目下的一个 jsonl 文件）的一个版本：按顺序拼起来的内容块列表。"""
+
+    project_id: str
+    dataset: str
+    version: int
+    sha256: str
+    bytes: int = 0
+    records: int = 0
+    chunks: List[ChunkRef] = field(default_factory=list)
+    parent: Optional[int] = None
+    new_chunks: int = 0  # 这个版本新存的块数 / 字节数，其余块和已有版本共用
+    new_bytes: int = 0
+    chunker: Dict[str, int] = field(default_factory=dict)
+    message: str = ""
+    created_at: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "FileVersion":
+        kw = {k: d.get(k) for k in cls.__dataclass_fields__ if k in d}
+        kw["chunks"] = [ChunkRef(**c) for c in d.get("chunks") or []]
+        return cls(**kw)
+
+    def summary(self) -> Dict[str, Any]:
+        """列表接口用：不带块列表。"""
+        d = self.to_dict()
+        d.pop("chunks")
+        d["chunk_count"] = len(self.chunks)
+        return d
@@ -0,0 +1,32 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class PreprocessingRun:
+    """一次 raw -> labeling_inputs.jsonl 的预处理运行，追加写入 labeling/preprocessing_runs.jsonl。"""
+
+    run_id: str
+    project_id: str
+    status: str = "running"  # running / completed / failed
+    started_at: str = ""
+    finished_at: Optional[str] = None
+    shards: int = 0
+    chunks_total: int = 0
+    chunks_done: int = 0
+    chunks_resumed: int = 0  # 从断点续上、这次没有重新解析的分块
+    lines: int = 0
+    written: int = 0
+    errors: int = 0
+    workers: int = 1
+    seconds: Optional[float] = None
+    output: Optional[str] = None
+    error_report: Optional[str] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "PreprocessingRun":
+        return cls(**{k: d.get(k) for k in cls.__dataclass_fields__ if k in d})
@@ -0,0 +1,103 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.models.workflow_node import NodeRun, WorkflowNode
+
+
+@dataclass
+class Workflow:
+    """一个项目的处理流程：节点 + 依赖边组成的 DAG。"""
+
+    workflow_id: str
+    project_id: str
+    name: str = ""
+    nodes: List[WorkflowNode] = field(default_factory=list)
+
+    def node_map(self) -> Dict[str, WorkflowNode]:
+        return {n.id: n for n in self.nodes}
+
+    def topo_order(self) -> List[str]:
+        """节点 id 的拓扑序（同层按定义顺序）；id 重复、依赖不存在或有环时抛 ValueError。"""
+        nodes = self.node_map()
+        if len(nodes) != len(self.nodes):
+            raise ValueError("duplicate node id in workflow")
+        indegree = {nid: 0 for nid in nodes}
+        children: Dict[str, List[str]] = {nid: [] for nid in nodes}
+        for n in self.nodes:
+            for dep in n.depends_on:
+                if dep not in nodes:
+                    raise ValueError(f"node {n.id} depends on unknown node {dep}")
+                indegree[n.id] += 1
+                children[dep].append(n.id)
+
+        order = [nid for nid, d in indegree.items() if d == 0]
+        i = 0
+        while i < len(order):
+            for c in children[order[i]]:
+                indegree[c] -= 1
+                if indegree[c] == 0:
+                    order.append(c)
+            i += 1
+        if len(order) != len(nodes):
+            cyclic = sorted(nid for nid, d in indegree.items() if d > 0)
+            raise ValueError(f"workflow has a cycle through: {', '.join(cyclic)}")
+        return order
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "workflow_id": self.workflow_id,
+            "project_id": self.project_id,
+            "name": self.name,
+            "nodes": [n.to_dict() for n in self.nodes],
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Workflow":
+        return cls(
+            workflow_id=str(d["workflow_id"]),
+            project_id=str(d["project_id"]),
+            name=str(d.get("name") or ""),
+            nodes=[WorkflowNode.from_dict(n) for n in d.get("nodes") or []],
+        )
+
+
+@dataclass
+class WorkflowRun:
+    """一次工作流运行，追加写入 workflows/<workflow_id>.runs.jsonl。"""
+
+    run_id: str
+    workflow_id: str
+    project_id: str
+    status: str = "running"  # running / success / failed
+    started_at: str = ""
+    finished_at: Optional[str] = None
+    seconds: Optional[float] = None
+    max_workers: int = 1
+    nodes: Dict[str, NodeRun] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "workflow_id": self.workflow_id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": self.seconds,
+            "max_workers": self.max_workers,
+            "nodes": {nid: r.to_dict() for nid, r in self.nodes.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "WorkflowRun":
+        return cls(
+            run_id=d["run_id"],
+            workflow_id=d["workflow_id"],
+            project_id=d["project_id"],
+            status=d.get("status") or "",
+            started_at=d.get("started_at") or "",
+            finished_at=d.get("finished_at"),
+            seconds=d.get("seconds"),
+            max_workers=d.get("max_workers") or 1,
+            nodes={nid: NodeRun.from_dict(r) for nid, r in (d.get("nodes") or {}).items()},
+        )
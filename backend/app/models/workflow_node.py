@@ -0,0 +1,52 @@
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class WorkflowNode:
+    """工作流里的一个节点：type 对应 node_execution_service 里注册的节点类型。"""
+
+    id: str
+    type: str
+    depends_on: List[str] = field(default_factory=list)
+    config: Dict[str, Any] = field(default_factory=dict)
+    title: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "WorkflowNode":
+        return cls(
+            id=str(d["id"]),
+            type=str(d["type"]),
+            depends_on=[str(x) for x in d.get("depends_on") or []],
+            config=dict(d.get("config") or {}),
+            title=str(d.get("title") or ""),
+        )
+
+
+@dataclass
+class NodeRun:
+    """一个节点在一次运行里的结果。status: pending / running / success / cached / failed / skipped。"""
+
+    node_id: str
+    node_type: str
+    status: str = "pending"
+    cache_key: Optional[str] = None
+    started_at: Optional[str] = None
+    seconds: Optional[float] = None
+    output: Optional[Dict[str, Any]] = None
+    output_digest: Optional[str] = None  # output + 产物文件签名的哈希，参与下游的缓存键
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("success", "cached")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "NodeRun":
+        return cls(**{k: d.get(k) for k in cls.__dataclass_fields__ if k in d})
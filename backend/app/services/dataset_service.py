@@ -0,0 +1,296 @@
+"""
+数据集版本：把项目下的 jsonl（raw/*.jsonl、labeling/*.jsonl）切成内容定义的块（CDC），按块的 sha256 只存一份。
+
+切块（按行，不会把一条记录切成两半）：
+    从块头开始累计字节数，每读一行算 crc32(行)；
+    块够 MIN_CHUNK_BYTES 后，crc32 < 2^32 * len(行) / AVG_CHUNK_BYTES 的行之后切一刀
+    （按字节数折算概率，平均块大小约 MIN + AVG），到 MAX_CHUNK_BYTES 强制切。
+    切点只取决于行内容，追加 / 改几条记录时只有附近一两个块变化，后面的切点重新对齐，
+    新版本只需要存变了的块。
+
+存储（projects/<id>/versions/）：
+    objects/<sha[:2]>/<sha>.zst|.gz   块内容（装了 zstandard 用 zstd，否则 gzip）
+    <dataset>/v000001.json            版本清单：块列表 + 整个文件的 sha256
+
+版本间的 diff 只读两边不同的块，解析出记录按 sample_id（没有时用 custom_id）比较，
+给出 added / modified / removed 的 sample_id，增量重建（KG / QC 缓存）可以直接用。
+
+只支持未压缩的 jsonl（包括 raw/med_think_<i>.jsonl 这样的未压缩分片）。
+压缩分片（raw/*.jsonl.gz / .jsonl.zst）不能建版本。压缩流改一条记录，后面的字节就全变了，
+按字节切块去不了重。要给它们建版本，得先解压成 .jsonl。
+"""
+import gzip
+import hashlib
+import json
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.models.file_version import ChunkRef, FileVersion
+from app.services.storage_service import get_project_dir
+from app.utils.file_utils import atomic_write_bytes, atomic_write_chunks, atomic_write_json
+from app.utils.time_utils import now_str
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：没有时块用 gzip 存
+    zstandard = None
+
+MIN_CHUNK_BYTES = 256 * 1024
+AVG_CHUNK_BYTES = 1024 * 1024
+MAX_CHUNK_BYTES = 8 * 1024 * 1024
+
+# 只允许给项目下这两个目录里的未压缩 jsonl 建版本（压缩分片不支持，见模块说明）
+_dataset_pattern = re.compile(r"^(raw|labeling)/[A-Za-z0-9_.\-]+\.jsonl$")
+
+_locks_guard = threading.Lock()
+_locks: Dict[str, threading.Lock] = {}
+
+
+def _lock(project_id: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(project_id, threading.Lock())
+
+
+def get_versions_dir(project_id: str) -> Path:
+    return get_project_dir(project_id) / "versions"
+
+
+def dataset_path(project_id: str, dataset: str) -> Path:
+    """dataset 是项目目录下的相对路径，比如 labeling/labeling_inputs.jsonl。"""
+    if not _dataset_pattern.match(dataset):
+        raise ValueError(
+            f"invalid dataset: {dataset} (expected raw/<name>.jsonl or labeling/<name>.jsonl; "
+            "compressed shards are not versioned)"
+        )
+    return get_project_dir(project_id) / dataset
+
+
+def _manifest_dir(project_id: str, dataset: str) -> Path:
+    return get_versions_dir(project_id) / dataset.replace("/", "__")
+
+
+def _manifest_path(project_id: str, dataset: str, version: int) -> Path:
+    return _manifest_dir(project_id, dataset) / f"v{version:06d}.json"
+
+
+# ====================== 切块 ======================
+
+def iter_chunks(path: Path) -> Iterator[Tuple[bytes, int]]:
+    """按内容定义的切点流式切块，产出 (块内容, 行数)。"""
+    threshold_per_byte = (1 << 32) // AVG_CHUNK_BYTES
+    buf: List[bytes] = []
+    size = 0
+    with path.open("rb") as f:
+        for line in f:
+            buf.append(line)
+            size += len(line)
+            if size >= MAX_CHUNK_BYTES or (
+                size >= MIN_CHUNK_BYTES and zlib.crc32(line) < len(line) * threshold_per_byte
+            ):
+                yield b"".join(buf), len(buf)
+                buf = []
+                size = 0
+    if buf:
+        yield b"".join(buf), len(buf)
+
+
+# ====================== 块存储 ======================
+
+def _object_path(project_id: str, digest: str, ext: str) -> Path:
+    return get_versions_dir(project_id) / "objects" / digest[:2] / f"{digest}{ext}"
+
+
+def _find_object(project_id: str, digest: str) -> Optional[Path]:
+    for ext in (".zst", ".gz"):
+        p = _object_path(project_id, digest, ext)
+        if p.exists():
+            return p
+    return None
+
+
+def _put_object(project_id: str, digest: str, data: bytes) -> bool:
+    """块不存在时写入，返回是否新写了。"""
+    if _find_object(project_id, digest) is not None:
+        return False
+    if zstandard is not None:
+        atomic_write_bytes(_object_path(project_id, digest, ".zst"), zstandard.ZstdCompressor(level=3).compress(data))
+    else:
+        atomic_write_bytes(_object_path(project_id, digest, ".gz"), gzip.compress(data, compresslevel=1, mtime=0))
+    return True
+
+
+def read_chunk(project_id: str, digest: str) -> bytes:
+    p = _find_object(project_id, digest)
+    if p is None:
+        raise FileNotFoundError(f"chunk object missing: {digest}")
+    raw = p.read_bytes()
+    if p.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(f"reading chunk {digest} requires the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(raw)
+    return gzip.decompress(raw)
+
+
+# ====================== 版本 ======================
+
+def list_versions(project_id: str, dataset: str) -> List[FileVersion]:
+    dataset_path(project_id, dataset)  # 校验名字
+    d = _manifest_dir(project_id, dataset)
+    if not d.is_dir():
+        return []
+    return [
+        FileVersion.from_dict(json.loads(p.read_text(encoding="utf-8")))
+        for p in sorted(d.glob("v*.json"))
+    ]
+
+
+def get_version(project_id: str, dataset: str, version: Optional[int] = None) -> FileVersion:
+    """取指定版本；version 为空时取最新版本。"""
+    if version is None:
+        versions = list_versions(project_id, dataset)
+        if not versions:
+            raise FileNotFoundError(f"no versions for dataset {dataset}")
+        return versions[-1]
+    dataset_path(project_id, dataset)
+    path = _manifest_path(project_id, dataset, version)
+    if not path.exists():
+        raise FileNotFoundError(f"version {version} not found for dataset {dataset}")
+    return FileVersion.from_dict(json.loads(path.read_text(encoding="utf-8")))
+
+
+def commit_version(project_id: str, dataset: str, message: str = "") -> Tuple[FileVersion, bool]:
+    """
+    把数据集当前文件记成一个新版本，只存新出现的块。
+    内容和最新版本完全一样时不建新版本，返回 (最新版本, False)。
+    """
+    path = dataset_path(project_id, dataset)
+    if not path.exists():
+        raise FileNotFoundError(f"dataset file not found: {path}")
+
+    with _lock(project_id):
+        versions = list_versions(project_id, dataset)
+        latest = versions[-1] if versions else None
+
+        file_hash = hashlib.sha256()
+        chunks: List[ChunkRef] = []
+        new_chunks = 0
+        new_bytes = 0
+        for data, n_lines in iter_chunks(path):
+            file_hash.update(data)
+            digest = hashlib.sha256(data).hexdigest()
+            if _put_object(project_id, digest, data):
+                new_chunks += 1
+                new_bytes += len(data)
+            chunks.append(ChunkRef(hash=digest, bytes=len(data), records=n_lines))
+
+        sha = file_hash.hexdigest()
+        if latest is not None and latest.sha256 == sha:
+            return latest, False
+
+        v = FileVersion(
+            project_id=project_id,
+            dataset=dataset,
+            version=(latest.version + 1) if latest else 1,
+            sha256=sha,
+            bytes=sum(c.bytes for c in chunks),
+            records=sum(c.records for c in chunks),
+            chunks=chunks,
+            parent=latest.version if latest else None,
+            new_chunks=new_chunks,
+            new_bytes=new_bytes,
+            chunker={"min": MIN_CHUNK_BYTES, "avg": AVG_CHUNK_BYTES, "max": MAX_CHUNK_BYTES},
+            message=message,
+            created_at=now_str(),
+        )
+        atomic_write_json(_manifest_path(project_id, dataset, v.version), v.to_dict())
+    return v, True
+
+
+def checkout_version(project_id: str, dataset: str, version: int) -> FileVersion:
+    """把数据集文件恢复成指定版本（边解压边写临时文件，校验 sha256 后原子替换）。"""
+    v = get_version(project_id, dataset, version)
+    path = dataset_path(project_id, dataset)
+    file_hash = hashlib.sha256()
+
+    def stream() -> Iterator[bytes]:
+        for c in v.chunks:
+            data = read_chunk(project_id, c.hash)
+            file_hash.update(data)
+            yield data
+
+    def verify() -> None:
+        if file_hash.hexdigest() != v.sha256:
+            raise RuntimeError(f"checksum mismatch restoring {dataset} v{version}")
+
+    with _lock(project_id):
+        atomic_write_chunks(path, stream(), before_replace=verify)
+    return v
+
+
+# ====================== diff ======================
+
+def _record_key(line: bytes) -> Optional[str]:
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(obj, dict):
+        return None
+    key = obj.get("sample_id") or obj.get("custom_id")
+    return str(key) if key is not None else None
+
+
+def _index_chunks(project_id: str, digests: List[str]) -> Tuple[Dict[str, str], int]:
+    """读若干块，返回 ({sample_id: 记录内容哈希}, 没有 id 的记录数)。"""
+    index: Dict[str, str] = {}
+    unkeyed = 0
+    for digest in digests:
+        for line in read_chunk(project_id, digest).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            key = _record_key(line)
+            if key is None:
+                unkeyed += 1
+                continue
+            index[key] = hashlib.sha1(line).hexdigest()
+    return index, unkeyed
+
+
+def diff_versions(project_id: str, dataset: str, old: int, new: int) -> Dict[str, Any]:
+    """
+    两个版本间变化的 sample_id。两边都有的块内容相同，直接跳过，只解析各自独有的块。
+    unkeyed_records 是这些块里没有 sample_id / custom_id 的记录数（无法按 id 比较）。
+    """
+    a = get_version(project_id, dataset, old)
+    b = get_version(project_id, dataset, new)
+    a_hashes: Set[str] = {c.hash for c in a.chunks}
+    b_hashes: Set[str] = {c.hash for c in b.chunks}
+    only_a = list(dict.fromkeys(c.hash for c in a.chunks if c.hash not in b_hashes))
+    only_b = list(dict.fromkeys(c.hash for c in b.chunks if c.hash not in a_hashes))
+
+    old_index, old_unkeyed = _index_chunks(project_id, only_a)
+    new_index, new_unkeyed = _index_chunks(project_id, only_b)
+    added = sorted(k for k in new_index if k not in old_index)
+    removed = sorted(k for k in old_index if k not in new_index)
+    modified = sorted(k for k in new_index if k in old_index and new_index[k] != old_index[k])
+    return {
+        "dataset": dataset,
+        "from": old,
+        "to": new,
+        "chunks_shared": len(a_hashes & b_hashes),
+        "chunks_read": len(only_a) + len(only_b),
+        "added": added,
+        "modified": modified,
+        "removed": removed,
+        "unkeyed_records": old_unkeyed + new_unkeyed,
+    }
+
+
+def changed_sample_ids(project_id: str, dataset: str, old: int, new: int) -> Set[str]:
+    """增量重建用：两个版本间新增 / 修改 / 删除过的全部 sample_id。"""
+    d = diff_versions(project_id, dataset, old, new)
+    return set(d["added"]) | set(d["modified"]) | set(d["removed"])
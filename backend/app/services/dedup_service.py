@@ -0,0 +1,243 @@
+"""
+近重复病历检测：MinHash + LSH 分桶。
+
+1) 每条 emr_text 去掉病患 id / 日期后取字符 k-gram（默认 5），
+   用 numpy 整体算出各 k-gram 的 64 位哈希；
+2) num_perm 个 multiply-shift 哈希函数取最小值得到 MinHash 签名；
+3) 签名切成 bands 段，每段哈希成一个整数，排序后值相同的就是同一个桶，
+   桶内样本才做相似度校验（签名逐位相等的比例 ≈ Jaccard），整体近似线性；
+4) 校验通过的样本对做并查集，得到重复簇。
+
+结果写到 qc/dup_clusters.json；每个簇里除代表样本（最早出现的那条）外，
+其余样本各生成一条 rule_near_duplicate 的 QC 问题。
+build_kg(dedup=True) 时每个簇只计一次。numpy 在用到的函数里才导入，import main 时不拉起它。
+"""
+import hashlib
+import json
+import re
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+from app.services.storage_service import get_qc_dir
+from app.utils.file_utils import atomic_write_json
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DUP_RULE_NAME = "rule_near_duplicate"
+
+_id_date_pattern = re.compile(r"(病患id[:：][^｜|]*[｜|]?|日期[:：]\s*\d{4}-\d{2}-\d{2}[｜|]?)")
+_ws_pattern = re.compile(r"\s+")
+
+# 桶太大时只和桶内第一条比（避免退化成平方复杂度）
+_ALL_PAIRS_MAX_BUCKET = 50
+
+
+def get_clusters_path(project_id: str):
+    return get_qc_dir(project_id) / "dup_clusters.json"
+
+
+def _normalize(text: str) -> str:
+    text = _id_date_pattern.sub("", text or "")
+    return _ws_pattern.sub("", text)
+
+
+def _shingle_hashes(text: str, k: int) -> "np.ndarray":
+    """字符 k-gram 的 64 位多项式哈希（去重），文本不足 k 个字时整段作为一个 shingle。"""
+    import numpy as np
+
+    cps = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if cps.size == 0:
+        return cps
+    k = min(k, cps.size)
+    n = cps.size - k + 1
+    h = np.zeros(n, dtype=np.uint64)
+    base = np.uint64(1000003)
+    for j in range(k):
+        h = h * base + cps[j: j + n]
+    return np.unique(h)
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        # multiply-shift：h(x) = ((a*x + b) mod 2^64) >> 32，a 取奇数
+        self.a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, shingles: "np.ndarray") -> "np.ndarray":
+        import numpy as np
+
+        if shingles.size == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        hv = (self.a[:, None] * shingles[None, :] + self.b[:, None]) >> np.uint64(32)
+        return hv.min(axis=1).astype(np.uint32)
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        p = self.parent
+        while p[x] != x:
+            p[x] = p[p[x]]
+            x = p[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return
+        # 小下标做根：代表样本就是簇里最早出现的那条
+        if ra < rb:
+            self.parent[rb] = ra
+        else:
+            self.parent[ra] = rb
+
+
+def find_near_duplicates(
+    texts: List[str],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    bands: int = 16,
+    shingle_k: int = 5,
+    seed: int = 1,
+) -> Tuple[List[List[int]], Dict[str, Any]]:
+    """
+    返回 (簇列表（每簇是按下标升序的样本下标，长度 >= 2）, 统计信息)。
+    bands * rows 必须等于 num_perm；默认 16x8，约 0.7 以上相似度的样本对大概率进同一桶。
+    """
+    if num_perm % bands != 0:
+        raise ValueError("num_perm must be divisible by bands")
+    import numpy as np
+
+    rows = num_perm // bands
+    t0 = time.perf_counter()
+
+    hasher = MinHasher(num_perm=num_perm, seed=seed)
+    n = len(texts)
+    sigs = np.empty((n, num_perm), dtype=np.uint32)
+    valid = np.zeros(n, dtype=bool)
+    for i, t in enumerate(texts):
+        sh = _shingle_hashes(_normalize(t), shingle_k)
+        valid[i] = sh.size > 0
+        sigs[i] = hasher.signature(sh)
+    t_sig = time.perf_counter()
+
+    rng = np.random.default_rng(seed + 1)
+    mult = rng.integers(1, 2 ** 63, size=(bands, rows), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    idx_valid = np.nonzero(valid)[0]
+
+    uf = _UnionFind(n)
+    checked: Set[Tuple[int, int]] = set()
+    n_candidates = 0
+    n_verified = 0
+
+    def check(i: int, j: int) -> None:
+        nonlocal n_candidates, n_verified
+        key = (i, j) if i < j else (j, i)
+        if key in checked:
+            return
+        checked.add(key)
+        n_candidates += 1
+        sim = float(np.count_nonzero(sigs[i] == sigs[j])) / num_perm
+        if sim >= threshold:
+            n_verified += 1
+            uf.union(i, j)
+
+    sub = sigs[idx_valid].astype(np.uint64)
+    for band in range(bands):
+        seg = sub[:, band * rows: (band + 1) * rows]
+        keys = (seg * mult[band]).sum(axis=1)  # uint64 环绕求和即可当桶哈希
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        if sorted_keys.size < 2:
+            continue
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], sorted_keys.size]
+        for s, e in zip(starts, ends):
+            if e - s < 2:
+                continue
+            members = idx_valid[np.sort(order[s:e])].tolist()
+            if len(members) <= _ALL_PAIRS_MAX_BUCKET:
+                for x in range(len(members)):
+                    for y in range(x + 1, len(members)):
+                        check(members[x], members[y])
+            else:
+                head = members[0]
+                for m in members[1:]:
+                    check(head, m)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(uf.find(i), []).append(i)
+    # 根是簇内最小下标，按下标顺序遍历，簇内天然有序
+    clusters = sorted((g for g in groups.values() if len(g) > 1), key=lambda c: c[0])
+
+    stats = {
+        "samples": n,
+        "skipped_empty": int(n - idx_valid.size),
+        "candidate_pairs": n_candidates,
+        "verified_pairs": n_verified,
+        "clusters": len(clusters),
+        "duplicates": sum(len(c) - 1 for c in clusters),
+        "signature_seconds": round(t_sig - t0, 4),
+        "lsh_seconds": round(time.perf_counter() - t_sig, 4),
+        "params": {"threshold": threshold, "num_perm": num_perm, "bands": bands, "rows": rows, "shingle_k": shingle_k},
+    }
+    return clusters, stats
+
+
+def _cluster_id(sample_ids: List[str]) -> str:
+    h = hashlib.sha1("|".join(sample_ids).encode("utf-8")).hexdigest()[:10]
+    return f"DUP-{h.upper()}"
+
+
+def detect_project_duplicates(
+    project_id: str,
+    samples: List[Dict[str, Any]],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    bands: int = 16,
+) -> Dict[str, Any]:
+    """对项目的 med_think 样本做去重，写 dup_clusters.json，返回 {clusters, issues, stats}。"""
+    texts = [s.get("emr_text") or "" for s in samples]
+    sample_ids = [str(s["sample_id"]) for s in samples]
+    idx_clusters, stats = find_near_duplicates(texts, threshold=threshold, num_perm=num_perm, bands=bands)
+
+    clusters = []
+    issues = []
+    for c in idx_clusters:
+        members = [sample_ids[i] for i in c]
+        cid = _cluster_id(members)
+        clusters.append({"id": cid, "representative": members[0], "members": members})
+        for sid in members[1:]:
+            issues.append(
+                {
+                    "sampleId": sid,
+                    "issueType": f"疑似重复病历（与 {members[0]} 高度相似）",
+                    "detail": f"重复簇 {cid}，共 {len(members)} 条",
+                }
+            )
+
+    atomic_write_json(
+        get_clusters_path(project_id),
+        {"project_id": project_id, "stats": stats, "clusters": clusters},
+    )
+    return {"clusters": clusters, "issues": issues, "stats": stats}
+
+
+def load_duplicate_members(project_id: str) -> Optional[Set[str]]:
+    """返回所有“非代表”样本 id（build_kg 去重时跳过它们）；没跑过去重返回 None。"""
+    path = get_clusters_path(project_id)
+    if not path.exists():
+        return None
+    data = json.loads(path.read_text(encoding="utf-8"))
+    skip: Set[str] = set()
+    for c in data.get("clusters") or []:
+        skip.update(c["members"][1:])
+    return skip
@@ -0,0 +1,300 @@
+"""
+列式批量导出：把样本 / 标注 / QC 问题 / KG 节点和边写成 Parquet 或 Arrow IPC 文件，
+数据分析那边一次下载整表，不用再翻页拉 JSON。
+
+    - 每个数据集一个固定 schema（日期、时间、列表、嵌套结构都是真正的列类型，不是字符串 JSON）；
+    - 源数据逐条流式读取，攒够 ROW_GROUP_SIZE 行写一个 row group / record batch，
+      内存里最多一个批次，和数据集大小无关；
+    - Parquet 用 zstd 压缩；Arrow IPC 文件不压缩，下游可以 memory-map 零拷贝读；
+    - 先写同目录临时文件再 os.replace，导出中途失败不会留下半个文件；
+    - exports/manifest.json 记着每个文件对应的源数据签名（分片大小 / mtime、KG 版本），
+      源数据没变就直接复用已导出的文件。
+
+pyarrow 是可选依赖：没装时导出接口报错，其余功能不受影响。导入它要一百多毫秒，
+所以在用到的函数里才导入，import main 时不拉起它。
+"""
+import datetime as dt
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services import labeling_service, medthink_service, qc_service
+from app.services.storage_service import get_labeling_dataset_path, get_project_dir
+from app.utils.file_utils import atomic_write_json, iter_jsonl
+from app.utils.time_utils import now_str
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE") or 8192)
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+MEDIA_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+DATASETS = ("medthink_samples", "labeling_records", "annotations", "qc_issues", "kg_nodes", "kg_edges")
+# schema 改了就 +1：清单里版本不同的导出文件不再复用
+SCHEMA_VERSION = 2
+
+_locks_guard = threading.Lock()
+_locks: Dict[str, threading.Lock] = {}
+
+
+def _require_pyarrow() -> Tuple[Any, Any]:
+    """返回 (pyarrow, pyarrow.parquet)；没装时报错。"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:  # 可选依赖
+        raise RuntimeError("bulk export requires the pyarrow package") from None
+    return pa, pq
+
+
+def _schema(dataset: str) -> "pa.Schema":
+    pa, _ = _require_pyarrow()
+    s, i32, i64, f64 = pa.string(), pa.int32(), pa.int64(), pa.float64()
+    minute = pa.timestamp("s")
+    if dataset == "medthink_samples":
+        think = pa.struct([("label", s), ("med_think", s), ("tokens", i32)])
+        fields = [
+            ("sample_id", s), ("project_id", s), ("patient_id", s), ("visit_date", pa.date32()),
+            ("diagnosis_list", pa.list_(s)), ("diagnosis_count", i32), ("emr_text", s),
+            ("model_thinks", pa.list_(think)), ("total_cot_tokens", i32), ("has_cot_for_all", pa.bool_()),
+        ]
+    elif dataset == "labeling_records":
+        fields = [
+            ("sample_id", s), ("project_id", s), ("title", s), ("raw_text", s),
+            ("labels", pa.list_(s)), ("cot_text", s),
+        ]
+    elif dataset == "annotations":
+        fields = [
+            ("project_id", s), ("sample_id", s), ("annotator", s), ("label", s), ("cot_text", s),
+            ("source", s), ("lease_id", s), ("created_at", minute),
+        ]
+    elif dataset == "qc_issues":
+        fields = [
+            ("id", s), ("sampleId", s), ("projectId", s), ("issueType", s), ("ruleName", s),
+            ("severity", s), ("status", s), ("createdAt", minute), ("createdAt_raw", s),
+            ("detail", s), ("lastReviewer", s),
+        ]
+    elif dataset == "kg_nodes":
+        fields = [("id", s), ("label", s), ("type", s), ("count", i64)]
+    elif dataset == "kg_edges":
+        fields = [
+            ("id", s), ("source", s), ("target", s), ("type", s), ("weight", i64),
+            ("pmi", f64), ("lift", f64),
+        ]
+    else:
+        raise ValueError(f"unknown dataset: {dataset}")
+    return pa.schema(fields)
+
+
+# ---------------- 行转换：字符串日期 / 时间转成真正的类型 ----------------
+
+def _date(v: Any) -> Optional[dt.date]:
+    try:
+        return dt.date.fromisoformat(v) if v else None
+    except ValueError:
+        return None
+
+
+def _minute(v: Any) -> Optional[dt.datetime]:
+    try:
+        return dt.datetime.strptime(v, "%Y-%m-%d %H:%M") if v else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _medthink_rows(project_id: str) -> Iterator[Dict[str, Any]]:
+    for sample in medthink_service.iter_samples(project_id):
+        sample["visit_date"] = _date(sample.get("visit_date"))
+        yield sample
+
+
+def _jsonl_rows(path: Path, time_field: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    time_field 转成分钟精度的时间；原字符串另存在 <time_field>_raw（schema 里有这一列时导出）。
+    人工录入的 QC 问题里有“今天 09:21”这种解析不了的值，只转类型会变成 null 丢掉信息。
+    """
+    if not path.exists():
+        return
+    for row in iter_jsonl(path):
+        if time_field:
+            raw = row.get(time_field)
+            row[f"{time_field}_raw"] = raw if raw is None else str(raw)
+            row[time_field] = _minute(raw)
+        yield row
+
+
+def _stat(path: Path) -> Optional[List[int]]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _source(project_id: str, dataset: str, get_kg: Callable[[], Dict[str, Any]]) -> Any:
+    """源数据签名：变了才重新导出。"""
+    if dataset == "medthink_samples":
+        return [[p.name, *_stat(p)] for p in medthink_service.list_shards(project_id)]
+    if dataset == "labeling_records":
+        return _stat(get_labeling_dataset_path(project_id))
+    if dataset == "annotations":
+        return _stat(labeling_service.get_annotations_path(project_id))
+    if dataset == "qc_issues":
+        return _stat(qc_service.get_qc_issues_path(project_id))
+    return get_kg()["version"]
+
+
+def _rows(project_id: str, dataset: str, get_kg: Callable[[], Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+    if dataset == "medthink_samples":
+        return _medthink_rows(project_id)
+    if dataset == "labeling_records":
+        return _jsonl_rows(get_labeling_dataset_path(project_id))
+    if dataset == "annotations":
+        return _jsonl_rows(labeling_service.get_annotations_path(project_id), "created_at")
+    if dataset == "qc_issues":
+        # 只导出当前项目的（和 /qc/issues 接口一致）
+        rows = _jsonl_rows(qc_service.get_qc_issues_path(project_id), "createdAt")
+        return (r for r in rows if r.get("projectId") == project_id)
+    kg = get_kg()
+    return kg["nodes"].values() if dataset == "kg_nodes" else kg["edges"]
+
+
+# ---------------- 写文件 ----------------
+
+def write_table(
+    path: Path,
+    schema: "pa.Schema",
+    rows: Iterable[Dict[str, Any]],
+    fmt: str = "parquet",
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> Dict[str, int]:
+    """
+    按批把 rows 写成 Parquet（每批一个 row group）或 Arrow IPC 文件（每批一个 record batch）。
+    schema 里没有的字段直接丢掉，缺的字段写 null。返回 {rows, row_groups, bytes}。
+    """
+    pa, pq = _require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    os.close(fd)
+
+    n_rows = 0
+    n_groups = 0
+    try:
+        if fmt == "parquet":
+            compression = "zstd" if pa.Codec.is_available("zstd") else "snappy"
+            writer = pq.ParquetWriter(tmp_name, schema, compression=compression)
+            sink = None
+        else:
+            sink = pa.OSFile(tmp_name, "wb")
+            writer = pa.ipc.new_file(sink, schema)
+        try:
+            batch: List[Dict[str, Any]] = []
+
+            def flush() -> None:
+                nonlocal n_groups
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                n_groups += 1
+                batch.clear()
+
+            for row in rows:
+                batch.append(row)
+                n_rows += 1
+                if len(batch) >= row_group_size:
+                    flush()
+            if batch or n_groups == 0:
+                flush()  # 空表也写一个空批次，保证 schema 完整可读
+        finally:
+            writer.close()
+            if sink is not None:
+                sink.close()
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+    return {"rows": n_rows, "row_groups": n_groups, "bytes": path.stat().st_size}
+
+
+# ---------------- 对外接口 ----------------
+
+def get_export_dir(project_id: str) -> Path:
+    return get_project_dir(project_id) / "exports"
+
+
+def get_export_path(project_id: str, dataset: str, fmt: str) -> Path:
+    return get_export_dir(project_id) / f"{dataset}{FORMATS[fmt]}"
+
+
+def _manifest_path(project_id: str) -> Path:
+    return get_export_dir(project_id) / "manifest.json"
+
+
+def read_manifest(project_id: str) -> Dict[str, Any]:
+    path = _manifest_path(project_id)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _lock(project_id: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(project_id, threading.Lock())
+
+
+def export_dataset(
+    project_id: str,
+    dataset: str,
+    fmt: str,
+    get_kg: Callable[[], Dict[str, Any]],
+    force: bool = False,
+) -> Dict[str, Any]:
+    """导出一个数据集（源数据没变且文件还在时直接复用），返回清单条目。"""
+    _require_pyarrow()
+    if dataset not in DATASETS:
+        raise ValueError(f"unknown dataset: {dataset}")
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt}")
+
+    path = get_export_path(project_id, dataset, fmt)
+    key = path.name
+    # 同一项目的导出串行：并发下载同一个表只导出一次，清单读改写也不会互相覆盖
+    with _lock(project_id):
+        source = _source(project_id, dataset, get_kg)
+        manifest = read_manifest(project_id)
+        entry = manifest.get(key)
+        if (
+            not force
+            and entry
+            and entry.get("source") == source
+            and entry.get("schema_version") == SCHEMA_VERSION
+            and path.exists()
+        ):
+            return dict(entry, cached=True)
+
+        t0 = time.perf_counter()
+        stats = write_table(path, _schema(dataset), _rows(project_id, dataset, get_kg), fmt)
+        entry = {
+            "dataset": dataset,
+            "format": fmt,
+            "file": key,
+            **stats,
+            "source": source,
+            "schema_version": SCHEMA_VERSION,
+            "seconds": round(time.perf_counter() - t0, 4),
+            "exported_at": now_str(),
+        }
+        manifest[key] = entry
+        atomic_write_json(_manifest_path(project_id), manifest)
+    return dict(entry, cached=False)
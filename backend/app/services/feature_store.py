@@ -0,0 +1,207 @@
+"""
+样本特征库：每条 med_think 样本的抽取结果按 sample_id + 内容哈希持久化，按原始分片分文件存放：
+
+    projects/<pid>/features/shards/<分片名>.features.jsonl   每行一个样本的特征
+    projects/<pid>/features/manifest.json                   分片清单：每个分片的大小 / mtime /
+                                                            条数 / 坏行数 / 抽取器版本
+
+样本文本不变就不会重新跑正则。build_kg / QC 规则 / 样本检索直接读特征。
+分片大小、mtime 和抽取器版本都没变时整片跳过（见 stale_shards）；
+分片变了时，片内内容哈希没变的样本也沿用旧特征。
+
+抽取器分组各自带版本号（EXTRACTOR_VERSIONS）。改了某个分组的抽取逻辑只需把它的版本 +1，
+下次入库时只重算这一组（以及依赖它的组），其他组沿用。
+"""
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.services.storage_service import get_project_dir
+from app.utils.file_utils import atomic_write_json, atomic_write_jsonl, iter_jsonl
+from app.utils.text_utils import SYMPTOM_SECTIONS, extract_section, extract_symptoms, norm_text
+from app.utils.time_utils import now_str
+
+EXTRACTOR_VERSIONS: Dict[str, int] = {
+    "sections": 1,
+    "symptoms": 1,
+    "diagnoses": 1,
+    "ids": 1,
+}
+# 分组依赖：sections 重算时 symptoms 也必须重算
+_GROUP_DEPS: Dict[str, List[str]] = {"symptoms": ["sections"]}
+
+_lock = threading.Lock()
+# project_id -> (manifest.json 的 mtime_ns, {sample_id: features})
+_cache: Dict[str, Any] = {}
+_project_locks: Dict[str, threading.RLock] = {}
+
+
+def project_lock(project_id: str) -> threading.RLock:
+    """同一项目的入库串行执行（可重入：持锁期间还会再调 commit_manifest）。"""
+    with _lock:
+        return _project_locks.setdefault(project_id, threading.RLock())
+
+
+def get_features_dir(project_id: str) -> Path:
+    return get_project_dir(project_id) / "features"
+
+
+def get_manifest_path(project_id: str) -> Path:
+    return get_features_dir(project_id) / "manifest.json"
+
+
+def get_shard_features_path(project_id: str, shard_name: str) -> Path:
+    return get_features_dir(project_id) / "shards" / f"{shard_name}.features.jsonl"
+
+
+def sample_hash(sample: Dict[str, Any]) -> str:
+    data = json.dumps(
+        [sample.get("emr_text") or "", sample.get("diagnosis_list") or [], sample.get("patient_id"), sample.get("visit_date")],
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def _compute(sample: Dict[str, Any], groups: Set[str], feat: Dict[str, Any]) -> None:
+    if "sections" in groups:
+        emr = sample.get("emr_text") or ""
+        feat["sections"] = {k: extract_section(emr, k) for k in SYMPTOM_SECTIONS}
+    if "symptoms" in groups:
+        sections = feat.get("sections") or {}
+        symptom_text = "\n".join(sections.get(k, "") for k in SYMPTOM_SECTIONS).strip()
+        feat["symptoms"] = extract_symptoms(symptom_text)
+    if "diagnoses" in groups:
+        feat["diagnoses"] = [norm_text(d) for d in (sample.get("diagnosis_list") or []) if norm_text(d)]
+    if "ids" in groups:
+        # patient_id / visit_date 在解析原始记录时已经抽过，直接拿
+        feat["patient_id"] = sample.get("patient_id")
+        feat["visit_date"] = sample.get("visit_date")
+    versions = feat.setdefault("versions", {})
+    for g in groups:
+        versions[g] = EXTRACTOR_VERSIONS[g]
+
+
+def _stale_groups(feat: Dict[str, Any]) -> Set[str]:
+    versions = feat.get("versions") or {}
+    stale = {g for g, v in EXTRACTOR_VERSIONS.items() if versions.get(g) != v}
+    for g, deps in _GROUP_DEPS.items():
+        if stale.intersection(deps):
+            stale.add(g)
+    return stale
+
+
+def read_manifest(project_id: str) -> Dict[str, Any]:
+    path = get_manifest_path(project_id)
+    if not path.exists():
+        return {"shards": {}}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {"shards": {}}
+
+
+def _shard_unchanged(entry: Optional[Dict[str, Any]], path: Path) -> bool:
+    if not entry or entry.get("versions") != EXTRACTOR_VERSIONS:
+        return False
+    st = path.stat()
+    return entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+
+
+def stale_shards(project_id: str, shards: List[Path]) -> Tuple[List[Path], List[str]]:
+    """返回 (需要重新入库的分片, 清单里有但 raw/ 里已经没有的分片名)。"""
+    known = read_manifest(project_id).get("shards") or {}
+    stale = [p for p in shards if not _shard_unchanged(known.get(p.name), p)]
+    names = {p.name for p in shards}
+    removed = sorted(n for n in known if n not in names)
+    return stale, removed
+
+
+def is_fresh(project_id: str, shards: List[Path]) -> bool:
+    """特征库是否对应当前所有分片、且抽取器版本都是最新的。"""
+    stale, removed = stale_shards(project_id, shards)
+    return not stale and not removed
+
+
+def load_features(project_id: str) -> Dict[str, Dict[str, Any]]:
+    """按清单顺序读各分片的特征（按清单 mtime 做进程内缓存）。没有入过库时返回空 dict。"""
+    path = get_manifest_path(project_id)
+    if not path.exists():
+        return {}
+    mtime = path.stat().st_mtime_ns
+    with _lock:
+        hit = _cache.get(project_id)
+        if hit and hit[0] == mtime:
+            return hit[1]
+    feats: Dict[str, Dict[str, Any]] = {}
+    for name in sorted(read_manifest(project_id).get("shards") or {}):
+        shard_path = get_shard_features_path(project_id, name)
+        if shard_path.exists():
+            for f in iter_jsonl(shard_path):
+                feats[f["sample_id"]] = f
+    with _lock:
+        _cache[project_id] = (mtime, feats)
+    return feats
+
+
+def write_shard_features(
+    project_id: str,
+    shard: Path,
+    samples: List[Dict[str, Any]],
+    bad_lines: int = 0,
+) -> Dict[str, Any]:
+    """
+    为一个分片写特征文件（可在子进程里调用），返回它的清单条目；清单本身由 commit_manifest 统一写。
+    新样本 / 内容变了的样本全量抽取，只是抽取器版本变了的样本只重算过期的分组。
+    """
+    out_path = get_shard_features_path(project_id, shard.name)
+    old = {f["sample_id"]: f for f in iter_jsonl(out_path)} if out_path.exists() else {}
+    st = shard.stat()
+
+    out: List[Dict[str, Any]] = []
+    stats = {"computed": 0, "refreshed": 0, "reused": 0}
+    all_groups = set(EXTRACTOR_VERSIONS)
+    for s in samples:
+        sid = str(s["sample_id"])
+        h = sample_hash(s)
+        prev = old.get(sid)
+        if prev is None or prev.get("hash") != h:
+            feat: Dict[str, Any] = {"sample_id": sid, "hash": h}
+            _compute(s, all_groups, feat)
+            stats["computed"] += 1
+        else:
+            feat = prev
+            stale = _stale_groups(feat)
+            if stale:
+                _compute(s, stale, feat)
+                stats["refreshed"] += 1
+            else:
+                stats["reused"] += 1
+        out.append(feat)
+
+    atomic_write_jsonl(out_path, out)
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "count": len(out),
+        "bad_lines": bad_lines,
+        "versions": EXTRACTOR_VERSIONS,
+        "stats": stats,
+        "ingested_at": now_str(),
+    }
+
+
+def commit_manifest(project_id: str, entries: Dict[str, Dict[str, Any]], removed: List[str]) -> None:
+    """把新入库的分片写进清单，移除已删除分片的特征文件。"""
+    with project_lock(project_id):
+        manifest = read_manifest(project_id)
+        shards = manifest.setdefault("shards", {})
+        shards.update(entries)
+        for name in removed:
+            shards.pop(name, None)
+            get_shard_features_path(project_id, name).unlink(missing_ok=True)
+        manifest["count"] = sum(int(e.get("count") or 0) for e in shards.values())
+        atomic_write_json(get_manifest_path(project_id), manifest)
+    with _lock:
+        _cache.pop(project_id, None)
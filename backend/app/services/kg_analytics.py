@@ -0,0 +1,302 @@
+"""
+知识图谱上的矩阵计算（numpy / scipy.sparse），供 build_kg 和诊断接口调用：
+  - cooccurrence：疾病共现（合并症）统计
+  - PropagationIndex：个性化 PageRank 诊断 + 信息增益选下一个症状
+numpy / scipy 导入要几十到上百毫秒，在用到的函数里才导入，import main 时不拉起它们。
+"""
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+    from scipy import sparse
+
+
+def incidence_matrix(sample_items: List[List[int]], n_items: int) -> "sparse.csr_matrix":
+    """样本 × 条目 的 0/1 关联矩阵（直接拼 CSR，不走 Python 双层循环）。"""
+    import numpy as np
+    from scipy import sparse
+
+    lengths = np.fromiter((len(x) for x in sample_items), dtype=np.int64, count=len(sample_items))
+    indptr = np.zeros(len(sample_items) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    indices = np.fromiter((i for x in sample_items for i in x), dtype=np.int32, count=int(indptr[-1]))
+    data = np.ones(indices.size, dtype=np.int32)
+    m = sparse.csr_matrix((data, indices, indptr), shape=(len(sample_items), n_items))
+    m.sum_duplicates()
+    m.data[:] = 1  # 同一样本里重复出现的诊断只算一次
+    return m
+
+
+def cooccurrence(
+    sample_items: List[List[int]],
+    n_items: int,
+    min_count: int = 3,
+) -> Dict[str, "np.ndarray"]:
+    """
+    共现统计：C = Xᵀ X（X 为样本 × 疾病关联矩阵），只取上三角 i < j 且 count >= min_count。
+    返回 {"row", "col", "count", "pmi", "lift"} 五个等长数组。
+        lift = c_ij * N / (c_i * c_j)，pmi = ln(lift)
+    """
+    import numpy as np
+
+    x = incidence_matrix(sample_items, n_items)
+    n = x.shape[0]
+    c = (x.T @ x).tocoo()
+    item_counts = np.asarray(x.sum(axis=0)).ravel().astype(np.float64)
+
+    mask = (c.row < c.col) & (c.data >= min_count)
+    row = c.row[mask]
+    col = c.col[mask]
+    cnt = c.data[mask].astype(np.int64)
+    if cnt.size == 0 or n == 0:
+        empty_f = np.zeros(0, dtype=np.float64)
+        return {"row": row, "col": col, "count": cnt, "pmi": empty_f, "lift": empty_f}
+
+    lift = cnt * float(n) / (item_counts[row] * item_counts[col])
+    pmi = np.log(lift)
+    order = np.lexsort((col, row))
+    return {"row": row[order], "col": col[order], "count": cnt[order], "pmi": pmi[order], "lift": lift[order]}
+
+
+def cooccurrence_pairs(
+    sample_items: List[List[int]],
+    n_items: int,
+    min_count: int = 3,
+) -> List[Tuple[int, int, int, float, float]]:
+    """cooccurrence 的行式版本：[(i, j, count, pmi, lift), ...]。"""
+    co = cooccurrence(sample_items, n_items, min_count)
+    return list(
+        zip(
+            co["row"].tolist(),
+            co["col"].tolist(),
+            co["count"].tolist(),
+            co["pmi"].tolist(),
+            co["lift"].tolist(),
+        )
+    )
+
+
+# ====================== 图传播诊断 / 下一个该问的症状 ======================
+
+# 传播时各类边的权重系数（共现边只做辅助，打个折）
+DEFAULT_EDGE_WEIGHTS: Dict[str, float] = {"HAS_SYMPTOM": 1.0, "CO_OCCURS_WITH": 0.5}
+
+_EPS = 1e-6
+
+
+def _entropy(p: "np.ndarray", axis: int = 0) -> "np.ndarray":
+    """以 2 为底的熵，p 沿 axis 已归一化；0 log 0 记为 0。"""
+    import numpy as np
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(p > 0, p * np.log2(p), 0.0)
+    return -t.sum(axis=axis)
+
+
+class PropagationIndex:
+    """
+    针对一份 build_kg 结果预先算好的矩阵，每次请求只做稀疏矩阵乘：
+      - transition：列归一化的加权转移矩阵 P（P[j, i] = i 走到 j 的概率）
+      - likelihood：疾病 × 症状 的 P(症状 | 疾病) = 边权 / 疾病样本数
+    """
+
+    def __init__(self, kg: Dict[str, Any], edge_weights: Optional[Dict[str, float]] = None):
+        import numpy as np
+        from scipy import sparse
+
+        weights = {**DEFAULT_EDGE_WEIGHTS, **(edge_weights or {})}
+        nodes = kg["nodes"]
+        self.node_ids: List[str] = list(nodes)
+        self.index: Dict[str, int] = {nid: i for i, nid in enumerate(self.node_ids)}
+        n = len(self.node_ids)
+
+        is_disease = np.fromiter((nodes[nid].get("type") == "disease" for nid in self.node_ids), dtype=bool, count=n)
+        self.disease_idx = np.flatnonzero(is_disease)
+        self.symptom_idx = np.flatnonzero(~is_disease)
+        # 节点下标 -> 疾病行号 / 症状列号（不是该类型为 -1）
+        self.disease_row = np.full(n, -1, dtype=np.int64)
+        self.disease_row[self.disease_idx] = np.arange(self.disease_idx.size)
+        self.symptom_col = np.full(n, -1, dtype=np.int64)
+        self.symptom_col[self.symptom_idx] = np.arange(self.symptom_idx.size)
+        counts = np.fromiter((float(nodes[nid].get("count") or 0) for nid in self.node_ids), dtype=np.float64, count=n)
+
+        src: List[int] = []
+        dst: List[int] = []
+        w: List[float] = []
+        lik_row: List[int] = []
+        lik_col: List[int] = []
+        lik_val: List[float] = []
+        for e in kg["edges"]:
+            i = self.index.get(e["source"])
+            j = self.index.get(e["target"])
+            if i is None or j is None:
+                continue
+            ew = float(e.get("weight") or 0)
+            f = weights.get(e["type"], 0.0)
+            if f > 0 and ew > 0:
+                src += (i, j)
+                dst += (j, i)
+                w += (f * ew, f * ew)
+            # 同名节点只保留一种类型（见 build_kg），类型对不上的边不进似然矩阵
+            if e["type"] == "HAS_SYMPTOM" and counts[i] > 0 and is_disease[i] and not is_disease[j]:
+                lik_row.append(int(self.disease_row[i]))
+                lik_col.append(int(self.symptom_col[j]))
+                lik_val.append(min(1.0, ew / counts[i]))
+
+        a = sparse.csr_matrix((np.asarray(w, dtype=np.float64), (dst, src)), shape=(n, n))
+        out_deg = np.asarray(a.sum(axis=0)).ravel()
+        inv = np.divide(1.0, out_deg, out=np.zeros_like(out_deg), where=out_deg > 0)
+        self.transition = (a @ sparse.diags(inv)).tocsr()
+        self.dangling = np.flatnonzero(out_deg == 0)
+        self.likelihood = sparse.csr_matrix(
+            (np.asarray(lik_val, dtype=np.float64), (lik_row, lik_col)),
+            shape=(self.disease_idx.size, self.symptom_idx.size),
+        )
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    def personalized_pagerank(
+        self,
+        seeds: List[int],
+        alpha: float = 0.15,
+        tol: float = 1e-4,
+        max_iter: int = 100,
+    ) -> Tuple["np.ndarray", int]:
+        """
+        以 seeds 为重启点的随机游走：r = α s + (1-α) P r，幂迭代到 L1 变化 < tol。
+        没有出边的节点把概率还给种子，保证 r 始终是分布。返回 (r, 迭代次数)。
+        tol=1e-4 时前几十名的排序已经和收敛到 1e-8 的结果一致，迭代次数少三成左右。
+        """
+        import numpy as np
+
+        n = self.n_nodes
+        s = np.zeros(n, dtype=np.float64)
+        if not seeds:
+            return s, 0
+        s[seeds] = 1.0 / len(seeds)
+        r = s.copy()
+        it = 0
+        diff = np.empty_like(r)
+        for it in range(1, max_iter + 1):
+            leaked = r[self.dangling].sum()
+            r_next = self.transition @ r
+            r_next *= 1.0 - alpha
+            r_next += (alpha + (1.0 - alpha) * leaked) * s
+            np.subtract(r_next, r, out=diff)
+            r = r_next
+            if np.abs(diff, out=diff).sum() < tol:
+                break
+        return r, it
+
+    def information_gain(
+        self,
+        disease_rows: "np.ndarray",
+        prior: "np.ndarray",
+        exclude_cols: Optional["np.ndarray"] = None,
+    ) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        """
+        对候选疾病（disease_rows, 先验 prior）逐个症状算“问了是否有”之后的期望信息增益：
+            IG(s) = H(D) - [P(有) H(D | 有) + P(无) H(D | 无)]
+        只看在候选疾病里出现过的症状。返回 (症状列号, IG, P(有))。
+        """
+        import numpy as np
+
+        sub = self.likelihood[disease_rows]
+        cols = np.unique(sub.indices)
+        if exclude_cols is not None and exclude_cols.size:
+            cols = np.setdiff1d(cols, exclude_cols, assume_unique=False)
+        if cols.size == 0:
+            empty = np.zeros(0, dtype=np.float64)
+            return cols, empty, empty
+
+        p = prior / prior.sum()
+        lik = np.clip(sub[:, cols].toarray(), _EPS, 1.0 - _EPS)  # K × S
+        joint_yes = p[:, None] * lik
+        joint_no = p[:, None] * (1.0 - lik)
+        p_yes = joint_yes.sum(axis=0)
+        p_no = 1.0 - p_yes
+        h_yes = _entropy(joint_yes / p_yes, axis=0)
+        h_no = _entropy(joint_no / p_no, axis=0)
+        ig = _entropy(p) - (p_yes * h_yes + p_no * h_no)
+        return cols, ig, p_yes
+
+    def triage(
+        self,
+        present: List[str],
+        absent: Optional[List[str]] = None,
+        alpha: float = 0.15,
+        top_k: int = 15,
+        n_candidates: int = 30,
+        n_suggest: int = 5,
+    ) -> Dict[str, Any]:
+        """
+        present：已确认有的症状节点 id（作为游走种子）；absent：已确认没有的症状。
+        1) 个性化 PageRank 得到疾病得分，取前 n_candidates 个作为候选；
+        2) 候选的后验 ∝ 得分 × Π(1 - P(否认症状 | 疾病))；
+        3) 对没问过的症状算信息增益，给出最值得问的 n_suggest 个。
+        """
+        import numpy as np
+
+        seeds = [self.index[s] for s in present if s in self.index]
+        r, iters = self.personalized_pagerank(seeds, alpha=alpha)
+        scores = r[self.disease_idx]
+
+        k = min(max(n_candidates, top_k), int(np.count_nonzero(scores)))
+        if k == 0:
+            return {"items": [], "suggestions": [], "iterations": iters}
+        rows = np.argpartition(-scores, k - 1)[:k]
+        prior = scores[rows].copy()
+
+        absent_cols = np.array(
+            [self.symptom_col[self.index[s]] for s in (absent or []) if s in self.index and self.symptom_col[self.index[s]] >= 0],
+            dtype=np.int64,
+        )
+        present_cols = np.array([self.symptom_col[i] for i in seeds if self.symptom_col[i] >= 0], dtype=np.int64)
+        if absent_cols.size:
+            miss = np.clip(self.likelihood[rows][:, absent_cols].toarray(), 0.0, 1.0 - _EPS)
+            prior *= np.prod(1.0 - miss, axis=1)
+        posterior = prior / prior.sum()
+
+        order = np.lexsort((rows, -posterior))
+        rows = rows[order]
+        posterior = posterior[order]
+        ppr = scores[rows]
+
+        present_lik = self.likelihood[rows][:, present_cols].toarray() if present_cols.size else None
+        items = []
+        for rank in range(min(top_k, rows.size)):
+            hits = []
+            if present_lik is not None:
+                for c, val in zip(present_cols.tolist(), present_lik[rank].tolist()):
+                    if val > 0:
+                        hits.append({"symptom": self.node_ids[self.symptom_idx[c]], "likelihood": round(val, 4)})
+                hits.sort(key=lambda x: -x["likelihood"])
+            items.append(
+                {
+                    "disease": self.node_ids[self.disease_idx[rows[rank]]],
+                    "score": float(ppr[rank]),
+                    "posterior": round(float(posterior[rank]), 6),
+                    "hits": hits,
+                }
+            )
+
+        asked = np.concatenate([present_cols, absent_cols])
+        cols, ig, p_yes = self.information_gain(rows, posterior, exclude_cols=asked)
+        best = np.lexsort((cols, -ig))[:n_suggest]
+        suggestions = [
+            {
+                "symptom": self.node_ids[self.symptom_idx[cols[b]]],
+                "information_gain": round(float(ig[b]), 6),
+                "p_present": round(float(p_yes[b]), 6),
+            }
+            for b in best
+            if ig[b] > 0
+        ]
+        return {
+            "items": items,
+            "suggestions": suggestions,
+            "iterations": iters,
+            "entropy": round(float(_entropy(posterior)), 6),
+        }
@@ -0,0 +1,165 @@
+"""
+图谱的服务端布局：numpy 向量化的 stress majorization（SMACOF），返回每个节点的 x / y，
+前端直接用 cytoscape 的 preset 布局，不用在浏览器里跑力导向。
+
+    1) 子图上 BFS 求跳数距离 d_ij（不连通的部分按 最大跳数 + 1 处理）；
+    2) 经典 MDS 给出确定性的初始坐标（同一张图每次结果一样）；
+    3) 权重 w_ij = d_ij^-2 的 Guttman 迭代：X <- L_w^+ B(X) X，直到 stress 相对变化 < tol。
+
+布局按 (项目, KG 版本, center, depth, max_nodes, 边类型) 缓存在进程内（LRU），
+KG 重建后版本号变了，旧布局自然不再命中。numpy / scipy 在用到的函数里才导入，import main 时不拉起它们。
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from app.core import metrics
+
+if TYPE_CHECKING:
+    import numpy as np
+
+LAYOUT_CACHE_SIZE = int(os.getenv("KG_LAYOUT_CACHE_SIZE") or 256)
+# 一跳对应的像素距离
+EDGE_LENGTH = 80.0
+
+Positions = Dict[str, Tuple[float, float]]
+
+
+def _hop_distances(n: int, src: "np.ndarray", dst: "np.ndarray") -> "np.ndarray":
+    import numpy as np
+    from scipy import sparse
+    from scipy.sparse.csgraph import shortest_path
+
+    adj = sparse.csr_matrix((np.ones(src.size), (src, dst)), shape=(n, n))
+    d = shortest_path(adj, directed=False, unweighted=True)
+    finite = np.isfinite(d)
+    far = d[finite].max() + 1.0 if finite.any() else 1.0
+    d[~finite] = far
+    return d
+
+
+def _classical_mds(d: "np.ndarray", seed: int) -> "np.ndarray":
+    import numpy as np
+
+    n = d.shape[0]
+    j = np.eye(n) - 1.0 / n
+    b = -0.5 * j @ (d ** 2) @ j
+    vals, vecs = np.linalg.eigh(b)
+    top = np.argsort(vals)[::-1][:2]
+    x = vecs[:, top] * np.sqrt(np.clip(vals[top], 0.0, None))
+    # 特征向量符号不确定，固定成“绝对值最大的分量为正”
+    flip = np.sign(x[np.abs(x).argmax(axis=0), [0, 1]])
+    x *= np.where(flip == 0, 1.0, flip)
+    # 退化（比如星形图）时加一点固定种子的扰动，避免点重合
+    rng = np.random.default_rng(seed)
+    return x + rng.normal(scale=1e-3, size=x.shape)
+
+
+def stress_layout(
+    n: int,
+    src: Sequence[int],
+    dst: Sequence[int],
+    iterations: int = 300,
+    tol: float = 1e-3,
+    seed: int = 0,
+) -> "np.ndarray":
+    """n 个节点、无向边 (src[k], dst[k]) 的二维布局，返回 (n, 2) 坐标（单位：跳）。"""
+    import numpy as np
+
+    if n == 0:
+        return np.zeros((0, 2))
+    if n == 1:
+        return np.zeros((1, 2))
+
+    d = _hop_distances(n, np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64))
+    diag = np.diag_indices(n)
+    with np.errstate(divide="ignore"):
+        w = d ** -2.0
+    w[diag] = 0.0
+    wd = w * d
+    lw = np.diag(w.sum(axis=1)) - w
+    lw_pinv = np.linalg.pinv(lw)
+
+    x = _classical_mds(d, seed)
+    prev_stress = np.inf
+    for _ in range(iterations):
+        # 欧氏距离用 |a|^2 + |b|^2 - 2ab 算，比显式做 n×n×2 的差值快
+        sq = (x * x).sum(axis=1)
+        dist2 = sq[:, None] + sq[None, :] - 2.0 * (x @ x.T)
+        np.maximum(dist2, 1e-12, out=dist2)
+        dist = np.sqrt(dist2)
+        dist[diag] = np.inf
+        b = -wd / dist
+        b[diag] = -b.sum(axis=1)
+        x = lw_pinv @ (b @ x)
+
+        dist[diag] = 0.0
+        stress = float((w * (dist - d) ** 2).sum())
+        if prev_stress - stress < tol * prev_stress:
+            break
+        prev_stress = stress
+    return x - x.mean(axis=0)
+
+
+def layout_positions(node_ids: List[str], edges: List[Dict[str, Any]], seed: int = 0) -> Positions:
+    """按节点 id 返回像素坐标（原点居中，一跳约 EDGE_LENGTH 像素）。"""
+    import numpy as np
+
+    index = {nid: i for i, nid in enumerate(node_ids)}
+    src: List[int] = []
+    dst: List[int] = []
+    for e in edges:
+        i = index.get(e["source"])
+        j = index.get(e["target"])
+        if i is not None and j is not None and i != j:
+            src.append(i)
+            dst.append(j)
+    xy = stress_layout(len(node_ids), src, dst, seed=seed) * EDGE_LENGTH
+    xy = np.round(xy, 1) + 0.0  # + 0.0 去掉 -0.0
+    return {nid: (float(xy[i, 0]), float(xy[i, 1])) for nid, i in index.items()}
+
+
+class LayoutCache:
+    """线程安全的 LRU：key -> {node_id: (x, y)}。"""
+
+    def __init__(self, maxsize: int = LAYOUT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Positions]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Positions]:
+        with self._lock:
+            pos = self._data.get(key)
+            if pos is not None:
+                self._data.move_to_end(key)
+        metrics.record_cache("kg_layout", pos is not None)
+        return pos
+
+    def put(self, key: Hashable, positions: Positions) -> None:
+        with self._lock:
+            self._data[key] = positions
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_cache = LayoutCache()
+
+
+def get_layout(key: Hashable, node_ids: List[str], edges: List[Dict[str, Any]]) -> Tuple[Positions, bool]:
+    """
+    取缓存的布局，没有就现算并放进缓存。返回 (坐标, 是否命中缓存)。
+    节点按 id 排序后再算，保证同一个子图不管节点顺序如何结果都一样。
+    缓存的坐标没覆盖全部 node_ids（键相同但子图变了）时当作未命中，重新计算。
+    """
+    pos = _cache.get(key)
+    if pos is not None and all(nid in pos for nid in node_ids):
+        return pos, True
+    with metrics.timer("kg_layout"):
+        pos = layout_positions(sorted(node_ids), edges)
+    _cache.put(key, pos)
+    return pos, False
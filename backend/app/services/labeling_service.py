@@ -1,44 +1,292 @@
-from pathlib import Path
+"""
+标注任务分发：每个项目一个内存队列，标注员“领一条、标一条”，不再靠翻页挑样本互相撞车。
+
+    - 领取（claim）：同一个样本要 k 个不同标注员各标一次（replicas=k，用于一致性评估），
+      同一标注员不会领到自己标过 / 正在标的样本。样本按固定顺序排成一列，
+      每个标注员有自己的游标，只往前走：自己领过的、名额满的样本走过一次就不再看，
+      所以每个标注员在整个队列上的扫描总量是 O(样本数)，单次领取摊还 O(1)；
+      全部完成的前缀用公共的 head 跳过，新来的标注员不用从头扫。
+    - 租约（lease）：领取后在 lease_seconds 内有效，heartbeat 续期；
+      过期 / 主动释放的名额进退回队列，下次领取时优先再分发
+      （游标已经走过这个样本的标注员也能领到）。
+    - 完成（complete）：租约有效才能提交，标注追加写入 labeling/annotations.jsonl；
+      写失败时撤销内存里的完成标记并恢复租约，可以重试提交，不会丢名额。
+
+每个项目的队列各自一把锁，锁内只做 O(1) 的 deque / dict / heap 操作，不同项目互不影响。
+进程重启后按 annotations.jsonl 重建队列（已完成的名额不再分发），未完成的租约自然失效。
+"""
+import heapq
 import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
-def load_labeling_records(project_id: str) -> list[dict]:
-    path = get_labeling_dataset_path(project_id)  # -> backend/data/projects/p1/labeling/labeling_inputs.jsonl
-    records = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            records.append(json.loads(line))
-    return records
-
-def list_samples(project_id: str, limit=20, offset=0):
-    records = load_labeling_records(project_id)
-    page = records[offset: offset + limit]
-    return {
-        "items": [
-            {
-                "sample_id": r["sample_id"],
-                "title": r["title"],
-                "text_preview": r["raw_text"][:80] + "...",
-                "has_cot": bool(r.get("cot_text")),
-                "suggested_label": r["labels"][0] if r["labels"] else "",
-                "labels": r["labels"]
-            }
-            for r in page
-        ],
-        "total": len(records),
-    }
-
-def get_sample_detail(project_id: str, sample_id: str):
-    records = load_labeling_records(project_id)
-    for r in records:
-        if r["sample_id"] == sample_id:
+from app.models.annotation import Annotation
+from app.models.annotation_task import AnnotationTask, Lease
+from app.services.storage_service import get_project_dir
+from app.utils.file_utils import iter_jsonl
+from app.utils.time_utils import now_str
+
+DEFAULT_LEASE_SECONDS = float(os.getenv("LABELING_LEASE_SECONDS") or 600)
+DEFAULT_REPLICAS = int(os.getenv("LABELING_REPLICAS") or 1)
+
+
+class LeaseOwnerError(PermissionError):
+    pass
+
+
+class LeaseExpiredError(RuntimeError):
+    """租约已过期被回收、已提交 / 释放，或者根本不存在。"""
+
+
+def get_annotations_path(project_id: str):
+    return get_project_dir(project_id) / "labeling" / "annotations.jsonl"
+
+
+def load_annotations(project_id: str) -> List[Annotation]:
+    path = get_annotations_path(project_id)
+    if not path.exists():
+        return []
+    return [Annotation.from_dict(d) for d in iter_jsonl(path)]
+
+
+class TaskQueue:
+    def __init__(
+        self,
+        project_id: str,
+        sample_ids: List[str],
+        replicas: int = DEFAULT_REPLICAS,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.project_id = project_id
+        self.replicas = max(1, int(replicas))
+        self.lease_seconds = float(lease_seconds)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+        self.tasks: Dict[str, AnnotationTask] = {}
+        self._order: List[str] = []  # 分发顺序
+        self._head = 0  # _order[:_head] 全部完成
+        self._cursors: Dict[str, int] = {}  # 标注员 -> 下一个要看的 _order 下标
+        self._returned: Deque[str] = deque()  # 过期 / 释放退回的名额（sample_id），可能有失效条目
+        self._open = 0  # 可分发的名额数
+        self._leases: Dict[str, Lease] = {}
+        self._expiry: List[Tuple[float, str]] = []  # (expires_at, lease_id)，续期后旧条目惰性丢弃
+
+        done: Dict[str, set] = {}
+        for a in load_annotations(project_id):
+            done.setdefault(a.sample_id, set()).add(a.annotator)
+        for sid in sample_ids:
+            sid = str(sid)
+            if sid in self.tasks:
+                continue
+            task = AnnotationTask(sample_id=sid, replicas=self.replicas, done_by=set(done.get(sid, ())))
+            self.tasks[sid] = task
+            self._order.append(sid)
+            self._open += task.open_slots
+        self._completed = sum(len(t.done_by) for t in self.tasks.values())
+        self._finished = sum(1 for t in self.tasks.values() if t.finished)
+
+    # ---------------- 内部：回收过期租约（持锁调用） ----------------
+
+    def _reclaim_expired(self, now: float) -> int:
+        n = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, lease_id = heapq.heappop(self._expiry)
+            lease = self._leases.get(lease_id)
+            if lease is None or lease.expires_at != expires_at:
+                continue  # 已完成 / 已释放 / 续过期
+            self._drop_lease(lease, requeue=True)
+            n += 1
+        return n
+
+    def _drop_lease(self, lease: Lease, requeue: bool) -> None:
+        del self._leases[lease.lease_id]
+        task = self.tasks[lease.sample_id]
+        task.leased_to.discard(lease.annotator)
+        if requeue:
+            self._returned.append(lease.sample_id)
+            self._open += 1
+
+    def _take_returned(self, annotator: str) -> Optional[str]:
+        skipped: List[str] = []
+        sid = None
+        while self._returned:
+            cand = self._returned.popleft()
+            task = self.tasks.get(cand)
+            if task is None or task.open_slots == 0:
+                continue  # 已经被别人按顺序领走
+            if task.taken_by(annotator):
+                skipped.append(cand)  # 留给别人
+                continue
+            sid = cand
+            break
+        self._returned.extendleft(reversed(skipped))
+        return sid
+
+    def _take_next(self, annotator: str) -> Optional[str]:
+        """
+        从标注员自己的游标往后找第一个能领的样本。走过的样本不会再看：
+        自己领过的以后也不能领；名额被别人占满的，租约过期时会进 _returned。
+        同一样本的 k 个名额在同一位置，先把一个样本的 k 份凑齐，一致性结果出得早。
+        """
+        order = self._order
+        while self._head < len(order) and self.tasks[order[self._head]].finished:
+            self._head += 1
+        i = max(self._cursors.get(annotator, 0), self._head)
+        sid = None
+        while i < len(order):
+            task = self.tasks[order[i]]
+            i += 1
+            if task.open_slots > 0 and not task.taken_by(annotator):
+                sid = task.sample_id
+                break
+        self._cursors[annotator] = i
+        return sid
+
+    def _get_lease(self, lease_id: str, annotator: str, now: float) -> Lease:
+        self._reclaim_expired(now)
+        lease = self._leases.get(lease_id)
+        if lease is None:
+            raise LeaseExpiredError(f"lease {lease_id} expired or does not exist")
+        if lease.annotator != annotator:
+            raise LeaseOwnerError(f"lease {lease_id} belongs to another annotator")
+        return lease
+
+    # ---------------- 对外接口 ----------------
+
+    def claim(self, annotator: str) -> Optional[Dict[str, Any]]:
+        """领下一个名额；没有可领的返回 None。"""
+        now = self._clock()
+        with self._lock:
+            self._reclaim_expired(now)
+            sid = self._take_returned(annotator) or self._take_next(annotator)
+            if sid is None:
+                return None
+
+            lease = Lease(
+                lease_id=uuid.uuid4().hex,
+                project_id=self.project_id,
+                sample_id=sid,
+                annotator=annotator,
+                expires_at=now + self.lease_seconds,
+            )
+            self._leases[lease.lease_id] = lease
+            self.tasks[sid].leased_to.add(annotator)
+            self._open -= 1
+            heapq.heappush(self._expiry, (lease.expires_at, lease.lease_id))
+            out = lease.to_dict(now)
+            out["replica"] = len(self.tasks[sid].done_by) + len(self.tasks[sid].leased_to)
+            out["replicas"] = self.replicas
+            return out
+
+    def heartbeat(self, lease_id: str, annotator: str) -> Dict[str, Any]:
+        now = self._clock()
+        with self._lock:
+            lease = self._get_lease(lease_id, annotator, now)
+            lease.expires_at = now + self.lease_seconds
+            lease.heartbeats += 1
+            heapq.heappush(self._expiry, (lease.expires_at, lease.lease_id))
+            return lease.to_dict(now)
+
+    def release(self, lease_id: str, annotator: str) -> Dict[str, Any]:
+        """主动放弃：名额立刻回到队头。"""
+        now = self._clock()
+        with self._lock:
+            lease = self._get_lease(lease_id, annotator, now)
+            self._drop_lease(lease, requeue=True)
+            return {"lease_id": lease_id, "sample_id": lease.sample_id, "released": True}
+
+    def complete(self, lease_id: str, annotator: str, fields: Dict[str, Any]) -> Annotation:
+        now = self._clock()
+        with self._lock:
+            lease = self._get_lease(lease_id, annotator, now)
+            self._drop_lease(lease, requeue=False)
+            task = self.tasks[lease.sample_id]
+            task.done_by.add(annotator)
+            self._completed += 1
+            if len(task.done_by) == task.replicas:
+                self._finished += 1
+
+        ann = Annotation(
+            project_id=self.project_id,
+            sample_id=lease.sample_id,
+            annotator=annotator,
+            label=fields.get("label"),
+            cot_text=fields.get("cot_text"),
+            source=fields.get("source") or "human",
+            lease_id=lease_id,
+            created_at=now_str(),
+        )
+        try:
+            self._append(ann)
+        except BaseException:
+            # 没写进 annotations.jsonl：撤销完成标记、恢复租约，标注员可以重试提交
+            with self._lock:
+                if len(task.done_by) == task.replicas:
+                    self._finished -= 1
+                task.done_by.discard(annotator)
+                self._completed -= 1
+                self._leases[lease.lease_id] = lease
+                task.leased_to.add(annotator)
+                heapq.heappush(self._expiry, (lease.expires_at, lease.lease_id))
+            raise
+        return ann
+
+    def _append(self, ann: Annotation) -> None:
+        # 追加写和队列锁分开，慢磁盘不拖住领取
+        path = get_annotations_path(self.project_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(ann.to_dict(), ensure_ascii=False) + "\n"
+        with self._write_lock:
+            with path.open("a", encoding="utf-8") as f:
+                f.write(line)
+
+    def stats(self) -> Dict[str, Any]:
+        now = self._clock()
+        with self._lock:
+            self._reclaim_expired(now)
             return {
-                "sample_id": r["sample_id"],
-                "project_id": r["project_id"],
-                "title": r["title"],
-                "raw_text": r["raw_text"],
-                "labels": r["labels"],
-                "current_label": r["labels"][0] if r["labels"] else "",
-                "cot_text": r.get("cot_text", ""),
-                "has_manual_cot": False,
+                "project_id": self.project_id,
+                "samples": len(self.tasks),
+                "replicas": self.replicas,
+                "lease_seconds": self.lease_seconds,
+                "pending_slots": self._open,
+                "active_leases": len(self._leases),
+                "completed": self._completed,
+                "finished_samples": self._finished,
             }
-    raise NotFound(...)
+
+
+_registry_lock = threading.Lock()
+_queues: Dict[str, TaskQueue] = {}
+
+
+def get_queue(project_id: str, load_sample_ids: Callable[[], List[str]]) -> TaskQueue:
+    """取项目的队列，第一次用时按样本列表和已有标注建队列。"""
+    q = _queues.get(project_id)
+    if q is not None:
+        return q
+    with _registry_lock:
+        q = _queues.get(project_id)
+        if q is None:
+            q = _queues[project_id] = TaskQueue(project_id, load_sample_ids())
+        return q
+
+
+def configure_queue(
+    project_id: str,
+    sample_ids: List[str],
+    replicas: int = DEFAULT_REPLICAS,
+    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+) -> TaskQueue:
+    """按新的副本数 / 租约时长重建队列（已完成的标注保留，进行中的租约作废）。"""
+    q = TaskQueue(project_id, sample_ids, replicas=replicas, lease_seconds=lease_seconds)
+    with _registry_lock:
+        _queues[project_id] = q
+    return q
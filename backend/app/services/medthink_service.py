@@ -0,0 +1,305 @@
+"""
+MedThink 原始数据：解析 + 分片读取。
+
+项目的 raw/ 目录下可以放多个分片：*.jsonl / *.jsonl.gz / *.jsonl.zst
+（老项目只有一个 med_think_responses.jsonl，就当作唯一的分片）。
+分片直接流式解压解析，不落地解压后的文件；多个分片时按分片并行（进程池）。
+
+特征库按分片入库（见 feature_store 的分片清单）：
+大小 / mtime 没变且抽取器版本没变的分片直接跳过，只解析新到或变化的分片。
+"""
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+from app.services import feature_store
+from app.services.storage_service import get_project_dir
+from app.utils.text_utils import extract_patient_id, extract_visit_date
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖：没有时 .zst 分片读不了，其他格式不受影响
+    zstandard = None
+
+LEGACY_SHARD_NAME = "med_think_responses.jsonl"
+SHARD_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst")
+
+# 分片总大小低于这个值时不开进程池（启动开销比解析还大）
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+INGEST_WORKERS = int(os.getenv("MEDITAG_INGEST_WORKERS") or 0)
+
+
+# ====================== 单条记录解析 ======================
+
+def extract_json_from_markdown(text: str) -> str:
+    """
+    把 ```json ... ``` 代码块里的纯 JSON 抠出来。
+    """
+    if not text:
+        return ""
+    s = text.strip()
+    if s.startswith("```"):
+        # 去掉 ```json / ``` 前缀
+        if s.lower().startswith("```json"):
+            s = s[7:]
+        else:
+            s = s[3:]
+        s = s.lstrip()
+        # 去掉末尾 ```
+        if s.endswith("```"):
+            s = s[:-3]
+    return s.strip()
+
+
+_med_think_pattern = re.compile(r"<med_think>(.*?)</med_think>", re.DOTALL)
+
+
+def extract_med_think_block(text: str) -> str:
+    """
+    从 <med_think>...</med_think> 中抽出内部内容；
+    若找不到标签，则直接返回原文。
+    """
+    if not text:
+        return ""
+    m = _med_think_pattern.search(text)
+    if m:
+        return m.group(1).strip()
+    return text.strip()
+
+
+def parse_medthink_record(raw: Dict[str, Any], idx: Any, project_id: str) -> Dict[str, Any]:
+    """
+    将 med_think_responses.jsonl 中的一行原始记录解析为统一结构。
+    idx 是没有 custom_id 时的兜底 sample_id。
+    """
+    sample_id = str(raw.get("custom_id") or idx)
+
+    # 1) 拿到 user 消息里的“快诊信息 / 病历文本”
+    request = raw.get("request", {})
+    messages = request.get("messages", [])
+    user_content = ""
+    for m in messages:
+        if m.get("role") == "user":
+            user_content = m.get("content", "")
+            break
+
+    emr_text = user_content or ""
+
+    # 简单从 user 文本里抽 patient_id、日期（没抽到就留空；正则在 text_utils 里预编译）
+    patient_id = extract_patient_id(user_content)
+    visit_date = extract_visit_date(user_content)
+
+    # 2) 解析 response 里的 JSON 思维链
+    resp_str = raw.get("response", "")
+    json_str = extract_json_from_markdown(resp_str)
+
+    try:
+        payload = json.loads(json_str)
+    except Exception as e:
+        logger.warning("failed to parse med_think JSON for sample %s: %s", sample_id, e)
+        payload = {}
+
+    diagnosis_list = payload.get("all_result") or []
+    model_thinks = []
+    total_tokens = 0
+
+    for label in diagnosis_list:
+        raw_think = payload.get(label, "")
+        med_think = extract_med_think_block(raw_think)
+        tokens = len(med_think.split())
+        total_tokens += tokens
+        model_thinks.append(
+            {
+                "label": label,
+                "med_think": med_think,
+                "tokens": tokens,
+            }
+        )
+
+    has_cot_for_all = bool(diagnosis_list) and all(
+        bool(mt["med_think"]) for mt in model_thinks
+    )
+
+    return {
+        "sample_id": sample_id,
+        "project_id": project_id,
+        "patient_id": patient_id,
+        "visit_date": visit_date,
+        "diagnosis_list": diagnosis_list,
+        "diagnosis_count": len(diagnosis_list),
+        "emr_text": emr_text,
+        "model_thinks": model_thinks,
+        "total_cot_tokens": total_tokens,
+        "has_cot_for_all": has_cot_for_all,
+    }
+
+
+# ====================== 分片 ======================
+
+def get_raw_dir(project_id: str) -> Path:
+    return get_project_dir(project_id) / "raw"
+
+
+def list_shards(project_id: str) -> List[Path]:
+    """raw/ 下的所有分片，按文件名排序（上游按日期命名，排序即时间顺序）。"""
+    raw_dir = get_raw_dir(project_id)
+    if not raw_dir.is_dir():
+        return []
+    return sorted(p for p in raw_dir.iterdir() if p.is_file() and p.name.endswith(SHARD_SUFFIXES))
+
+
+def open_shard(path: Path) -> IO[str]:
+    """按扩展名打开分片，返回流式解压的文本流。"""
+    if path.name.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.name.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"reading {path.name} requires the zstandard package")
+        fh = path.open("rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(fh, closefd=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
+def fallback_sample_id(shard_name: str, line_no: int) -> Any:
+    # 老的单文件沿用行号；多分片时加上分片名，避免不同分片的行号撞车
+    if shard_name == LEGACY_SHARD_NAME:
+        return line_no
+    return f"{shard_name.split('.', 1)[0]}:{line_no}"
+
+
+def iter_shard(path: Path, project_id: str) -> Iterator[Optional[Dict[str, Any]]]:
+    """流式逐条解析一个分片；坏行产出 None（由调用方计数）。"""
+    with open_shard(path) as f:
+        for idx, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                raw = json.loads(line)
+                yield parse_medthink_record(raw, fallback_sample_id(path.name, idx), project_id)
+            except Exception as e:
+                logger.warning("skip bad med_think line %s#%d: %s", path.name, idx, e)
+                yield None
+
+
+def decode_shard(path: Path, project_id: str) -> Tuple[List[Dict[str, Any]], int]:
+    """解析一个分片，返回 (样本列表, 坏行数)。"""
+    samples: List[Dict[str, Any]] = []
+    bad = 0
+    for sample in iter_shard(path, project_id):
+        if sample is None:
+            # 有问题的记录先跳过，数量记到分片清单里
+            bad += 1
+        else:
+            samples.append(sample)
+    return samples, bad
+
+
+def iter_samples(project_id: str, shards: Optional[List[Path]] = None) -> Iterator[Dict[str, Any]]:
+    """按分片顺序逐条产出样本（跳过坏行），内存里只有当前这一条，给批量导出用。"""
+    shards = list_shards(project_id) if shards is None else shards
+    for p in shards:
+        for sample in iter_shard(p, project_id):
+            if sample is not None:
+                yield sample
+
+
+def _decode_job(project_id: str, path: str) -> Tuple[List[Dict[str, Any]], int]:
+    return decode_shard(Path(path), project_id)
+
+
+def _ingest_job(project_id: str, path: str) -> Dict[str, Any]:
+    """子进程里解析一个分片并直接写好它的特征文件，只把清单条目传回主进程。"""
+    p = Path(path)
+    samples, bad = decode_shard(p, project_id)
+    return feature_store.write_shard_features(project_id, p, samples, bad_lines=bad)
+
+
+def _pool_size(shards: List[Path], workers: Optional[int]) -> int:
+    if workers is None:
+        workers = INGEST_WORKERS or min(os.cpu_count() or 1, 8)
+    if len(shards) <= 1 or sum(p.stat().st_size for p in shards) < PARALLEL_MIN_BYTES:
+        return 1
+    return max(1, min(workers, len(shards)))
+
+
+def _map_shards(fn, project_id: str, shards: List[Path], workers: Optional[int]) -> List[Any]:
+    """按分片跑 fn(project_id, path)，结果与 shards 顺序一致。"""
+    n = _pool_size(shards, workers)
+    if n <= 1:
+        return [fn(project_id, str(p)) for p in shards]
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=n, mp_context=ctx) as pool:
+        futures = [pool.submit(fn, project_id, str(p)) for p in shards]
+        return [f.result() for f in futures]
+
+
+def load_samples(
+    project_id: str,
+    shards: Optional[List[Path]] = None,
+    workers: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    解析所有分片（多分片时并行），返回 (样本列表, 报告)。
+    顺带把变化过的分片入特征库——已经解析好了，不用再读一遍。
+    """
+    shards = list_shards(project_id) if shards is None else shards
+    results = _map_shards(_decode_job, project_id, shards, workers)
+
+    samples: List[Dict[str, Any]] = []
+    by_shard: Dict[str, Tuple[List[Dict[str, Any]], int]] = {}
+    for p, (one, bad) in zip(shards, results):
+        samples.extend(one)
+        by_shard[p.name] = (one, bad)
+
+    with feature_store.project_lock(project_id):
+        stale, removed = feature_store.stale_shards(project_id, shards)
+        entries = {
+            p.name: feature_store.write_shard_features(project_id, p, *by_shard[p.name])
+            for p in stale
+        }
+        if entries or removed:
+            feature_store.commit_manifest(project_id, entries, removed)
+    report = {
+        "shards": len(shards),
+        "ingested": sorted(entries),
+        "removed": removed,
+        "bad_lines": sum(bad for _, bad in by_shard.values()),
+    }
+    return samples, report
+
+
+def sync_features(
+    project_id: str,
+    shards: Optional[List[Path]] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    只把新到 / 变化的分片解析入特征库（并行），没变的分片跳过，不在 raw/ 里的分片移出清单。
+    """
+    shards = list_shards(project_id) if shards is None else shards
+    with feature_store.project_lock(project_id):
+        stale, removed = feature_store.stale_shards(project_id, shards)
+        if not stale and not removed:
+            return {"shards": len(shards), "ingested": [], "removed": [], "skipped": len(shards)}
+
+        results = _map_shards(_ingest_job, project_id, stale, workers)
+        entries = {p.name: entry for p, entry in zip(stale, results)}
+        feature_store.commit_manifest(project_id, entries, removed)
+    return {
+        "shards": len(shards),
+        "ingested": sorted(entries),
+        "removed": removed,
+        "skipped": len(shards) - len(stale),
+    }
+
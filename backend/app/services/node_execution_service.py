@@ -0,0 +1,167 @@
+"""
+工作流节点的执行：节点类型注册 + 带缓存和计时的单节点执行。
+
+- 节点类型用 @register_node 注册，签名为 fn(project_id, config, inputs) -> output，
+  inputs 是 {上游节点 id: 上游 output}，output 是可 json 序列化的 dict（统计 / 产物路径）。
+- 缓存键 = hash(节点类型, 版本, config, 上游节点的缓存键和产物摘要, sources 文件的大小 / mtime)，
+  上游的键一层层传下来（类似 Merkle 树）：上游没变、自己的输入文件也没变就直接复用上次的 output。
+  产物摘要（NodeRun.output_digest）= hash(output, outputs 文件签名)：上游因为产物被删等原因重新执行后
+  摘要变了，下游跟着重跑，不会拿旧产物算出来的缓存。
+- 节点声明了 outputs（产物文件）时，命中缓存还要求产物文件和上次执行完时一致，
+  产物被手工改过 / 删掉就重新执行。
+- 节点逻辑改了就把 version +1，旧缓存自然失效。
+
+缓存放在 workflows/cache/<key>.json。
+"""
+import json
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.models.workflow_node import NodeRun, WorkflowNode
+from app.services.storage_service import get_project_dir
+from app.utils.file_utils import atomic_write_json, content_hash
+from app.utils.time_utils import now_str
+
+NodeFunc = Callable[[str, Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+PathsFunc = Callable[[str, Dict[str, Any]], List[Path]]
+
+
+@dataclass(frozen=True)
+class NodeType:
+    name: str
+    version: int
+    func: NodeFunc
+    sources: Optional[PathsFunc]
+    outputs: Optional[PathsFunc]
+    description: str
+
+
+_NODE_TYPES: Dict[str, NodeType] = {}
+
+
+def register_node(
+    name: str,
+    version: int = 1,
+    sources: Optional[PathsFunc] = None,
+    outputs: Optional[PathsFunc] = None,
+    description: str = "",
+):
+    """
+    注册一个节点类型。sources(project_id, config) 返回节点直接读取的文件（参与缓存键），
+    outputs(project_id, config) 返回节点写出的文件（命中缓存时校验）。
+    """
+
+    def deco(func: NodeFunc) -> NodeFunc:
+        _NODE_TYPES[name] = NodeType(
+            name=name, version=version, func=func, sources=sources, outputs=outputs, description=description
+        )
+        return func
+
+    return deco
+
+
+def list_node_types() -> List[Dict[str, Any]]:
+    return [{"type": t.name, "version": t.version, "description": t.description} for t in _NODE_TYPES.values()]
+
+
+def get_node_type(name: str) -> NodeType:
+    t = _NODE_TYPES.get(name)
+    if t is None:
+        raise ValueError(f"unknown node type: {name}")
+    return t
+
+
+def get_cache_dir(project_id: str) -> Path:
+    return get_project_dir(project_id) / "workflows" / "cache"
+
+
+def file_signature(paths: List[Path]) -> List[List[Any]]:
+    """文件的 (路径, 大小, mtime_ns)；不存在的文件记成 None，出现 / 消失也算变化。"""
+    sig: List[List[Any]] = []
+    for p in paths:
+        try:
+            st = p.stat()
+            sig.append([str(p), st.st_size, st.st_mtime_ns])
+        except FileNotFoundError:
+            sig.append([str(p), None, None])
+    return sig
+
+
+def cache_key(project_id: str, node: WorkflowNode, upstream: Dict[str, NodeRun]) -> str:
+    t = get_node_type(node.type)
+    return content_hash(
+        {
+            "project_id": project_id,
+            "type": t.name,
+            "version": t.version,
+            "config": node.config,
+            "upstream": sorted((d, [r.cache_key, r.output_digest]) for d, r in upstream.items()),
+            "sources": file_signature(t.sources(project_id, node.config)) if t.sources else [],
+        }
+    )
+
+
+def _cache_path(project_id: str, key: str) -> Path:
+    return get_cache_dir(project_id) / f"{key}.json"
+
+
+def _load_cached(project_id: str, key: str, t: NodeType, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    path = _cache_path(project_id, key)
+    if not path.exists():
+        return None
+    try:
+        entry = json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        return None
+    if t.outputs and entry.get("outputs") != file_signature(t.outputs(project_id, config)):
+        return None
+    return entry
+
+
+def execute_node(
+    project_id: str,
+    node: WorkflowNode,
+    upstream: Dict[str, NodeRun],
+    force: bool = False,
+) -> NodeRun:
+    """
+    执行一个节点（上游都已成功）：缓存命中时直接返回上次的 output。
+    不抛异常，失败记在 NodeRun.error 里，由调度方决定下游怎么办。
+    """
+    run = NodeRun(node_id=node.id, node_type=node.type, status="running", started_at=now_str())
+    t0 = time.perf_counter()
+    try:
+        t = get_node_type(node.type)
+        run.cache_key = cache_key(project_id, node, {d: upstream[d] for d in node.depends_on})
+        entry = None if force else _load_cached(project_id, run.cache_key, t, node.config)
+        if entry is not None:
+            run.status = "cached"
+            run.output = entry.get("output")
+            outputs_sig = entry.get("outputs")
+        else:
+            inputs = {d: upstream[d].output for d in node.depends_on}
+            output = t.func(project_id, node.config, inputs) or {}
+            run.status = "success"
+            run.output = output
+            outputs_sig = file_signature(t.outputs(project_id, node.config)) if t.outputs else None
+            atomic_write_json(
+                _cache_path(project_id, run.cache_key),
+                {
+                    "key": run.cache_key,
+                    "node_type": t.name,
+                    "output": output,
+                    "outputs": outputs_sig,
+                    "seconds": round(time.perf_counter() - t0, 4),
+                    "created_at": now_str(),
+                },
+            )
+        run.output_digest = content_hash({"output": run.output, "outputs": outputs_sig})
+    except Exception as e:
+        traceback.print_exc()
+        run.status = "failed"
+        run.error = f"{type(e).__name__}: {e}"
+    run.seconds = round(time.perf_counter() - t0, 4)
+    return run
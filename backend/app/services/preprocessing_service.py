@@ -1,48 +1,376 @@
-# 伪代码，放在 preprocessing_service 或单独脚本里
+"""
+预处理：raw/ 下的 med_think 分片 -> labeling/labeling_inputs.jsonl（标注输入）。
+
+    - 分片逐行流式读取，每 chunk_lines 行切成一个分块交给进程池解析，
+      同时在飞的分块数有上限，内存占用和数据量无关；数据量小时直接在当前进程里跑；
+    - 每条记录：找 role=user 的消息（不假设下标），取“诊断结论：”那一行做 title，
+      response 用 medthink_service.extract_json_from_markdown 去掉代码块后解析，
+      all_result 做 labels，各 label 的 <med_think> 内容拼成 cot_text；
+    - 坏记录不中断整批：按类型（invalid_json / invalid_record / bad_shape / missing_user_message /
+      invalid_response / missing_labels）记入 labeling/preprocess_errors.json；
+    - 每个分块解析完原子写成 labeling/.preprocess/ 下的分块文件，并更新 checkpoint.json；
+      中断后再跑（分片和参数没变时）只处理没完成的分块；
+    - 全部完成后按分片、行号顺序拼成临时文件再 os.replace 覆盖 labeling_inputs.jsonl，
+      运行统计（PreprocessingRun）追加到 labeling/preprocessing_runs.jsonl。
+
+也可以命令行跑：python -m app.services.preprocessing_service <project_id> [--workers N] [--restart]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from pathlib import Path
-import json, re
-
-raw_path = DATA_ROOT / "projects" / "p1" / "raw" / "med_think_responses.jsonl"
-out_path = DATA_ROOT / "projects" / "p1" / "labeling" / "labeling_inputs.jsonl"
-
-def strip_code_fence(s: str) -> str:
-    s = s.strip()
-    s = re.sub(r"^```json", "", s)
-    s = re.sub(r"```$", "", s)
-    return s.strip()
-
-with raw_path.open("r", encoding="utf-8") as fin, \
-     out_path.open("w", encoding="utf-8") as fout:
-    for line in fin:
-        obj = json.loads(line)
-        sample_id = obj["custom_id"]
-        user_content = obj["request"]["messages"][1]["content"]
-
-        # 提取诊断结论（你原 prompt 里有 “诊断结论：xxxxx” 这一段）
-        # 简单做法：按行 split，找到包含“诊断结论：”的那一行
-        diagnosis_line = next(
-            (ln for ln in user_content.splitlines() if "诊断结论：" in ln),
-            ""
-        )
-        diagnosis_text = diagnosis_line.replace("诊断结论：", "").strip()
-
-        # 解析 JSON 字符串里的 COT 结果
-        resp_obj = json.loads(strip_code_fence(obj["response"]))
-        labels = resp_obj["all_result"]
-
-        # 这里先只保留一个整体 COT，可以按需要拆成每个 label 一条
-        # 比如 concat 所有 label 对应的 med_think
-        cot_parts = []
-        for label in labels:
-            cot_parts.append(resp_obj.get(label, ""))
-        full_cot = "\n\n".join(cot_parts)
-
-        out_record = {
-            "sample_id": sample_id,
-            "project_id": "p1",
-            "title": diagnosis_text,
-            "raw_text": user_content,
-            "labels": labels,
-            "cot_text": full_cot
-        }
-        fout.write(json.dumps(out_record, ensure_ascii=False) + "\n")
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.models.preprocessing_run import PreprocessingRun
+from app.services import medthink_service
+from app.services.storage_service import get_labeling_dataset_path, get_project_dir
+from app.utils.file_utils import atomic_write_json, atomic_write_jsonl, atomic_write_lines, iter_jsonl
+from app.utils.time_utils import now_str
+
+# 转换逻辑改了就 +1，旧的断点作废
+CONVERTER_VERSION = 2
+CHUNK_LINES = 2000
+
+_DIAGNOSIS_PREFIX = "诊断结论："
+
+_running_lock = threading.Lock()
+_running: Set[str] = set()
+_runs_write_lock = threading.Lock()
+
+
+class RecordError(ValueError):
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+def get_work_dir(project_id: str) -> Path:
+    return get_project_dir(project_id) / "labeling" / ".preprocess"
+
+
+def get_error_report_path(project_id: str) -> Path:
+    return get_project_dir(project_id) / "labeling" / "preprocess_errors.json"
+
+
+def get_runs_path(project_id: str) -> Path:
+    return get_project_dir(project_id) / "labeling" / "preprocessing_runs.jsonl"
+
+
+# ====================== 单条记录 ======================
+
+def convert_record(raw: Any, sample_id: str, project_id: str) -> Dict[str, Any]:
+    """一条原始记录 -> 一条标注输入；记录有问题时抛 RecordError。"""
+    if not isinstance(raw, dict):
+        raise RecordError("invalid_record", "record is not a JSON object")
+
+    request = raw.get("request") or {}
+    if not isinstance(request, dict):
+        raise RecordError("bad_shape", f"request is {type(request).__name__}, expected an object")
+    messages = request.get("messages") or []
+    if not isinstance(messages, list):
+        raise RecordError("bad_shape", f"request.messages is {type(messages).__name__}, expected a list")
+    user_content = next(
+        (m.get("content") for m in messages if isinstance(m, dict) and m.get("role") == "user"),
+        None,
+    )
+    if not user_content or not isinstance(user_content, str):
+        raise RecordError("missing_user_message", "no user message in request.messages")
+
+    title = next(
+        (ln.replace(_DIAGNOSIS_PREFIX, "").strip() for ln in user_content.splitlines() if _DIAGNOSIS_PREFIX in ln),
+        "",
+    )
+
+    response = raw.get("response") or ""
+    if not isinstance(response, str):
+        raise RecordError("bad_shape", f"response is {type(response).__name__}, expected a string")
+    try:
+        payload = json.loads(medthink_service.extract_json_from_markdown(response))
+    except ValueError as e:
+        raise RecordError("invalid_response", f"response is not valid JSON: {e}")
+    if not isinstance(payload, dict):
+        raise RecordError("invalid_response", "response JSON is not an object")
+
+    labels = payload.get("all_result")
+    if not isinstance(labels, list) or not labels:
+        raise RecordError("missing_labels", "all_result is missing or empty")
+    labels = [str(x) for x in labels]
+
+    cot_parts = [medthink_service.extract_med_think_block(str(payload.get(label) or "")) for label in labels]
+    return {
+        "sample_id": sample_id,
+        "project_id": project_id,
+        "title": title,
+        "raw_text": user_content,
+        "labels": labels,
+        "cot_text": "\n\n".join(p for p in cot_parts if p),
+    }
+
+
+def _convert_chunk(
+    project_id: str,
+    shard_name: str,
+    start_line: int,
+    lines: List[str],
+    part_path: str,
+) -> Dict[str, Any]:
+    """解析一个分块并原子写出分块文件（子进程里跑），返回计数；错误明细写到同名 .errors.jsonl。"""
+    rows: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    n_lines = 0
+    for line_no, line in enumerate(lines, start=start_line):
+        line = line.strip()
+        if not line:
+            continue
+        n_lines += 1
+        sample_id = None
+        try:
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                raise RecordError("invalid_json", str(e))
+            if isinstance(raw, dict):
+                sample_id = str(raw.get("custom_id") or medthink_service.fallback_sample_id(shard_name, line_no))
+            rows.append(convert_record(raw, sample_id, project_id))
+        except RecordError as e:
+            errors.append(
+                {"shard": shard_name, "line": line_no, "sample_id": sample_id, "kind": e.kind, "message": str(e)}
+            )
+        except (AttributeError, TypeError, ValueError) as e:
+            # 上面没预料到的结构问题：同样记下来跳过，不让一条记录拖垮整批
+            errors.append(
+                {
+                    "shard": shard_name,
+                    "line": line_no,
+                    "sample_id": sample_id,
+                    "kind": "bad_shape",
+                    "message": f"{type(e).__name__}: {e}",
+                }
+            )
+
+    part = Path(part_path)
+    if errors:
+        atomic_write_jsonl(part.with_suffix(".errors.jsonl"), errors)
+    atomic_write_jsonl(part, rows)
+    return {"lines": n_lines, "written": len(rows), "errors": len(errors)}
+
+
+# ====================== 分块 / 断点 ======================
+
+def _iter_chunks(shards: List[Path], chunk_lines: int) -> Iterator[Tuple[str, str, int, List[str]]]:
+    """按分片顺序切块，产出 (分块 key, 分片名, 起始行号, 行列表)。key 按字典序即原始顺序。"""
+    for si, path in enumerate(shards):
+        with medthink_service.open_shard(path) as f:
+            buf: List[str] = []
+            start = 1
+            ci = 0
+            for line_no, line in enumerate(f, start=1):
+                buf.append(line)
+                if len(buf) >= chunk_lines:
+                    yield f"{si:04d}-{ci:06d}", path.name, start, buf
+                    buf = []
+                    start = line_no + 1
+                    ci += 1
+            if buf:
+                yield f"{si:04d}-{ci:06d}", path.name, start, buf
+
+
+def _signature(shards: List[Path], chunk_lines: int) -> Dict[str, Any]:
+    stats = []
+    for p in shards:
+        st = p.stat()
+        stats.append([p.name, st.st_size, st.st_mtime_ns])
+    return {"version": CONVERTER_VERSION, "chunk_lines": chunk_lines, "shards": stats}
+
+
+def _load_checkpoint(work_dir: Path, signature: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """签名一致时返回已完成的分块 {key: 计数}；否则清空工作目录从头来。"""
+    path = work_dir / "checkpoint.json"
+    if path.exists():
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except ValueError:
+            data = {}
+        if data.get("signature") == signature:
+            chunks = data.get("chunks") or {}
+            return {k: v for k, v in chunks.items() if (work_dir / f"part-{k}.jsonl").exists()}
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return {}
+
+
+def _pool_size(shards: List[Path], workers: Optional[int]) -> int:
+    if sum(p.stat().st_size for p in shards) < medthink_service.PARALLEL_MIN_BYTES:
+        return 1
+    if workers is None:
+        workers = medthink_service.INGEST_WORKERS or min(os.cpu_count() or 1, 8)
+    return max(1, workers)
+
+
+# ====================== 运行 ======================
+
+def _append_run(run: PreprocessingRun) -> None:
+    path = get_runs_path(run.project_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _runs_write_lock:
+        with path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(run.to_dict(), ensure_ascii=False) + "\n")
+
+
+def list_runs(project_id: str) -> List[PreprocessingRun]:
+    path = get_runs_path(project_id)
+    if not path.exists():
+        return []
+    return [PreprocessingRun.from_dict(d) for d in iter_jsonl(path)]
+
+
+def _iter_lines(paths: List[Path]) -> Iterator[str]:
+    for p in paths:
+        with p.open("r", encoding="utf-8") as f:
+            yield from f
+
+
+def _write_error_report(project_id: str, run_id: str, error_files: List[Path]) -> Dict[str, int]:
+    errors: List[Dict[str, Any]] = []
+    for p in error_files:
+        errors.extend(iter_jsonl(p))
+    by_kind: Dict[str, int] = {}
+    for e in errors:
+        by_kind[e["kind"]] = by_kind.get(e["kind"], 0) + 1
+    atomic_write_json(
+        get_error_report_path(project_id),
+        {
+            "run_id": run_id,
+            "project_id": project_id,
+            "created_at": now_str(),
+            "total": len(errors),
+            "by_kind": by_kind,
+            "errors": errors,
+        },
+    )
+    return by_kind
+
+
+def run_preprocessing(
+    project_id: str,
+    workers: Optional[int] = None,
+    chunk_lines: int = CHUNK_LINES,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """
+    跑一次预处理，返回运行记录（PreprocessingRun.to_dict() 加上 errors_by_kind）。
+    restart=True 时丢掉断点从头来。同一项目同时只能有一个运行。
+    """
+    if chunk_lines < 1:
+        raise ValueError("chunk_lines must be >= 1")
+    shards = medthink_service.list_shards(project_id)
+    if not shards:
+        raise FileNotFoundError(f"no med_think shards found in: {medthink_service.get_raw_dir(project_id)}")
+
+    with _running_lock:
+        if project_id in _running:
+            raise RuntimeError(f"preprocessing already running for project {project_id}")
+        _running.add(project_id)
+
+    t0 = time.perf_counter()
+    run = PreprocessingRun(
+        run_id=uuid.uuid4().hex[:12],
+        project_id=project_id,
+        started_at=now_str(),
+        shards=len(shards),
+    )
+    try:
+        work_dir = get_work_dir(project_id)
+        signature = _signature(shards, chunk_lines)
+        if restart:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        done = _load_checkpoint(work_dir, signature)
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+        def save_checkpoint() -> None:
+            atomic_write_json(work_dir / "checkpoint.json", {"signature": signature, "chunks": done})
+
+        run.workers = _pool_size(shards, workers)
+        keys: List[str] = []
+        pool = None
+        if run.workers > 1:
+            # spawn：uvicorn 进程里有线程，fork 可能带着锁进子进程
+            pool = ProcessPoolExecutor(max_workers=run.workers, mp_context=multiprocessing.get_context("spawn"))
+        inflight: Dict[Future, str] = {}
+
+        def collect(futures) -> None:
+            for fut in futures:
+                done[inflight.pop(fut)] = fut.result()
+                run.chunks_done += 1
+            save_checkpoint()
+
+        try:
+            for key, shard_name, start, lines in _iter_chunks(shards, chunk_lines):
+                keys.append(key)
+                if key in done:
+                    run.chunks_resumed += 1
+                    continue
+                part_path = str(work_dir / f"part-{key}.jsonl")
+                if pool is None:
+                    done[key] = _convert_chunk(project_id, shard_name, start, lines, part_path)
+                    run.chunks_done += 1
+                    save_checkpoint()
+                    continue
+                # 在飞的分块数有上限：读得比解析快时在这里等，行数据不会无限堆在内存里
+                while len(inflight) >= run.workers * 2:
+                    finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                inflight[pool.submit(_convert_chunk, project_id, shard_name, start, lines, part_path)] = key
+            if inflight:
+                finished, _ = wait(inflight)
+                collect(finished)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+
+        run.chunks_total = len(keys)
+        parts = [work_dir / f"part-{k}.jsonl" for k in keys]
+        out_path = get_labeling_dataset_path(project_id)
+        atomic_write_lines(out_path, _iter_lines(parts))
+        error_files = [p.with_suffix(".errors.jsonl") for p in parts]
+        by_kind = _write_error_report(project_id, run.run_id, [p for p in error_files if p.exists()])
+
+        run.lines = sum(done[k]["lines"] for k in keys)
+        run.written = sum(done[k]["written"] for k in keys)
+        run.errors = sum(done[k]["errors"] for k in keys)
+        run.output = str(out_path)
+        run.error_report = str(get_error_report_path(project_id))
+        run.status = "completed"
+        shutil.rmtree(work_dir, ignore_errors=True)
+    except BaseException as e:
+        # 工作目录和断点保留，下次运行从这里续上
+        run.status = "failed"
+        run.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        run.finished_at = now_str()
+        run.seconds = round(time.perf_counter() - t0, 4)
+        _append_run(run)
+        with _running_lock:
+            _running.discard(project_id)
+    return dict(run.to_dict(), errors_by_kind=by_kind)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="raw med_think shards -> labeling/labeling_inputs.jsonl")
+    parser.add_argument("project_id")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-lines", type=int, default=CHUNK_LINES)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    args = parser.parse_args()
+    result = run_preprocessing(args.project_id, workers=args.workers, chunk_lines=args.chunk_lines, restart=args.restart)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
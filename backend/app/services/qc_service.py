@@ -0,0 +1,423 @@
+"""
+QC 规则引擎：把注册的规则批量跑在项目的全部样本上。
+
+- 规则用 @register_rule 注册，签名为 rule(sample) -> Optional[str]，
+  返回 None 表示通过，返回字符串表示命中（作为问题描述 detail）。
+- 样本分块后交给进程池并行评估；样本数不多时直接在当前进程里跑。
+- 每个样本的内容哈希记在 qc/qc_state.json 里，重跑时只评估内容变了的样本
+  （或版本变了 / 新增的规则），其余样本沿用上次的问题。
+- 结果流式写入 qc_issues.jsonl 的临时文件，写完再原子替换。
+  读改写 qc_issues.jsonl 的地方（规则 QC、去重）都持同一把项目锁，工作流里并发跑也不会互相覆盖。
+"""
+import hashlib
+import json
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.services.storage_service import get_qc_dir
+from app.utils.file_utils import atomic_write_json, atomic_write_jsonl, content_hash, iter_jsonl
+from app.utils.text_utils import norm_text
+from app.utils.time_utils import now_str
+
+
+RuleFunc = Callable[[Dict[str, Any]], Optional[str]]
+
+
+@dataclass(frozen=True)
+class QCRule:
+    name: str
+    issue_type: str
+    severity: str
+    version: int
+    func: RuleFunc
+
+
+_RULES: Dict[str, QCRule] = {}
+
+
+def register_rule(name: str, issue_type: str, severity: str = "medium", version: int = 1):
+    """
+    注册一条 QC 规则。规则逻辑改了就把 version +1，
+    下次运行时这条规则会在全部样本上重新评估。
+    """
+
+    def deco(func: RuleFunc) -> RuleFunc:
+        _RULES[name] = QCRule(name=name, issue_type=issue_type, severity=severity, version=version, func=func)
+        return func
+
+    return deco
+
+
+def list_rules() -> List[Dict[str, Any]]:
+    return [
+        {"name": r.name, "issueType": r.issue_type, "severity": r.severity, "version": r.version}
+        for r in _RULES.values()
+    ]
+
+
+# ====================== 内置规则 ======================
+
+_token_pattern = re.compile(r"[\u4e00-\u9fff]|[A-Za-z0-9]+")
+_negation_pattern = re.compile(r"(否认|无|未见|未闻及|未发现)[^。；;\n]{0,40}")
+
+
+def _estimate_tokens(text: str) -> int:
+    """粗略 token 数：中文按字、英文/数字按词计。"""
+    if not text:
+        return 0
+    return len(_token_pattern.findall(text))
+
+
+def _strip_negations(text: str) -> str:
+    return _negation_pattern.sub(" ", text or "")
+
+
+COT_MIN_TOKENS = 50
+
+_HIGH_RISK_LABELS = {"需紧急就诊"}
+_STABLE_LABELS = {"稳定"}
+_ACUTE_SYMPTOMS = ["胸痛", "呼吸困难", "晕厥", "出汗", "冷汗", "意识障碍", "咯血", "气促"]
+
+_EXAM_TERMS = [
+    "心电图",
+    "心脏彩超",
+    "超声",
+    "造影",
+    "CT",
+    "MRI",
+    "X线",
+    "胸片",
+    "肌钙蛋白",
+    "BNP",
+    "血常规",
+    "Holter",
+]
+
+
+@register_rule("rule_cot_min_length", f"COT 过短（< {COT_MIN_TOKENS} tokens）", severity="medium")
+def rule_cot_min_length(sample: Dict[str, Any]) -> Optional[str]:
+    tokens = _estimate_tokens(sample.get("cot_text") or "")
+    if tokens < COT_MIN_TOKENS:
+        return f"COT 约 {tokens} tokens"
+    return None
+
+
+@register_rule("rule_label_vs_symptom", "高危病例标签与症状不一致", severity="high", version=3)
+def rule_label_vs_symptom(sample: Dict[str, Any]) -> Optional[str]:
+    labels = set(sample.get("labels") or [])
+    # 急性症状按去掉否定后的原文匹配：特征库的症状抽取覆盖不到晕厥 / 冷汗 / 意识障碍等词，
+    # 只看抽取结果会把高危样本误判成“未见急性症状”；抽取结果只用来补充
+    text = _strip_negations(sample.get("raw_text") or "")
+    extracted = sample.get("symptoms") or []
+    acute = [s for s in _ACUTE_SYMPTOMS if s in text or any(s in x for x in extracted)]
+
+    if labels & _HIGH_RISK_LABELS and not acute:
+        return "标注为高危，但病历中未见急性症状"
+    if labels and labels <= _STABLE_LABELS and len(acute) >= 2:
+        return f"标注为稳定，但病历中出现急性症状：{'、'.join(acute)}"
+    return None
+
+
+@register_rule("rule_model_vs_human", "模型建议标签与人工标签冲突", severity="medium", version=2)
+def rule_model_vs_human(sample: Dict[str, Any]) -> Optional[str]:
+    # 两边都过 norm_text：特征库里的诊断已经归一化（全角冒号 / 括号），人工标签是原样的
+    model_labels = {norm_text(str(x)) for x in (sample.get("model_labels") or [])} - {""}
+    human_labels = {norm_text(str(x)) for x in (sample.get("labels") or [])} - {""}
+    if not model_labels or not human_labels:
+        return None
+    if model_labels.isdisjoint(human_labels):
+        return f"模型：{'、'.join(sorted(model_labels))}；人工：{'、'.join(sorted(human_labels))}"
+    return None
+
+
+@register_rule("rule_cot_hallucination", "可能出现幻想信息（COT 中出现不存在的检查结果）", severity="high")
+def rule_cot_hallucination(sample: Dict[str, Any]) -> Optional[str]:
+    cot = sample.get("cot_text") or ""
+    if not cot:
+        return None
+    raw = sample.get("raw_text") or ""
+    missing = [t for t in _EXAM_TERMS if t in cot and t not in raw]
+    if missing:
+        return f"COT 提到病历中没有的检查：{'、'.join(missing)}"
+    return None
+
+
+# ====================== 引擎 ======================
+
+_locks_guard = threading.Lock()
+_issue_locks: Dict[str, threading.Lock] = {}
+
+
+def _issues_lock(project_id: str) -> threading.Lock:
+    """qc_issues.jsonl 的读改写按项目串行：规则 QC 和去重会在工作流里并发跑。"""
+    with _locks_guard:
+        return _issue_locks.setdefault(project_id, threading.Lock())
+
+
+def get_qc_issues_path(project_id: str):
+    return get_qc_dir(project_id) / "qc_issues.jsonl"
+
+
+def get_qc_state_path(project_id: str):
+    return get_qc_dir(project_id) / "qc_state.json"
+
+
+def _issue_id(sample_id: str, rule_name: str) -> str:
+    # 固定 id：同一样本同一规则重跑后 id 不变，人工审核状态可以延续
+    h = hashlib.sha1(f"{sample_id}|{rule_name}".encode("utf-8")).hexdigest()[:10]
+    return f"QC-{h.upper()}"
+
+
+def _is_manual(issue: Dict[str, Any]) -> bool:
+    """id 不是 _issue_id 生成的：手工录入 / 引擎上线前的问题（例如 QC-0001）。"""
+    return issue.get("id") != _issue_id(str(issue.get("sampleId")), str(issue.get("ruleName")))
+
+
+def _carry_review(issue: Dict[str, Any], prev: Dict[str, Any]) -> None:
+    """把上一版问题的人工审核信息带到新问题上；上一版是手工录入的，记下它原来的 id。"""
+    for k in ("status", "lastReviewer", "createdAt", "legacyId"):
+        if k in prev:
+            issue[k] = prev[k]
+    if _is_manual(prev):
+        issue["legacyId"] = prev.get("id")
+
+
+def _evaluate_chunk(
+    project_id: str,
+    items: List[Tuple[Dict[str, Any], Tuple[str, ...]]],
+) -> Tuple[List[Dict[str, Any]], Dict[str, List[float]]]:
+    """
+    在 worker 进程里评估一批样本。items: [(sample, 要跑的规则名), ...]
+    返回 (命中的问题, {rule: [耗时秒, 评估数, 命中数]})。
+    """
+    issues: List[Dict[str, Any]] = []
+    stats: Dict[str, List[float]] = {}
+    created_at = now_str()
+
+    for sample, rule_names in items:
+        sample_id = str(sample.get("sample_id"))
+        for name in rule_names:
+            rule = _RULES.get(name)
+            if rule is None:
+                continue
+            st = stats.setdefault(name, [0.0, 0, 0])
+            t0 = time.perf_counter()
+            try:
+                detail = rule.func(sample)
+            except Exception as e:
+                # 单条规则出错不影响整批，记成一个问题方便排查
+                detail = f"规则执行异常：{e}"
+            st[0] += time.perf_counter() - t0
+            st[1] += 1
+            if detail is None:
+                continue
+            st[2] += 1
+            issues.append(
+                {
+                    "id": _issue_id(sample_id, name),
+                    "sampleId": sample_id,
+                    "projectId": project_id,
+                    "issueType": rule.issue_type,
+                    "ruleName": name,
+                    "severity": rule.severity,
+                    "status": "pending",
+                    "createdAt": created_at,
+                    "detail": detail,
+                }
+            )
+    return issues, stats
+
+
+def _chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i: i + size]
+
+
+def run_qc_rules(
+    project_id: str,
+    samples: List[Dict[str, Any]],
+    full: bool = False,
+    workers: Optional[int] = None,
+    chunk_size: int = 2000,
+) -> Dict[str, Any]:
+    """
+    对项目样本跑全部已注册规则，结果写入 qc/qc_issues.jsonl，返回运行报告。
+
+    samples 里每条至少要有 sample_id；规则会读 labels / cot_text / raw_text / model_labels，
+    以及特征库里的 symptoms（可选）。
+    full=True 时忽略上次的哈希，全部重新评估。
+    """
+    t_start = time.perf_counter()
+    issues_path = get_qc_issues_path(project_id)
+    state_path = get_qc_state_path(project_id)
+
+    rule_versions = {r.name: r.version for r in _RULES.values()}
+
+    prev_state: Dict[str, Any] = {}
+    if state_path.exists() and not full:
+        try:
+            prev_state = json.loads(state_path.read_text(encoding="utf-8"))
+        except Exception:
+            prev_state = {}
+    prev_rules: Dict[str, int] = prev_state.get("rules") or {}
+    prev_hashes: Dict[str, str] = prev_state.get("samples") or {}
+
+    # 版本变了或新增的规则：所有样本都要重跑这几条
+    changed_rules = tuple(n for n, v in rule_versions.items() if prev_rules.get(n) != v)
+    all_rules = tuple(rule_versions)
+
+    new_hashes: Dict[str, str] = {}
+    todo: List[Tuple[Dict[str, Any], Tuple[str, ...]]] = []
+    rerun_pairs = set()  # (sample_id, rule) 这次会重新评估的组合
+    for s in samples:
+        sid = str(s.get("sample_id"))
+        h = content_hash(s)
+        new_hashes[sid] = h
+        rules = all_rules if prev_hashes.get(sid) != h else changed_rules
+        if rules:
+            todo.append((s, rules))
+            rerun_pairs.update((sid, r) for r in rules)
+
+    with _issues_lock(project_id):
+        # 上次的问题：未注册规则的（手工录入等）原样保留；
+        # 已注册规则里，样本还在且这次没重跑的沿用；审核状态按 id 延续。
+        # 已注册规则下手工录入的问题（id 对不上）按 (样本, 规则) 匹配：
+        # 这次规则也报了就迁移成规则问题（沿用审核状态，legacyId 记原 id），没报就原样保留
+        prev_issues: List[Dict[str, Any]] = list(iter_jsonl(issues_path)) if issues_path.exists() else []
+        prev_by_id = {i.get("id"): i for i in prev_issues}
+        manual: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        kept: List[Dict[str, Any]] = []
+        for i in prev_issues:
+            if i.get("projectId") != project_id or i.get("ruleName") not in rule_versions:
+                kept.append(i)
+                continue
+            sid = str(i.get("sampleId"))
+            if _is_manual(i):
+                manual[(sid, i["ruleName"])] = i
+            elif sid in new_hashes and (sid, i.get("ruleName")) not in rerun_pairs:
+                kept.append(i)
+
+        if workers is None:
+            workers = max(1, min(multiprocessing.cpu_count(), 8))
+        rule_stats: Dict[str, List[float]] = {n: [0.0, 0, 0] for n in rule_versions}
+        counts = {"new": 0}
+
+        def merge(result: Tuple[List[Dict[str, Any]], Dict[str, List[float]]]) -> Iterator[Dict[str, Any]]:
+            issues, stats = result
+            for name, (sec, n_eval, n_hit) in stats.items():
+                acc = rule_stats.setdefault(name, [0.0, 0, 0])
+                acc[0] += sec
+                acc[1] += n_eval
+                acc[2] += n_hit
+            for issue in issues:
+                prev = manual.pop((issue["sampleId"], issue["ruleName"]), None) or prev_by_id.get(issue["id"])
+                if prev is None:
+                    counts["new"] += 1
+                else:
+                    _carry_review(issue, prev)  # 保留人工审核信息
+                yield issue
+
+        def evaluate() -> Iterator[Dict[str, Any]]:
+            if not todo:
+                return
+            if workers <= 1 or len(todo) <= chunk_size:
+                yield from merge(_evaluate_chunk(project_id, todo))
+                return
+            # spawn：uvicorn 进程里有线程，fork 可能带着锁进子进程
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+                futures = [pool.submit(_evaluate_chunk, project_id, c) for c in _chunks(todo, chunk_size)]
+                for fut in as_completed(futures):
+                    yield from merge(fut.result())
+
+        def stream() -> Iterator[Dict[str, Any]]:
+            yield from kept
+            yield from evaluate()
+            yield from manual.values()  # 这次规则没报的手工问题
+
+        total_issues = atomic_write_jsonl(issues_path, stream())
+        atomic_write_json(state_path, {"rules": rule_versions, "samples": new_hashes})
+
+    elapsed = time.perf_counter() - t_start
+    return {
+        "project_id": project_id,
+        "total_samples": len(samples),
+        "evaluated_samples": len(todo),
+        "skipped_samples": len(samples) - len(todo),
+        "issues_total": total_issues,
+        "issues_new": counts["new"],
+        "workers": workers,
+        "seconds": round(elapsed, 4),
+        "rules": {
+            name: {
+                "evaluated": int(n_eval),
+                "flagged": int(n_hit),
+                "seconds": round(sec, 4),
+                "samples_per_sec": round(n_eval / sec, 1) if sec > 0 else None,
+            }
+            for name, (sec, n_eval, n_hit) in rule_stats.items()
+        },
+    }
+
+
+def replace_rule_issues(
+    project_id: str,
+    rule_name: str,
+    issues: List[Dict[str, Any]],
+    severity: str = "low",
+) -> Dict[str, int]:
+    """
+    用一批新问题整体替换某条“非逐样本”规则（例如去重）的问题，
+    其他规则的问题原样保留；同一样本的审核状态按 id 延续。
+    这条规则下手工录入的问题和 run_qc_rules 一样处理：再次报出就迁移，否则保留。
+    issues 每条至少要有 sampleId / issueType，可带 detail。
+    """
+    issues_path = get_qc_issues_path(project_id)
+    with _issues_lock(project_id):
+        prev_issues = list(iter_jsonl(issues_path)) if issues_path.exists() else []
+        prev_by_id = {i.get("id"): i for i in prev_issues if i.get("ruleName") == rule_name}
+        manual = {
+            str(i.get("sampleId")): i
+            for i in prev_issues
+            if i.get("ruleName") == rule_name and i.get("projectId") == project_id and _is_manual(i)
+        }
+        created_at = now_str()
+        counts = {"new": 0, "total": 0}
+
+        def stream() -> Iterator[Dict[str, Any]]:
+            for i in prev_issues:
+                if i.get("ruleName") == rule_name and i.get("projectId") == project_id:
+                    continue
+                yield i
+            for item in issues:
+                sid = str(item["sampleId"])
+                issue = {
+                    "id": _issue_id(sid, rule_name),
+                    "sampleId": sid,
+                    "projectId": project_id,
+                    "issueType": item["issueType"],
+                    "ruleName": rule_name,
+                    "severity": item.get("severity", severity),
+                    "status": "pending",
+                    "createdAt": created_at,
+                }
+                if item.get("detail"):
+                    issue["detail"] = item["detail"]
+                prev = manual.pop(sid, None) or prev_by_id.get(issue["id"])
+                if prev is None:
+                    counts["new"] += 1
+                else:
+                    _carry_review(issue, prev)
+                counts["total"] += 1
+                yield issue
+            for issue in manual.values():
+                counts["total"] += 1
+                yield issue
+
+        atomic_write_jsonl(issues_path, stream())
+    return counts
@@ -0,0 +1,200 @@
+"""
+工作流：按 DAG 调度节点（预处理 / 去重 / 构图 / QC / LLM 抽取 / 导出 ...），代替手工按顺序调接口。
+
+    - 上游都成功（或命中缓存）的节点进入就绪队列，提交到线程池，互不依赖的分支并发执行；
+      CPU 重的节点（预处理、QC、分片解析）内部本来就按块分给进程池，
+      节点层用线程即可，也能共用进程内的 KG 缓存；
+    - 每个节点由 node_execution_service 执行：输入没变就复用缓存的 output，记录耗时；
+    - 节点失败时它的所有下游标成 skipped，不相关的分支照常跑完；
+    - 工作流定义存 workflows/<workflow_id>.json，运行记录追加到 workflows/<workflow_id>.runs.jsonl。
+
+没保存过的 "default" 工作流用 default_workflow() 的内置流程。
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Collection, Dict, List, Optional, Union
+
+from app.models.workflow import Workflow, WorkflowRun
+from app.models.workflow_node import NodeRun, WorkflowNode
+from app.services import node_execution_service
+from app.services.storage_service import get_project_dir
+from app.utils.file_utils import atomic_write_json, iter_jsonl
+from app.utils.time_utils import now_str
+
+DEFAULT_WORKFLOW_ID = "default"
+MAX_WORKERS = int(os.getenv("WORKFLOW_MAX_WORKERS") or 4)
+
+_workflow_id_pattern = re.compile(r"^[A-Za-z0-9_\-]{1,64}$")
+
+_running_lock = threading.Lock()
+_running: set = set()
+_runs_write_lock = threading.Lock()
+
+
+def get_workflows_dir(project_id: str) -> Path:
+    return get_project_dir(project_id) / "workflows"
+
+
+def _workflow_path(project_id: str, workflow_id: str) -> Path:
+    if not _workflow_id_pattern.match(workflow_id):
+        raise ValueError(f"invalid workflow id: {workflow_id}")
+    return get_workflows_dir(project_id) / f"{workflow_id}.json"
+
+
+def _runs_path(project_id: str, workflow_id: str) -> Path:
+    return get_workflows_dir(project_id) / f"{workflow_id}.runs.jsonl"
+
+
+def default_workflow(project_id: str) -> Workflow:
+    """
+    内置流程：两条互不依赖的分支并发——
+    预处理 -> QC，和 去重 -> 构图；两边都完成后导出。
+    """
+    return Workflow(
+        workflow_id=DEFAULT_WORKFLOW_ID,
+        project_id=project_id,
+        name="预处理 / 去重 / 构图 / QC / 导出",
+        nodes=[
+            WorkflowNode(id="preprocess", type="preprocess", title="原始数据 -> 标注输入"),
+            WorkflowNode(id="qc", type="qc", depends_on=["preprocess"], title="QC 规则"),
+            WorkflowNode(id="dedup", type="dedup", title="近重复检测"),
+            WorkflowNode(id="kg", type="build_kg", depends_on=["dedup"], title="构建知识图谱"),
+            WorkflowNode(id="export", type="export", depends_on=["kg", "qc"], title="导出 Parquet"),
+        ],
+    )
+
+
+def validate(workflow: Workflow) -> List[str]:
+    """校验节点类型和 DAG 结构，返回拓扑序；不合法时抛 ValueError。"""
+    for n in workflow.nodes:
+        node_execution_service.get_node_type(n.type)
+    return workflow.topo_order()
+
+
+def save_workflow(workflow: Workflow) -> Workflow:
+    validate(workflow)
+    atomic_write_json(_workflow_path(workflow.project_id, workflow.workflow_id), workflow.to_dict())
+    return workflow
+
+
+def load_workflow(project_id: str, workflow_id: str) -> Workflow:
+    path = _workflow_path(project_id, workflow_id)
+    if not path.exists():
+        if workflow_id == DEFAULT_WORKFLOW_ID:
+            return default_workflow(project_id)
+        raise FileNotFoundError(f"workflow not found: {workflow_id}")
+    return Workflow.from_dict(json.loads(path.read_text(encoding="utf-8")))
+
+
+def list_runs(project_id: str, workflow_id: str) -> List[WorkflowRun]:
+    path = _runs_path(project_id, workflow_id)
+    if not path.exists():
+        return []
+    return [WorkflowRun.from_dict(d) for d in iter_jsonl(path)]
+
+
+def _append_run(run: WorkflowRun) -> None:
+    path = _runs_path(run.project_id, run.workflow_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _runs_write_lock:
+        with path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(run.to_dict(), ensure_ascii=False) + "\n")
+
+
+def run_workflow(
+    workflow: Workflow,
+    max_workers: Optional[int] = None,
+    force: Union[bool, Collection[str]] = False,
+) -> WorkflowRun:
+    """
+    执行整个 DAG，返回运行记录。force=True 时全部节点忽略缓存；
+    也可以传节点 id 列表，只强制重跑这些节点和它们的下游。
+    同一个工作流同时只能有一个运行。
+    """
+    order = validate(workflow)
+    nodes = workflow.node_map()
+    forced = set(nodes) if force is True else set(force or ())
+    unknown = forced - set(nodes)
+    if unknown:
+        raise ValueError(f"unknown node id in force: {', '.join(sorted(unknown))}")
+
+    run_key = f"{workflow.project_id}/{workflow.workflow_id}"
+    with _running_lock:
+        if run_key in _running:
+            raise RuntimeError(f"workflow {workflow.workflow_id} is already running")
+        _running.add(run_key)
+
+    t0 = time.perf_counter()
+    run = WorkflowRun(
+        run_id=uuid.uuid4().hex[:12],
+        workflow_id=workflow.workflow_id,
+        project_id=workflow.project_id,
+        started_at=now_str(),
+        max_workers=max(1, int(max_workers or MAX_WORKERS)),
+        nodes={nid: NodeRun(node_id=nid, node_type=nodes[nid].type) for nid in order},
+    )
+    children: Dict[str, List[str]] = {nid: [] for nid in order}
+    waiting = {nid: len(nodes[nid].depends_on) for nid in order}
+    for nid in order:
+        for dep in nodes[nid].depends_on:
+            children[dep].append(nid)
+    # 强制重跑的节点产物变了，下游也一起重跑（缓存键只看上游的键，看不出产物内容变化）
+    for nid in order:
+        if nid in forced:
+            forced.update(children[nid])
+
+    def skip_descendants(failed: str) -> None:
+        stack = list(children[failed])
+        while stack:
+            c = stack.pop()
+            if run.nodes[c].status == "pending":
+                run.nodes[c].status = "skipped"
+                run.nodes[c].error = f"upstream node {failed} did not succeed"
+                stack.extend(children[c])
+
+    try:
+        with ThreadPoolExecutor(max_workers=run.max_workers, thread_name_prefix="workflow") as pool:
+            inflight: Dict[Future, str] = {}
+
+            def submit(nid: str) -> None:
+                node = nodes[nid]
+                run.nodes[nid].status = "running"
+                upstream = {d: run.nodes[d] for d in node.depends_on}
+                fut = pool.submit(
+                    node_execution_service.execute_node, workflow.project_id, node, upstream, nid in forced
+                )
+                inflight[fut] = nid
+
+            for nid in order:
+                if waiting[nid] == 0:
+                    submit(nid)
+            while inflight:
+                finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    nid = inflight.pop(fut)
+                    result = fut.result()
+                    run.nodes[nid] = result
+                    if not result.ok:
+                        skip_descendants(nid)
+                        continue
+                    for c in children[nid]:
+                        waiting[c] -= 1
+                        if waiting[c] == 0 and run.nodes[c].status == "pending":
+                            submit(c)
+        run.status = "success" if all(r.ok for r in run.nodes.values()) else "failed"
+    except BaseException:
+        run.status = "failed"
+        raise
+    finally:
+        run.finished_at = now_str()
+        run.seconds = round(time.perf_counter() - t0, 4)
+        _append_run(run)
+        with _running_lock:
+            _running.discard(run_key)
+    return run
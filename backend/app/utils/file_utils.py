@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+
+def iter_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """逐行读取 jsonl（跳过空行），不会一次性读入整个文件。"""
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            yield json.loads(line)
+
+
+def atomic_write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> int:
+    """
+    流式写 jsonl：先写同目录下的临时文件，写完再 os.replace 覆盖目标。
+    中途出错不会留下写了一半的目标文件。返回写入行数。
+    """
+    return atomic_write_lines(path, (json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+
+
+def atomic_write_lines(path: Path, lines: Iterable[str]) -> int:
+    """同 atomic_write_jsonl，写已经序列化好的行（每行自带换行符）。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    n = 0
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(line)
+                n += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+    return n
+
+
+def atomic_write_json(path: Path, obj: Any) -> None:
+    """同 atomic_write_jsonl，写单个 json 文档（状态文件 / manifest 用）。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def atomic_write_chunks(
+    path: Path,
+    chunks: Iterable[bytes],
+    before_replace: Optional[Callable[[], None]] = None,
+) -> int:
+    """
+    同 atomic_write_jsonl，写二进制块。before_replace 在替换目标前调用（比如校验和），
+    抛异常则放弃这次写入。返回写入字节数。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    n = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                n += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        if before_replace is not None:
+            before_replace()
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except FileNotFoundError:
+            pass
+        raise
+    return n
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    atomic_write_chunks(path, [data])
+
+
+def content_hash(obj: Any) -> str:
+    """对任意可 json 序列化的对象求稳定哈希（key 排序），用于增量判断。"""
+    data = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
@@ -0,0 +1,164 @@
+"""
+病历文本的规则抽取（段落、症状、病患 id、日期）。
+
+正则都在模块加载时编译一次；这些函数的输出会被 feature_store 持久化，
+所以改动抽取逻辑时记得同步提升 feature_store.EXTRACTOR_VERSIONS 里对应的版本号。
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional
+
+_SYM_SUFFIXES = [
+    "痛",
+    "热",
+    "咳嗽",
+    "咳痰",
+    "咯血",
+    "胸闷",
+    "胸痛",
+    "心慌",
+    "心悸",
+    "气促",
+    "气短",
+    "呼吸困难",
+    "头晕",
+    "乏力",
+    "出汗",
+    "水肿",
+    "发绀",
+    "恶心",
+    "呕吐",
+    "腹痛",
+    "腹泻",
+    "便血",
+    "便秘",
+    "尿频",
+    "尿急",
+    "尿痛",
+    "血尿",
+    "畏寒",
+    "发热",
+    "咽痛",
+    "纳差",
+    "消瘦",
+    "失眠",
+]
+
+_SYM_KEYWORDS = [
+    "咳嗽",
+    "咳痰",
+    "咯血",
+    "胸闷",
+    "胸痛",
+    "心慌",
+    "心悸",
+    "气促",
+    "气短",
+    "呼吸困难",
+    "头晕",
+    "乏力",
+    "出汗",
+    "水肿",
+    "发绀",
+    "恶心",
+    "呕吐",
+    "腹痛",
+    "腹泻",
+    "便血",
+    "便秘",
+    "尿频",
+    "尿急",
+    "尿痛",
+    "血尿",
+    "畏寒",
+    "发热",
+    "咽痛",
+    "纳差",
+    "消瘦",
+    "失眠",
+]
+
+# 症状抽取用到的“段落”字段
+SYMPTOM_SECTIONS = ["主诉", "现病史", "体格检查", "病例特点"]
+
+_ws_pattern = re.compile(r"\s+")
+_trailing_q_pattern = re.compile(r"[？?]+$")
+_negation_pattern = re.compile(r"(否认|无|未见|未闻及|未发现)[^。；;\n]{0,40}")
+# 后缀抓“xxx痛/xxx热”这类
+_suffix_patterns = [
+    re.compile(rf"[\u4e00-\u9fff]{{1,8}}{suf}") for suf in _SYM_SUFFIXES if suf in ("痛", "热")
+]
+_SUFFIX_STOPWORDS = ["检查", "诊断", "治疗", "病史"]
+
+_patient_id_pattern = re.compile(r"病患id：([^｜\|]+)")
+_visit_date_pattern = re.compile(r"日期：(\d{4}-\d{2}-\d{2})")
+
+
+def norm_text(s: str) -> str:
+    if not s:
+        return ""
+    s = s.strip()
+    # 统一中英文括号/冒号/空格
+    s = s.replace("（", "(").replace("）", ")")
+    s = s.replace("：", ":")
+    s = _ws_pattern.sub(" ", s)
+    # 去掉末尾问号等
+    s = _trailing_q_pattern.sub("", s)
+    return s.strip()
+
+
+@lru_cache(maxsize=64)
+def _section_pattern(key: str) -> "re.Pattern[str]":
+    # 例如："主诉": "反复心慌、气促4年， "
+    return re.compile(rf"\"{re.escape(key)}\"\s*:\s*\"(.*?)\"", re.DOTALL)
+
+
+def extract_section(emr_text: str, key: str) -> str:
+    """从 prompt 里的 pseudo-json 中抽取某个字段（主诉/现病史/体格检查/病例特点）。"""
+    if not emr_text:
+        return ""
+    m = _section_pattern(key).search(emr_text)
+    if not m:
+        return ""
+    val = m.group(1)
+    return val.replace("\\n", "\n").strip()
+
+
+def extract_symptoms(text: str) -> List[str]:
+    """非常粗糙的症状抽取（先做 MVP）：靠常见后缀词 + 去否定。"""
+    if not text:
+        return []
+    # 简单去掉“无/否认/未见”等否定句中的片段（不完美，但能减少噪声）
+    t = _negation_pattern.sub(" ", text)
+
+    found: List[str] = []
+
+    # 1) 先抓固定词（咳嗽/心慌/气促等）
+    for kw in _SYM_KEYWORDS:
+        if kw in t:
+            found.append(kw)
+
+    # 2) 再用后缀抓一些“xxx痛/xxx热”这类
+    for pat in _suffix_patterns:
+        for m in pat.finditer(t):
+            cand = m.group(0)
+            # 过滤一些明显不是症状的（例如“检查”）
+            if any(bad in cand for bad in _SUFFIX_STOPWORDS):
+                continue
+            found.append(cand)
+
+    # 去重 + 统一
+    found = [norm_text(x) for x in found if x and len(x) <= 20]
+    # 过滤过短/过泛
+    found = [x for x in found if len(x) >= 2]
+    return sorted(set(found))
+
+
+def extract_patient_id(text: str) -> Optional[str]:
+    m = _patient_id_pattern.search(text or "")
+    return m.group(1).strip() if m else None
+
+
+def extract_visit_date(text: str) -> Optional[str]:
+    m = _visit_date_pattern.search(text or "")
+    return m.group(1) if m else None
@@ -0,0 +1,6 @@
+import time
+
+
+def now_str() -> str:
+    """本地时间，精确到分钟，和 qc_issues.jsonl 里 createdAt 的展示粒度一致。"""
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime())
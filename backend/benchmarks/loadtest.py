@@ -0,0 +1,455 @@
+"""
+端到端压测：在合成项目上起一个真实的 uvicorn 进程，用异步客户端按配置的比例并发打
+list_labeling_samples / get_medthink_sample / kg_graph / kg_diagnose / kg_diagnose_from_text，
+按路由统计吞吐、p50 / p95 / p99 延迟和错误率，输出 JSON 报告。
+
+LLM 换成本地 mock（LLM_BACKEND=mock，见 app/engines/llm/mock_llm_client.py），
+延迟 / 抖动 / 失败率用 --llm-latency-ms / --llm-jitter-ms / --llm-error-rate 配置。
+
+两种施压方式：
+    默认闭环：--concurrency 个虚拟用户，每个收到响应后立刻发下一个，测的是最大吞吐；
+    --rate R：开环，按泊松到达每秒 R 个请求，延迟从“计划发出时间”算起，
+              服务端排队造成的等待也算进去（不会因为慢了就少发，p99 不会被低估）。
+
+用法（在 backend/ 下）：
+    python -m benchmarks.loadtest --records 5000 --concurrency 32 --duration 30 --out load_report.json
+    python -m benchmarks.loadtest --rate 50 --mix list_labeling_samples=1,kg_diagnose_from_text=1
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --project-id p1   # 压已经在跑的实例
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.run_benchmarks import _git_commit
+from benchmarks.synth_data import generate_project
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+DEFAULT_MIX = "list_labeling_samples=35,get_medthink_sample=25,kg_graph=15,kg_diagnose=15,kg_diagnose_from_text=10"
+
+
+# ====================== 请求构造 ======================
+
+@dataclass
+class Corpus:
+    """压测前从被测实例上取到的样本 id / 症状 / 疾病，请求参数从这里随机抽。"""
+
+    project_id: str
+    total_samples: int
+    sample_ids: List[str]
+    symptoms: List[str]
+    diseases: List[str]
+
+
+Request = Tuple[str, str, Dict[str, Any]]  # (method, path, httpx 参数)
+
+
+def _req_list_labeling_samples(c: Corpus, rng: random.Random) -> Request:
+    offset = rng.randrange(max(1, c.total_samples - 30 + 1))
+    return "GET", f"/api/v1/projects/{c.project_id}/labeling/samples", {"params": {"limit": 30, "offset": offset}}
+
+
+def _req_get_medthink_sample(c: Corpus, rng: random.Random) -> Request:
+    return "GET", f"/api/v1/medthink/samples/{rng.choice(c.sample_ids)}", {"params": {"project_id": c.project_id}}
+
+
+def _req_kg_graph(c: Corpus, rng: random.Random) -> Request:
+    params: Dict[str, Any] = {"max_nodes": 400}
+    if c.diseases and rng.random() < 0.5:  # 一半看全图默认视图，一半以某个疾病为中心展开
+        params.update(center=rng.choice(c.diseases), depth=2)
+    return "GET", f"/api/v1/projects/{c.project_id}/kg/graph", {"params": params}
+
+
+def _req_kg_diagnose(c: Corpus, rng: random.Random) -> Request:
+    syms = rng.sample(c.symptoms, k=min(len(c.symptoms), rng.randint(2, 4)))
+    return "POST", f"/api/v1/projects/{c.project_id}/kg/diagnose", {"json": {"symptoms": syms}}
+
+
+def _req_kg_diagnose_from_text(c: Corpus, rng: random.Random) -> Request:
+    syms = rng.sample(c.symptoms, k=min(len(c.symptoms), rng.randint(3, 5)))
+    parts = [f"最近{syms[0]}"] + syms[1:-1] + [f"没有{syms[-1]}"]
+    return "POST", f"/api/v1/projects/{c.project_id}/kg/diagnose_from_text", {"json": {"text": "，".join(parts)}}
+
+
+ROUTES: Dict[str, Callable[[Corpus, random.Random], Request]] = {
+    "list_labeling_samples": _req_list_labeling_samples,
+    "get_medthink_sample": _req_get_medthink_sample,
+    "kg_graph": _req_kg_graph,
+    "kg_diagnose": _req_kg_diagnose,
+    "kg_diagnose_from_text": _req_kg_diagnose_from_text,
+}
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """"kg_graph=2,kg_diagnose=1" -> {路由: 权重}；只写路由名时权重为 1。"""
+    mix: Dict[str, float] = {}
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"unknown route in mix: {name} (expected one of {', '.join(ROUTES)})")
+        mix[name] = float(weight) if weight else 1.0
+    mix = {k: v for k, v in mix.items() if v > 0}
+    if not mix:
+        raise ValueError("empty route mix")
+    return mix
+
+
+async def build_corpus(client: httpx.AsyncClient, project_id: str, rng: random.Random) -> Corpus:
+    r = await client.get(f"/api/v1/projects/{project_id}/labeling/samples", params={"limit": 1})
+    r.raise_for_status()
+    total = int(r.json().get("total") or 0)
+    if total == 0:
+        raise RuntimeError(f"project {project_id} has no labeling samples")
+
+    # 随机取几页拿 sample_id，不依赖合成数据的编号规则，压已有实例时也能用
+    sample_ids: List[str] = []
+    for _ in range(20):
+        r = await client.get(
+            f"/api/v1/projects/{project_id}/labeling/samples",
+            params={"limit": 50, "offset": rng.randrange(max(1, total - 50 + 1))},
+        )
+        r.raise_for_status()
+        sample_ids.extend(str(it["sample_id"]) for it in r.json().get("items") or [])
+
+    r = await client.get(f"/api/v1/projects/{project_id}/kg/graph", params={"max_nodes": 400})
+    r.raise_for_status()
+    nodes = r.json().get("nodes") or []
+    symptoms = [n["id"] for n in nodes if n.get("type") == "symptom"]
+    diseases = [n["id"] for n in nodes if n.get("type") == "disease"]
+    if not sample_ids or not symptoms:
+        raise RuntimeError(f"project {project_id} has no samples / symptom nodes to build requests from")
+    return Corpus(
+        project_id=project_id,
+        total_samples=total,
+        sample_ids=sorted(set(sample_ids)),
+        symptoms=symptoms,
+        diseases=diseases,
+    )
+
+
+# ====================== 施压 ======================
+
+@dataclass
+class RouteStats:
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, latency_ms: float, status: str, ok: bool) -> None:
+        self.latencies_ms.append(latency_ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not ok:
+            self.errors += 1
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """最近秩法（nearest-rank）分位数，q 取 0~100。"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(-(-q * len(sorted_values) // 100)))  # ceil(q/100 * n)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadRunner:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        corpus: Corpus,
+        mix: Dict[str, float],
+        seed: int,
+    ):
+        self.client = client
+        self.corpus = corpus
+        self.routes = list(mix)
+        self.weights = [mix[r] for r in self.routes]
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, RouteStats] = {r: RouteStats() for r in self.routes}
+        self.measure_from = 0.0  # 早于这个时间发出的请求算预热，不计入统计
+
+    async def _one(self, route: str, scheduled: Optional[float] = None) -> None:
+        method, path, kw = ROUTES[route](self.corpus, self.rng)
+        t0 = time.perf_counter() if scheduled is None else scheduled
+        try:
+            r = await self.client.request(method, path, **kw)
+            status, ok = str(r.status_code), r.status_code < 400
+        except httpx.HTTPError as e:
+            status, ok = type(e).__name__, False
+        if t0 >= self.measure_from:
+            self.stats[route].add((time.perf_counter() - t0) * 1000, status, ok)
+
+    def _pick(self) -> str:
+        return self.rng.choices(self.routes, weights=self.weights)[0]
+
+    async def run_closed(self, concurrency: int, warmup_s: float, duration_s: float) -> float:
+        start = time.perf_counter()
+        self.measure_from = start + warmup_s
+        deadline = self.measure_from + duration_s
+
+        async def user() -> None:
+            while time.perf_counter() < deadline:
+                await self._one(self._pick())
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        return time.perf_counter() - self.measure_from
+
+    async def run_open(self, rate: float, concurrency: int, warmup_s: float, duration_s: float) -> float:
+        start = time.perf_counter()
+        self.measure_from = start + warmup_s
+        deadline = self.measure_from + duration_s
+        sem = asyncio.Semaphore(concurrency)  # 连接数上限；排队等连接的时间也算进延迟
+        tasks = []
+
+        async def fire(route: str, scheduled: float) -> None:
+            async with sem:
+                await self._one(route, scheduled)
+
+        t = start
+        while True:
+            t += self.rng.expovariate(rate)
+            if t >= deadline:
+                break
+            delay = t - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(fire(self._pick(), t)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - self.measure_from
+
+    def report(self, elapsed_s: float) -> Dict[str, Any]:
+        def summarize(latencies: List[float], errors: int, statuses: Dict[str, int]) -> Dict[str, Any]:
+            values = sorted(latencies)
+            n = len(values)
+            return {
+                "requests": n,
+                "errors": errors,
+                "error_rate": round(errors / n, 4) if n else 0.0,
+                "rps": round(n / elapsed_s, 2) if elapsed_s > 0 else None,
+                "mean_ms": round(sum(values) / n, 2) if n else None,
+                "p50_ms": _round(percentile(values, 50)),
+                "p95_ms": _round(percentile(values, 95)),
+                "p99_ms": _round(percentile(values, 99)),
+                "max_ms": _round(values[-1] if values else None),
+                "statuses": dict(sorted(statuses.items())),
+            }
+
+        routes = {
+            name: summarize(s.latencies_ms, s.errors, s.statuses) for name, s in self.stats.items()
+        }
+        all_statuses: Dict[str, int] = {}
+        for s in self.stats.values():
+            for k, v in s.statuses.items():
+                all_statuses[k] = all_statuses.get(k, 0) + v
+        overall = summarize(
+            [x for s in self.stats.values() for x in s.latencies_ms],
+            sum(s.errors for s in self.stats.values()),
+            all_statuses,
+        )
+        return {"elapsed_s": round(elapsed_s, 3), "overall": overall, "routes": routes}
+
+
+def _round(v: Optional[float]) -> Optional[float]:
+    return round(v, 2) if v is not None else None
+
+
+# ====================== 被测进程 ======================
+
+def _free_port(host: str) -> int:
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+def start_server(
+    host: str,
+    port: int,
+    workers: int,
+    data_root: Path,
+    project_id: str,
+    llm_env: Dict[str, str],
+) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(llm_env)
+    env.update(
+        {
+            "MEDITAG_DATA_ROOT": str(data_root),
+            "LLM_BACKEND": "mock",
+            "KG_WARMUP_PROJECTS": project_id,  # 启动时预热 KG，/readyz 变 200 再开始压
+        }
+    )
+    cmd = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", host, "--port", str(port),
+        "--workers", str(workers),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+
+
+async def wait_ready(base_url: str, proc: Optional[subprocess.Popen], timeout_s: float) -> None:
+    deadline = time.perf_counter() + timeout_s
+    async with httpx.AsyncClient(base_url=base_url, timeout=5) as client:
+        while time.perf_counter() < deadline:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode} before becoming ready")
+            try:
+                if (await client.get("/readyz")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"server at {base_url} not ready after {timeout_s} s")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ====================== 入口 ======================
+
+async def run(args: argparse.Namespace, base_url: str, mix: Dict[str, float]) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        corpus = await build_corpus(client, args.project_id, random.Random(args.seed))
+        print(
+            f"corpus: {corpus.total_samples} samples, {len(corpus.sample_ids)} ids, "
+            f"{len(corpus.symptoms)} symptoms, {len(corpus.diseases)} diseases",
+            file=sys.stderr,
+        )
+        runner = LoadRunner(client, corpus, mix, args.seed)
+        if args.rate:
+            elapsed = await runner.run_open(args.rate, args.concurrency, args.warmup, args.duration)
+        else:
+            elapsed = await runner.run_closed(args.concurrency, args.warmup, args.duration)
+    return runner.report(elapsed)
+
+
+def print_table(result: Dict[str, Any]) -> None:
+    header = f"  {'route':<24}{'reqs':>8}{'rps':>9}{'err%':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"
+    print(header, file=sys.stderr)
+    rows = list(result["routes"].items()) + [("TOTAL", result["overall"])]
+    for name, r in rows:
+        def fmt(v: Optional[float]) -> str:
+            return f"{v:10.1f}" if v is not None else f"{'-':>10}"
+
+        print(
+            f"  {name:<24}{r['requests']:>8}{(r['rps'] or 0):>9.1f}{r['error_rate'] * 100:>7.2f}%"
+            f"{fmt(r['p50_ms'])}{fmt(r['p95_ms'])}{fmt(r['p99_ms'])}{fmt(r['max_ms'])}",
+            file=sys.stderr,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MediTag 端到端压测")
+    parser.add_argument("--url", default=None, help="压已经在跑的实例；不给时在合成数据上起一个 uvicorn")
+    parser.add_argument("--project-id", default=None, help="默认 load_<records>")
+    parser.add_argument("--records", type=int, default=5000, help="合成项目的记录数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-root", type=Path, default=None, help="默认用临时目录")
+    parser.add_argument("--reuse-data", action="store_true", help="数据已存在时不重新生成")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="默认随机空闲端口")
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn --workers")
+    parser.add_argument("--boot-timeout", type=float, default=300, help="等 /readyz 的秒数（含 KG 预热）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="路由=权重，逗号分隔")
+    parser.add_argument("--concurrency", type=int, default=32, help="闭环的虚拟用户数 / 开环的连接数上限")
+    parser.add_argument("--rate", type=float, default=None, help="开环：每秒请求数（泊松到达）")
+    parser.add_argument("--duration", type=float, default=30, help="统计时长（秒）")
+    parser.add_argument("--warmup", type=float, default=5, help="开头不计入统计的秒数")
+    parser.add_argument("--timeout", type=float, default=30, help="单个请求超时（秒）")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--out", type=Path, default=None, help="报告输出路径（默认打印到 stdout）")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if args.project_id is None:
+        args.project_id = "p1" if args.url else f"load_{args.records}"
+
+    proc: Optional[subprocess.Popen] = None
+    data_root: Optional[Path] = None
+    llm_env = {
+        "MOCK_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "MOCK_LLM_JITTER_MS": str(args.llm_jitter_ms),
+        "MOCK_LLM_ERROR_RATE": str(args.llm_error_rate),
+    }
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        data_root = args.data_root or Path(tempfile.mkdtemp(prefix="meditag_load_"))
+        raw_path = data_root / "projects" / args.project_id / "raw" / "med_think_responses.jsonl"
+        if not (args.reuse_data and raw_path.exists()):
+            t0 = time.perf_counter()
+            generate_project(data_root, args.project_id, args.records, seed=args.seed)
+            print(f"generated {args.project_id} in {time.perf_counter() - t0:.2f} s", file=sys.stderr)
+        port = args.port or _free_port(args.host)
+        base_url = f"http://{args.host}:{port}"
+        proc = start_server(args.host, port, args.server_workers, data_root, args.project_id, llm_env)
+
+    try:
+        t0 = time.perf_counter()
+        asyncio.run(wait_ready(base_url, proc, args.boot_timeout))
+        boot_s = round(time.perf_counter() - t0, 3)
+        print(f"server ready at {base_url} in {boot_s} s", file=sys.stderr)
+        result = asyncio.run(run(args, base_url, mix))
+    finally:
+        if proc is not None:
+            stop_server(proc)
+
+    print_table(result)
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seed": args.seed,
+            "base_url": base_url,
+            "project_id": args.project_id,
+            "records": None if args.url else args.records,
+            "data_root": str(data_root) if data_root else None,
+            "server_workers": None if args.url else args.server_workers,
+            "boot_seconds": boot_s,
+            "mode": "open" if args.rate else "closed",
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "mix": mix,
+            # 压已有实例时 LLM 用的是那边的配置，这里的参数不生效
+            "llm": None if args.url else {k.lower(): float(v) for k, v in llm_env.items()},
+        },
+        **result,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
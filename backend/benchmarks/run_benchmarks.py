@@ -0,0 +1,212 @@
+"""
+热点路径基准测试：在合成数据上跑 load_medthink_samples / build_kg / _subgraph /
+kg_search / kg_diagnose / kg_triage / kg_graph / 标注列表接口，记录耗时和峰值内存，
+输出 JSON 报告，方便不同 commit 之间对比。
+
+用法（在 backend/ 下）：
+    python -m benchmarks.run_benchmarks --scales 1000,10000 --out bench_report.json
+    python -m benchmarks.run_benchmarks --scales 1000 --baseline old_report.json
+
+注意：数据目录要在 import main 之前通过 MEDITAG_DATA_ROOT 指定，
+所以本脚本先设置环境变量、生成数据，再 import main。
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from starlette.requests import Request
+
+from benchmarks.synth_data import generate_project
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _measure(fn: Callable[[], Any], repeat: int, setup: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """
+    先跑 repeat 次只计时（不开 tracemalloc，避免拖慢），再单独跑一次测峰值内存。
+    setup 在每次运行前调用（例如清 build_kg 缓存，保证测的是冷启动）。
+    """
+    times: List[float] = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "repeat": repeat,
+        "min_s": round(min(times), 6),
+        "median_s": round(statistics.median(times), 6),
+        "max_s": round(max(times), 6),
+        "peak_mb": round(peak / (1024 * 1024), 3),
+    }
+
+
+def run_scale(main_mod: Any, project_id: str, n_records: int, repeat: int) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+
+    def record(op: str, fn: Callable[[], Any], setup: Optional[Callable[[], None]] = None, r: int = repeat):
+        res = _measure(fn, r, setup)
+        res.update({"scale": n_records, "op": op})
+        results.append(res)
+        print(
+            f"  {op:<28} median {res['median_s'] * 1000:10.2f} ms   peak {res['peak_mb']:9.2f} MB",
+            file=sys.stderr,
+        )
+
+    def cold() -> None:
+        main_mod.invalidate_kg(project_id)
+
+    record("load_medthink_samples", lambda: main_mod.load_medthink_samples(project_id))
+    record("build_kg(cold)", lambda: main_mod.build_kg(project_id), setup=cold)
+
+    kg = main_mod.build_kg(project_id)
+    diseases = sorted(
+        (n for n in kg["nodes"].values() if n["type"] == "disease"),
+        key=lambda n: -int(n.get("count") or 0),
+    )
+    symptoms = sorted(
+        (n for n in kg["nodes"].values() if n["type"] == "symptom"),
+        key=lambda n: -int(n.get("count") or 0),
+    )
+    center = diseases[0]["id"] if diseases else ""
+    query_syms = [n["id"] for n in symptoms[:3]]
+
+    record("_subgraph(depth=2,max=400)", lambda: main_mod._subgraph(kg, center=center, depth=2, max_nodes=400))
+    record("kg_search", lambda: main_mod.kg_search(project_id, q="痛", limit=50))
+    record("kg_diagnose", lambda: main_mod.kg_diagnose(project_id, {"symptoms": query_syms}))
+    main_mod.kg_triage(project_id, {"symptoms": query_syms})  # 先建好传播矩阵，只测单次请求
+    record("kg_triage", lambda: main_mod.kg_triage(project_id, {"symptoms": query_syms[:2], "absent": query_syms[2:]}))
+    # 直接调用接口函数，不经过 HTTP；kg_graph 只在 format=compact 时读请求头
+    request = Request({"type": "http", "headers": []})
+    record("kg_graph(default)", lambda: main_mod.kg_graph(project_id, request, max_nodes=400))
+    record(
+        "kg_graph(center)",
+        lambda: main_mod.kg_graph(project_id, request, center=center, depth=2, max_nodes=400),
+    )
+    record(
+        "list_labeling_samples",
+        lambda: main_mod.list_labeling_samples(project_id, limit=30, offset=n_records // 2),
+    )
+    last_id = f"SYN-{n_records - 1:07d}"
+    record(
+        "get_labeling_sample(last)",
+        lambda: main_mod.get_labeling_sample(last_id, project_id=project_id),
+    )
+    return results
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """按 (scale, op) 对齐两份报告，给出耗时 / 内存比值（>1 表示变慢 / 变大）。"""
+    base = {(r["scale"], r["op"]): r for r in baseline.get("results", [])}
+    rows = []
+    for r in report.get("results", []):
+        b = base.get((r["scale"], r["op"]))
+        if not b:
+            continue
+        rows.append(
+            {
+                "scale": r["scale"],
+                "op": r["op"],
+                "time_ratio": round(r["median_s"] / b["median_s"], 3) if b["median_s"] else None,
+                "mem_ratio": round(r["peak_mb"] / b["peak_mb"], 3) if b["peak_mb"] else None,
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="MediTag 热点路径基准测试")
+    parser.add_argument("--scales", default="1000,10000", help="逗号分隔的记录数，例如 1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-root", type=Path, default=None, help="默认用临时目录")
+    parser.add_argument("--reuse-data", action="store_true", help="数据已存在时不重新生成")
+    parser.add_argument("--out", type=Path, default=None, help="报告输出路径（默认打印到 stdout）")
+    parser.add_argument("--baseline", type=Path, default=None, help="与之前的报告对比")
+    args = parser.parse_args()
+
+    scales = [int(x) for x in args.scales.split(",") if x.strip()]
+    data_root = args.data_root or Path(tempfile.mkdtemp(prefix="meditag_bench_"))
+    os.environ["MEDITAG_DATA_ROOT"] = str(data_root)
+
+    gen_seconds: Dict[int, float] = {}
+    for n in scales:
+        project_id = f"bench_{n}"
+        raw_path = data_root / "projects" / project_id / "raw" / "med_think_responses.jsonl"
+        if args.reuse_data and raw_path.exists():
+            continue
+        t0 = time.perf_counter()
+        generate_project(data_root, project_id, n, seed=args.seed)
+        gen_seconds[n] = round(time.perf_counter() - t0, 3)
+        print(f"generated {project_id} in {gen_seconds[n]} s", file=sys.stderr)
+
+    import main as main_mod  # noqa: E402  必须在设置 MEDITAG_DATA_ROOT 之后
+
+    results: List[Dict[str, Any]] = []
+    for n in scales:
+        print(f"[scale={n}]", file=sys.stderr)
+        results.extend(run_scale(main_mod, f"bench_{n}", n, args.repeat))
+        main_mod.invalidate_kg(f"bench_{n}")
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "data_root": str(data_root),
+            "generate_seconds": gen_seconds,
+        },
+        "results": results,
+    }
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        report["compare"] = {"baseline_commit": baseline.get("meta", {}).get("commit"), "rows": compare(report, baseline)}
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
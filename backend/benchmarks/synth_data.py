@@ -0,0 +1,259 @@
+"""
+确定性的合成数据生成器：按给定规模生成一个项目的
+
+    <data_root>/projects/<project_id>/raw/med_think_responses.jsonl
+    <data_root>/projects/<project_id>/labeling/labeling_inputs.jsonl
+
+--shards N / --compress gz 时改为生成 raw/med_think_<i>.jsonl[.gz] 多个分片，模拟上游按天投递的压缩分片。
+
+格式和线上 med_think 批处理结果一致（user 消息里是伪 JSON 的病历字段，
+response 是 ```json 包裹的 all_result + 各诊断的 <med_think>）。
+疾病 / 症状 / 标签都按 Zipf 分布抽样，头部集中、长尾很长，接近真实数据。
+
+用法（在 backend/ 下）：
+    python -m benchmarks.synth_data --data-root /tmp/meditag_bench --records 100000
+"""
+import argparse
+import bisect
+import contextlib
+import gzip
+import itertools
+import json
+import random
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+_BASE_DISEASES = [
+    "高血压",
+    "冠心病",
+    "PCI术后",
+    "心律失常",
+    "心力衰竭",
+    "心脏扩大",
+    "陈旧性心肌梗死",
+    "2型糖尿病",
+    "高脂血症",
+    "心房颤动",
+    "不稳定型心绞痛",
+    "稳定型心绞痛",
+    "急性心肌梗死",
+    "肺部感染",
+    "慢性阻塞性肺疾病",
+    "肾功能不全",
+    "脑梗死",
+    "甲状腺功能减退",
+    "贫血",
+    "肺动脉高压",
+]
+_DISEASE_QUALIFIERS = ["", "（轻度）", "（中度）", "（重度）", "（待排）", "（复查）", "伴并发症", "（病史）"]
+
+_SYMPTOMS = [
+    "胸闷",
+    "心悸",
+    "胸痛",
+    "气促",
+    "头晕",
+    "乏力",
+    "咳嗽",
+    "呼吸困难",
+    "水肿",
+    "心慌",
+    "出汗",
+    "咳痰",
+    "恶心",
+    "气短",
+    "失眠",
+    "纳差",
+    "腹痛",
+    "发热",
+    "呕吐",
+    "畏寒",
+    "咽痛",
+    "消瘦",
+    "腹泻",
+    "尿频",
+    "咯血",
+    "发绀",
+    "便秘",
+    "头痛",
+    "背痛",
+    "腰痛",
+    "肩痛",
+    "关节痛",
+]
+
+_TRIAGE_LABELS = ["需要随访调整", "存在复发风险", "稳定", "需紧急就诊"]
+
+
+class ZipfSampler:
+    """对给定列表按 1/rank^s 抽样（预计算累计权重，单次抽样 O(log n)）。"""
+
+    def __init__(self, items: Sequence[str], s: float, rng: random.Random):
+        self.items = list(items)
+        self.rng = rng
+        weights = [1.0 / (rank ** s) for rank in range(1, len(self.items) + 1)]
+        self.cum = list(itertools.accumulate(weights))
+        self.total = self.cum[-1]
+
+    def one(self) -> str:
+        x = self.rng.random() * self.total
+        return self.items[bisect.bisect_right(self.cum, x)]
+
+    def distinct(self, k: int) -> List[str]:
+        out: List[str] = []
+        seen = set()
+        # k 远小于候选数，重复抽到的直接跳过即可
+        for _ in range(k * 8):
+            v = self.one()
+            if v not in seen:
+                seen.add(v)
+                out.append(v)
+                if len(out) >= k:
+                    break
+        return out
+
+
+def _disease_vocab(n_diseases: int) -> List[str]:
+    vocab = []
+    for q in _DISEASE_QUALIFIERS:
+        for d in _BASE_DISEASES:
+            vocab.append(f"{d}{q}")
+    i = 0
+    while len(vocab) < n_diseases:
+        # 长尾：编号的罕见病
+        vocab.append(f"{_BASE_DISEASES[i % len(_BASE_DISEASES)]}亚型{i // len(_BASE_DISEASES) + 1}")
+        i += 1
+    return vocab[:n_diseases]
+
+
+def _iter_records(
+    n: int,
+    project_id: str,
+    seed: int,
+    n_diseases: int,
+) -> Iterator[Tuple[Dict, Dict]]:
+    rng = random.Random(seed)
+    diseases = ZipfSampler(_disease_vocab(n_diseases), s=1.1, rng=rng)
+    symptoms = ZipfSampler(_SYMPTOMS, s=1.0, rng=rng)
+    labels = ZipfSampler(_TRIAGE_LABELS, s=1.2, rng=rng)
+
+    for i in range(n):
+        sample_id = f"SYN-{i:07d}"
+        # 诊断数也是长尾：大多 1~3 个，偶尔 10 个以上
+        n_diag = min(14, 1 + int(rng.paretovariate(1.6)))
+        diag = diseases.distinct(n_diag)
+        syms = symptoms.distinct(rng.randint(1, 5))
+        neg = symptoms.one()
+        years = rng.randint(1, 15)
+        date = f"20{rng.randint(18, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+        emr_fields = {
+            "主诉": f"反复{'、'.join(syms[:2])}{years}年，加重{rng.randint(1, 7)}天",
+            "现病史": f"患者{years}年前出现{'、'.join(syms)}，活动后加重，休息可缓解，无{neg}。",
+            "体格检查": f"血压{rng.randint(100, 180)}/{rng.randint(60, 110)}mmHg，双肺呼吸音清，心律齐。",
+            "病例特点": f"老年患者，既往{'、'.join(diag[:3])}病史，本次以{syms[0]}为主要表现。",
+        }
+        user_content = (
+            f"病患id：P{rng.randint(1, max(1, n // 3)):07d}｜日期：{date}｜"
+            f"快诊信息：{json.dumps(emr_fields, ensure_ascii=False)}\n"
+            f"诊断结论：{'，'.join(diag)}"
+        )
+
+        payload = {"all_result": diag}
+        for d in diag:
+            payload[d] = (
+                f"<med_think>1）患者以{syms[0]}为主诉；2）结合既往病史与查体，支持{d}；"
+                f"3）需结合后续检查进一步明确。</med_think>"
+            )
+        raw = {
+            "custom_id": sample_id,
+            "request": {
+                "messages": [
+                    {"role": "system", "content": "你是一名心内科医生。"},
+                    {"role": "user", "content": user_content},
+                ]
+            },
+            "response": "```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```",
+        }
+
+        triage = labels.distinct(rng.randint(1, 2))
+        labeling = {
+            "sample_id": sample_id,
+            "project_id": project_id,
+            "title": "，".join(diag),
+            "raw_text": user_content,
+            "labels": triage,
+            "cot_text": "；".join(payload[d][11:-12] for d in diag[:2]),
+        }
+        yield raw, labeling
+
+
+def generate_project(
+    data_root: Path,
+    project_id: str,
+    n_records: int,
+    seed: int = 42,
+    n_diseases: int = 2000,
+    shards: int = 1,
+    compress: str = "",
+) -> Dict[str, str]:
+    """生成一个合成项目，返回生成的文件路径。相同参数生成的文件逐字节一致（gzip 头里的 mtime 固定为 0）。"""
+    project_dir = Path(data_root) / "projects" / project_id
+    raw_dir = project_dir / "raw"
+    labeling_path = project_dir / "labeling" / "labeling_inputs.jsonl"
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    labeling_path.parent.mkdir(parents=True, exist_ok=True)
+
+    if shards <= 1 and not compress:
+        raw_paths = [raw_dir / "med_think_responses.jsonl"]
+    else:
+        suffix = ".jsonl.gz" if compress == "gz" else ".jsonl"
+        raw_paths = [raw_dir / f"med_think_{i:03d}{suffix}" for i in range(max(1, shards))]
+    per_shard = -(-n_records // len(raw_paths))
+
+    @contextlib.contextmanager
+    def open_raw(path: Path):
+        with path.open("wb") as fh:
+            if path.name.endswith(".gz"):
+                with gzip.GzipFile(filename="", mode="wb", fileobj=fh, mtime=0) as gz:
+                    yield gz
+            else:
+                yield fh
+
+    records = _iter_records(n_records, project_id, seed, n_diseases)
+    with labeling_path.open("w", encoding="utf-8") as f_lab:
+        for path in raw_paths:
+            with open_raw(path) as f_raw:
+                for raw, labeling in itertools.islice(records, per_shard):
+                    f_raw.write((json.dumps(raw, ensure_ascii=False) + "\n").encode("utf-8"))
+                    f_lab.write(json.dumps(labeling, ensure_ascii=False) + "\n")
+
+    return {"raw": ",".join(str(p) for p in raw_paths), "labeling": str(labeling_path)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="生成 MediTag 合成数据")
+    parser.add_argument("--data-root", required=True, type=Path)
+    parser.add_argument("--project-id", default=None, help="默认 bench_<records>")
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--diseases", type=int, default=2000, help="疾病词表大小（长尾）")
+    parser.add_argument("--shards", type=int, default=1, help="原始数据拆成几个分片")
+    parser.add_argument("--compress", choices=["", "gz"], default="", help="分片压缩格式")
+    args = parser.parse_args()
+
+    project_id = args.project_id or f"bench_{args.records}"
+    paths = generate_project(
+        args.data_root,
+        project_id,
+        args.records,
+        seed=args.seed,
+        n_diseases=args.diseases,
+        shards=args.shards,
+        compress=args.compress,
+    )
+    print(json.dumps({"project_id": project_id, **paths}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,59 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from pathlib import Path
 import json
-from typing import List, Dict, Any, Optional
+from typing import Annotated, List, Dict, Any, Optional, Collection, Tuple
 import re
 from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
 from functools import lru_cache
 import os
-from openai import OpenAI
+import threading
+import time
+import gzip
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli  # 可选：装了就支持 Content-Encoding: br
+except ImportError:
+    brotli = None
+
+from app.core import metrics, profiling
+from app.core.warmup import configured_projects, warmup
+from app.models.workflow import Workflow
+from app.core.config import DATA_ROOT
+from app.engines.llm import http_llm_client, mock_llm_client
+from app.services import (
+    dataset_service,
+    dedup_service,
+    export_service,
+    feature_store,
+    kg_analytics,
+    kg_layout,
+    labeling_service,
+    medthink_service,
+    node_execution_service,
+    preprocessing_service,
+    qc_service,
+    workflow_service,
+)
+from app.utils.file_utils import atomic_write_jsonl
+from app.utils.text_utils import norm_text as _norm_text
+
+logger = logging.getLogger(__name__)
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_warmup()  # 定义在文件末尾（要用到 build_kg 等），启动时才调用
+    yield
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # 允许前端的地址访问
 origins = [
@@ -25,164 +67,153 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 数据根目录：backend/data
-DATA_ROOT = Path(__file__).resolve().parent / "data"
 
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """按路由模板（而不是实际 path）记录每个接口的延迟直方图。"""
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.observe_request(
+            request.method,
+            getattr(route, "path", None) or "unmatched",
+            status,
+            time.perf_counter() - t0,
+        )
 
-# --------- 工具函数：加载 jsonl ---------
 
-def get_labeling_path(project_id: str) -> Path:
-    return DATA_ROOT / "projects" / project_id / "labeling" / "labeling_inputs.jsonl"
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return PlainTextResponse(
+        metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
 
-# ====================== MedThink 原始数据解析 ======================
 
-def get_medthink_path(project_id: str) -> Path:
-    """
-    返回 med_think_responses.jsonl 的路径：
-    backend/data/projects/<project_id>/raw/med_think_responses.jsonl
-    """
-    return DATA_ROOT / "projects" / project_id / "raw" / "med_think_responses.jsonl"
+@app.get("/healthz", include_in_schema=False)
+def healthz():
+    """存活检查：进程能响应就是活的，不看预热进度。"""
+    return {"status": "ok"}
 
 
-def _extract_json_from_markdown(text: str) -> str:
-    """
-    把 ```json ... ``` 代码块里的纯 JSON 抠出来。
-    """
-    if not text:
-        return ""
-    s = text.strip()
-    if s.startswith("```"):
-        # 去掉 ```json / ``` 前缀
-        if s.lower().startswith("```json"):
-            s = s[7:]
-        else:
-            s = s[3:]
-        s = s.lstrip()
-        # 去掉末尾 ```
-        if s.endswith("```"):
-            s = s[:-3]
-    return s.strip()
+@app.get("/readyz", include_in_schema=False)
+def readyz():
+    """就绪检查：配置了启动预热时，预热结束前返回 503，并带每个项目的进度。"""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 
-_med_think_pattern = re.compile(r"<med_think>(.*?)</med_think>", re.DOTALL)
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    """带 X-Debug-Profile 头（或被 PROFILE_SAMPLE_RATE 抽中）的请求做一次采样分析。"""
+    if not profiling.should_profile(request.headers.get(profiling.PROFILE_HEADER)):
+        return await call_next(request)
 
+    sampler = profiling.StackSampler()
+    sampler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        sampler.stop()
+
+    route = request.scope.get("route")
+    profile_id = await run_in_threadpool(
+        profiling.write_profile,
+        sampler,
+        request.method,
+        getattr(route, "path", None) or request.url.path,
+        request.scope.get("endpoint"),
+        response.status_code,
+    )
+    response.headers["X-Profile-Id"] = profile_id
+    return response
 
-def _extract_med_think_block(text: str) -> str:
-    """
-    从 <med_think>...</med_think> 中抽出内部内容；
-    若找不到标签，则直接返回原文。
-    """
-    if not text:
-        return ""
-    m = _med_think_pattern.search(text)
-    if m:
-        return m.group(1).strip()
-    return text.strip()
 
+def _require_debug_token(token: Optional[str]) -> None:
+    if not profiling.token_ok(token):
+        raise HTTPException(status_code=403, detail="需要正确的 X-Debug-Token（并设置环境变量 DEBUG_TOKEN）")
 
-def _parse_medthink_record(raw: Dict[str, Any], idx: int, project_id: str) -> Dict[str, Any]:
-    """
-    将 med_think_responses.jsonl 中的一行原始记录解析为统一结构。
-    """
-    sample_id = str(raw.get("custom_id") or idx)
 
-    # 1) 拿到 user 消息里的“快诊信息 / 病历文本”
-    request = raw.get("request", {})
-    messages = request.get("messages", [])
-    user_content = ""
-    for m in messages:
-        if m.get("role") == "user":
-            user_content = m.get("content", "")
-            break
+@app.get("/api/v1/admin/profiles")
+def list_profiles(limit: int = 50, x_debug_token: Optional[str] = Header(default=None)):
+    _require_debug_token(x_debug_token)
+    return {"dir": str(profiling.PROFILE_DIR), "items": profiling.list_profiles(limit)}
 
-    emr_text = user_content or ""
 
-    # 简单从 user 文本里抽 patient_id、日期（没抽到就留空）
-    patient_id = None
-    visit_date = None
+@app.post("/api/v1/admin/memory/snapshot")
+def memory_snapshot(
+    key_type: str = "lineno",
+    limit: int = 30,
+    x_debug_token: Optional[str] = Header(default=None),
+):
+    """
+    第一次调用开启 tracemalloc 并记基线；之后每次返回与上一次快照相比增长最多的分配位置。
+    典型用法：snapshot -> 对多个项目调 kg/refresh -> snapshot，看 build_kg 的内存落在哪。
+    """
+    _require_debug_token(x_debug_token)
+    try:
+        return profiling.take_memory_snapshot(key_type=key_type, limit=max(1, min(limit, 200)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    m_id = re.search(r"病患id：([^｜\|]+)", user_content)
-    if m_id:
-        patient_id = m_id.group(1).strip()
 
-    m_date = re.search(r"日期：(\d{4}-\d{2}-\d{2})", user_content)
-    if m_date:
-        visit_date = m_date.group(1)
+@app.delete("/api/v1/admin/memory/snapshot")
+def memory_snapshot_stop(x_debug_token: Optional[str] = Header(default=None)):
+    _require_debug_token(x_debug_token)
+    return profiling.stop_memory_tracing()
 
-    # 2) 解析 response 里的 JSON 思维链
-    resp_str = raw.get("response", "")
-    json_str = _extract_json_from_markdown(resp_str)
+# 数据根目录：backend/data（见 app/core/config.py）
 
-    try:
-        payload = json.loads(json_str)
-    except Exception as e:
-        print(f"[WARN] failed to parse med_think JSON for sample {sample_id}: {e}")
-        payload = {}
-
-    diagnosis_list = payload.get("all_result") or []
-    model_thinks = []
-    total_tokens = 0
-
-    for label in diagnosis_list:
-        raw_think = payload.get(label, "")
-        med_think = _extract_med_think_block(raw_think)
-        tokens = len(med_think.split())
-        total_tokens += tokens
-        model_thinks.append(
-            {
-                "label": label,
-                "med_think": med_think,
-                "tokens": tokens,
-            }
-        )
 
-    has_cot_for_all = bool(diagnosis_list) and all(
-        bool(mt["med_think"]) for mt in model_thinks
-    )
+# --------- 工具函数：加载 jsonl ---------
 
-    return {
-        "sample_id": sample_id,
-        "project_id": project_id,
-        "patient_id": patient_id,
-        "visit_date": visit_date,
-        "diagnosis_list": diagnosis_list,
-        "diagnosis_count": len(diagnosis_list),
-        "emr_text": emr_text,
-        "model_thinks": model_thinks,
-        "total_cot_tokens": total_tokens,
-        "has_cot_for_all": has_cot_for_all,
-    }
+def get_labeling_path(project_id: str) -> Path:
+    return DATA_ROOT / "projects" / project_id / "labeling" / "labeling_inputs.jsonl"
 
+# ====================== MedThink 原始数据解析 ======================
 
+@metrics.timed("medthink_load")
 def load_medthink_samples(project_id: str) -> List[Dict[str, Any]]:
     """
-    读取 med_think_responses.jsonl，解析为统一结构列表。
-
-    注意：目前是每次请求都整文件读取，数据量大时可以再做缓存 / 索引。
+    读取 raw/ 下所有 med_think 分片（*.jsonl / *.jsonl.gz / *.jsonl.zst），解析为统一结构列表。
+    多个分片时按分片并行解析；新到 / 变化的分片顺带入特征库。
     """
-    path = get_medthink_path(project_id)
-    if not path.exists():
+    shards = medthink_service.list_shards(project_id)
+    if not shards:
         raise HTTPException(
             status_code=500,
-            detail=f"med_think_responses.jsonl not found: {path}",
+            detail=f"no med_think shards found in: {medthink_service.get_raw_dir(project_id)}",
         )
-
-    samples: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as f:
-        for idx, line in enumerate(f, start=1):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                raw = json.loads(line)
-                one = _parse_medthink_record(raw, idx, project_id)
-                samples.append(one)
-            except Exception as e:
-                # 有问题的记录先跳过，后面可以做日志汇总
-                print(f"[WARN] skip bad med_think line #{idx}: {e}")
-                continue
+    try:
+        samples, _ = medthink_service.load_samples(project_id, shards)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     return samples
 
+
+def load_medthink_features(project_id: str) -> Dict[str, Dict[str, Any]]:
+    """
+    读样本特征（sections / symptoms / diagnoses / patient_id / visit_date）。
+    只解析特征库里还没有（或已变化）的分片，其余分片不用再读原始数据。
+    """
+    shards = medthink_service.list_shards(project_id)
+    if not shards:
+        raise HTTPException(
+            status_code=500,
+            detail=f"no med_think shards found in: {medthink_service.get_raw_dir(project_id)}",
+        )
+    try:
+        medthink_service.sync_features(project_id, shards)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return feature_store.load_features(project_id)
+
+@metrics.timed("labeling_load")
 def load_labeling_records(project_id: str) -> List[Dict[str, Any]]:
     path = get_labeling_path(project_id)
     if not path.exists():
@@ -219,14 +250,14 @@ def load_qc_issues(project_id: str) -> List[Dict[str, Any]]:
   issues = [i for i in issues if i.get("projectId") == project_id]
   return issues
 
-def _get_ark_client() -> OpenAI:
+def _get_ark_client():
+    # LLM_BACKEND=mock：本地 mock，不需要 key（压测 / 离线开发，见 app/engines/llm/mock_llm_client.py）
+    if os.getenv("LLM_BACKEND") == "mock":
+        return mock_llm_client.get_client()
     api_key = os.getenv("ARK_API_KEY")
     if not api_key:
         raise HTTPException(status_code=500, detail="缺少环境变量 ARK_API_KEY")
-    return OpenAI(
-        base_url="https://ark.cn-beijing.volces.com/api/v3",
-        api_key=api_key,
-    )
+    return http_llm_client.get_client(api_key)
 
 def _extract_first_json_obj(text: str) -> Dict[str, Any]:
     """
@@ -276,14 +307,19 @@ def llm_parse_symptoms(patient_text: str) -> Dict[str, Any]:
 }}
 """
 
-    resp = client.responses.create(
-        model=model,
-        input=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        # 不建议开 web_search：这一步只做抽取，不需要联网
-    )
+    with metrics.timer("llm_call"):
+        try:
+            resp = client.responses.create(
+                model=model,
+                input=[
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user},
+                ],
+                # 不建议开 web_search：这一步只做抽取，不需要联网
+            )
+        except Exception as e:
+            # 上游失败按 502 返回；未处理的异常会让 uvicorn 断开连接，连带同一连接上的其它请求失败
+            raise HTTPException(status_code=502, detail=f"LLM 调用失败：{type(e).__name__}: {e}")
 
     # 兼容取文本
     out_text = getattr(resp, "output_text", None)
@@ -374,13 +410,12 @@ def kg_diagnose_from_text(project_id: str, body: Dict[str, Any]):
 
     linked = []
     linked_nodes = []
-    for rs in present_syms:
-        one = _link_symptom_to_node(kg, rs)
-        linked.append(one)
-        if one["node_id"]:
-            linked_nodes.append(one["node_id"]
-
-            )
+    with metrics.timer("symptom_linking"):
+        for rs in present_syms:
+            one = _link_symptom_to_node(kg, rs)
+            linked.append(one)
+            if one["node_id"]:
+                linked_nodes.append(one["node_id"])
 
     linked_nodes = sorted(set(linked_nodes))
     if not linked_nodes:
@@ -391,35 +426,36 @@ def kg_diagnose_from_text(project_id: str, body: Dict[str, Any]):
             "ranked_diseases": [],
         }
 
-    # 建 disease->symptom weight map
-    d2s = defaultdict(dict)
-    for e in kg["edges"]:
-        if e["type"] != "HAS_SYMPTOM":
-            continue
-        d2s[e["source"]][e["target"]] = int(e.get("weight") or 0)
-
-    ranked = []
-    for disease, smap in d2s.items():
-        score = 0
-        hits = []
-        paths = []
-        for sym in linked_nodes:
-            w = smap.get(sym)
-            if w:
-                score += w
-                hits.append({"symptom": sym, "weight": w})
-                paths.append([disease, "HAS_SYMPTOM", sym])
-        if score > 0:
-            hits.sort(key=lambda x: -x["weight"])
-            ranked.append({
-                "disease": disease,
-                "score": score,
-                "hit_count": len(hits),
-                "evidence": hits[:12],
-                "paths": paths[:12],
-            })
-
-    ranked.sort(key=lambda x: (-x["score"], -x["hit_count"], x["disease"]))
+    with metrics.timer("scoring"):
+        # 建 disease->symptom weight map
+        d2s = defaultdict(dict)
+        for e in kg["edges"]:
+            if e["type"] != "HAS_SYMPTOM":
+                continue
+            d2s[e["source"]][e["target"]] = int(e.get("weight") or 0)
+
+        ranked = []
+        for disease, smap in d2s.items():
+            score = 0
+            hits = []
+            paths = []
+            for sym in linked_nodes:
+                w = smap.get(sym)
+                if w:
+                    score += w
+                    hits.append({"symptom": sym, "weight": w})
+                    paths.append([disease, "HAS_SYMPTOM", sym])
+            if score > 0:
+                hits.sort(key=lambda x: -x["weight"])
+                ranked.append({
+                    "disease": disease,
+                    "score": score,
+                    "hit_count": len(hits),
+                    "evidence": hits[:12],
+                    "paths": paths[:12],
+                })
+
+        ranked.sort(key=lambda x: (-x["score"], -x["hit_count"], x["disease"]))
     return {
         "input_text": text,
         "parsed": parsed,
@@ -428,6 +464,48 @@ def kg_diagnose_from_text(project_id: str, body: Dict[str, Any]):
         "ranked_diseases": ranked[:15],
     }
 
+# --------- 0) 预处理：raw 分片 -> labeling_inputs.jsonl ---------
+
+@app.post("/api/v1/projects/{project_id}/preprocess")
+def run_preprocessing(project_id: str, body: Optional[Dict[str, Any]] = None):
+    """
+    分块并行解析 raw/ 分片生成标注输入；中断过的运行从断点续上。
+    body: {"workers": null, "chunk_lines": 2000, "restart": false}
+    """
+    body = body or {}
+    try:
+        with metrics.timer("preprocess"):
+            return preprocessing_service.run_preprocessing(
+                project_id,
+                workers=body.get("workers"),
+                chunk_lines=int(body.get("chunk_lines") or preprocessing_service.CHUNK_LINES),
+                restart=bool(body.get("restart")),
+            )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/api/v1/projects/{project_id}/preprocess/runs")
+def list_preprocessing_runs(project_id: str):
+    runs = [r.to_dict() for r in preprocessing_service.list_runs(project_id)]
+    return {"items": runs[::-1], "total": len(runs)}
+
+
+@app.get("/api/v1/projects/{project_id}/preprocess/errors")
+def get_preprocessing_errors(project_id: str, limit: int = 100):
+    """最近一次预处理的错误报告（按类型计数 + 前 limit 条明细）。"""
+    path = preprocessing_service.get_error_report_path(project_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="no preprocessing error report yet")
+    report = json.loads(path.read_text(encoding="utf-8"))
+    report["errors"] = report["errors"][: max(0, limit)]
+    return report
+
+
 # --------- 1) 样本列表接口 ---------
 
 @app.get("/api/v1/projects/{project_id}/labeling/samples")
@@ -492,6 +570,75 @@ def save_labeling_annotation(sample_id: str, body: Dict[str, Any]):
     }
 
 
+# --------- 3.1) 任务分发：领取 / 续租 / 释放 / 提交 ---------
+
+def _labeling_queue(project_id: str) -> labeling_service.TaskQueue:
+    return labeling_service.get_queue(
+        project_id, lambda: [str(r["sample_id"]) for r in load_labeling_records(project_id)]
+    )
+
+
+def _annotator(body: Optional[Dict[str, Any]]) -> str:
+    annotator = str((body or {}).get("annotator") or "").strip()
+    if not annotator:
+        raise HTTPException(status_code=400, detail="annotator is required")
+    return annotator
+
+
+def _lease_call(fn, *args):
+    try:
+        return fn(*args)
+    except labeling_service.LeaseOwnerError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except labeling_service.LeaseExpiredError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/api/v1/projects/{project_id}/labeling/queue")
+def get_labeling_queue(project_id: str):
+    return _labeling_queue(project_id).stats()
+
+
+@app.post("/api/v1/projects/{project_id}/labeling/queue")
+def configure_labeling_queue(project_id: str, body: Optional[Dict[str, Any]] = None):
+    """
+    重建分发队列。body：{"replicas": 3, "lease_seconds": 600}
+    replicas 是每个样本需要几个不同标注员（一致性评估用）；已完成的标注保留，进行中的租约作废。
+    """
+    body = body or {}
+    replicas = int(body.get("replicas", labeling_service.DEFAULT_REPLICAS))
+    lease_seconds = float(body.get("lease_seconds", labeling_service.DEFAULT_LEASE_SECONDS))
+    if replicas < 1 or lease_seconds <= 0:
+        raise HTTPException(status_code=400, detail="replicas must be >= 1 and lease_seconds > 0")
+    sample_ids = [str(r["sample_id"]) for r in load_labeling_records(project_id)]
+    q = labeling_service.configure_queue(project_id, sample_ids, replicas=replicas, lease_seconds=lease_seconds)
+    return q.stats()
+
+
+@app.post("/api/v1/projects/{project_id}/labeling/tasks/claim")
+def claim_labeling_task(project_id: str, body: Dict[str, Any]):
+    """领取下一个待标样本，返回租约；队列空了返回 {"task": null}。"""
+    task = _labeling_queue(project_id).claim(_annotator(body))
+    return {"task": task}
+
+
+@app.post("/api/v1/projects/{project_id}/labeling/tasks/{lease_id}/heartbeat")
+def heartbeat_labeling_task(project_id: str, lease_id: str, body: Dict[str, Any]):
+    return _lease_call(_labeling_queue(project_id).heartbeat, lease_id, _annotator(body))
+
+
+@app.post("/api/v1/projects/{project_id}/labeling/tasks/{lease_id}/release")
+def release_labeling_task(project_id: str, lease_id: str, body: Dict[str, Any]):
+    return _lease_call(_labeling_queue(project_id).release, lease_id, _annotator(body))
+
+
+@app.post("/api/v1/projects/{project_id}/labeling/tasks/{lease_id}/complete")
+def complete_labeling_task(project_id: str, lease_id: str, body: Dict[str, Any]):
+    """提交标注（label / cot_text / source），租约过期或不属于该标注员时拒绝。"""
+    ann = _lease_call(_labeling_queue(project_id).complete, lease_id, _annotator(body), body)
+    return ann.to_dict()
+
+
 # --------- 4) 生成 COT（先从原始 cot_text 里取，模拟模型生成） ---------
 
 @app.post("/api/v1/labeling/samples/{sample_id}/cot/generate")
@@ -564,6 +711,56 @@ def get_qc_summary(project_id: str):
       "humanReviewed": 0,
       "interAnnotatorAgreement": 0.82,
   }
+
+
+# --------- 7) 批量跑 QC 规则（结果写回 qc_issues.jsonl） ---------
+
+@app.get("/api/v1/qc/rules")
+def list_qc_rules():
+    return {"items": qc_service.list_rules()}
+
+
+@app.post("/api/v1/projects/{project_id}/qc/run")
+def run_qc(project_id: str, body: Optional[Dict[str, Any]] = None):
+    """
+    对项目的全部标注样本跑已注册的 QC 规则。
+    body 可选：{"full": false, "workers": 4}
+      - full：忽略上次的内容哈希，全部重跑
+      - workers：进程数，默认按 CPU 数
+    """
+    body = body or {}
+    records = load_labeling_records(project_id)
+
+    # 有原始 med_think 数据时，把模型给出的诊断作为 model_labels，供 rule_model_vs_human 对比
+    # 同时带上特征库里抽好的症状，规则不用再自己扫文本
+    model_labels: Dict[str, List[str]] = {}
+    symptoms: Dict[str, Optional[List[str]]] = {}
+    if medthink_service.list_shards(project_id):
+        for sid, f in load_medthink_features(project_id).items():
+            model_labels[sid] = f.get("diagnoses") or []
+            symptoms[sid] = f.get("symptoms")
+
+    samples = []
+    for r in records:
+        sid = str(r["sample_id"])
+        samples.append(
+            {
+                "sample_id": sid,
+                "labels": r.get("labels", []),
+                "raw_text": r.get("raw_text", ""),
+                "cot_text": r.get("cot_text", ""),
+                "model_labels": model_labels.get(sid, []),
+                "symptoms": symptoms.get(sid),
+            }
+        )
+
+    workers = body.get("workers")
+    return qc_service.run_qc_rules(
+        project_id,
+        samples,
+        full=bool(body.get("full")),
+        workers=int(workers) if workers else None,
+    )
 # ====================== MedThink 样本库接口 ======================
 
 @app.get("/api/v1/projects/{project_id}/medthink/samples")
@@ -571,11 +768,28 @@ def list_medthink_samples(
     project_id: str,
     limit: int = 30,
     offset: int = 0,
+    symptom: Optional[str] = None,
+    diagnosis: Optional[str] = None,
 ):
     """
     列出 MedThink 样本（简略信息），用于前端「模型思维链样本库」列表。
+    symptom / diagnosis：按特征库里抽好的症状 / 规范化诊断做子串检索。
     """
     samples = load_medthink_samples(project_id)
+    sym_q = _norm_text(symptom or "")
+    diag_q = _norm_text(diagnosis or "")
+    if sym_q or diag_q:
+        features = feature_store.load_features(project_id)
+
+        def match(s: Dict[str, Any]) -> bool:
+            f = features.get(str(s["sample_id"])) or {}
+            if sym_q and not any(sym_q in x for x in f.get("symptoms") or []):
+                return False
+            if diag_q and not any(diag_q in x for x in f.get("diagnoses") or []):
+                return False
+            return True
+
+        samples = [s for s in samples if match(s)]
     total = len(samples)
     page = samples[offset : offset + limit]
 
@@ -614,158 +828,52 @@ def get_medthink_sample(
 
 # ====================== Knowledge Graph（MVP：由 jsonl 构建、内存缓存） ======================
 
-_SYM_SUFFIXES = [
-    "痛",
-    "热",
-    "咳嗽",
-    "咳痰",
-    "咯血",
-    "胸闷",
-    "胸痛",
-    "心慌",
-    "心悸",
-    "气促",
-    "气短",
-    "呼吸困难",
-    "头晕",
-    "乏力",
-    "出汗",
-    "水肿",
-    "发绀",
-    "恶心",
-    "呕吐",
-    "腹痛",
-    "腹泻",
-    "便血",
-    "便秘",
-    "尿频",
-    "尿急",
-    "尿痛",
-    "血尿",
-    "畏寒",
-    "发热",
-    "咽痛",
-    "纳差",
-    "消瘦",
-    "失眠",
-]
+# 构图时重复簇是否只计一次（需先跑 /qc/dedup）；也可以给 build_kg 显式传 dedup
+KG_DEDUP_DEFAULT = os.getenv("KG_DEDUP", "0") == "1"
+# kg_graph 默认视图的节点上限；这个视图的布局在构图时就预先算好
+KG_DEFAULT_VIEW_NODES = 120
 
 
-def _norm_text(s: str) -> str:
-    if not s:
-        return ""
-    s = s.strip()
-    # 统一中英文括号/冒号/空格
-    s = s.replace("（", "(").replace("）", ")")
-    s = s.replace("：", ":")
-    s = re.sub(r"\s+", " ", s)
-    # 去掉末尾问号等
-    s = re.sub(r"[？?]+$", "", s)
-    return s.strip()
-
-
-def _extract_section(emr_text: str, key: str) -> str:
-    """从 prompt 里的 pseudo-json 中抽取某个字段（主诉/现病史/体格检查/病例特点）。"""
-    if not emr_text:
-        return ""
-    # 例如："主诉": "反复心慌、气促4年， "
-    pat = re.compile(rf"\"{re.escape(key)}\"\s*:\s*\"(.*?)\"", re.DOTALL)
-    m = pat.search(emr_text)
-    if not m:
-        return ""
-    val = m.group(1)
-    return val.replace("\\n", "\n").strip()
+# 每个项目的缓存代数：项目数据变了就换一代，只作废这个项目的构图结果
+_kg_generations: Dict[str, int] = defaultdict(int)
 
 
-def _extract_symptoms(text: str) -> List[str]:
-    """非常粗糙的症状抽取（先做 MVP）：靠常见后缀词 + 去否定。"""
-    if not text:
-        return []
-    t = text
-    # 简单去掉“无/否认/未见”等否定句中的片段（不完美，但能减少噪声）
-    t = re.sub(r"(否认|无|未见|未闻及|未发现)[^。；;\n]{0,40}", " ", t)
-
-    found: List[str] = []
-
-    # 1) 先抓固定词（咳嗽/心慌/气促等）
-    for kw in [
-        "咳嗽",
-        "咳痰",
-        "咯血",
-        "胸闷",
-        "胸痛",
-        "心慌",
-        "心悸",
-        "气促",
-        "气短",
-        "呼吸困难",
-        "头晕",
-        "乏力",
-        "出汗",
-        "水肿",
-        "发绀",
-        "恶心",
-        "呕吐",
-        "腹痛",
-        "腹泻",
-        "便血",
-        "便秘",
-        "尿频",
-        "尿急",
-        "尿痛",
-        "血尿",
-        "畏寒",
-        "发热",
-        "咽痛",
-        "纳差",
-        "消瘦",
-        "失眠",
-    ]:
-        if kw in t:
-            found.append(kw)
-
-    # 2) 再用后缀抓一些“xxx痛/xxx热”这类
-    for suf in _SYM_SUFFIXES:
-        if suf in ("痛", "热"):
-            for m in re.finditer(rf"[\u4e00-\u9fff]{{1,8}}{suf}", t):
-                cand = m.group(0)
-                # 过滤一些明显不是症状的（例如“检查”）
-                if any(bad in cand for bad in ["检查", "诊断", "治疗", "病史"]):
-                    continue
-                found.append(cand)
-
-    # 去重 + 统一
-    found = [_norm_text(x) for x in found if x and len(x) <= 20]
-    # 过滤过短/过泛
-    found = [x for x in found if len(x) >= 2]
-    return sorted(set(found))
+def build_kg(project_id: str, dedup: Optional[bool] = None) -> Dict[str, Any]:
+    """构图入口：dedup 不给时用 KG_DEDUP_DEFAULT；参数规整后再查缓存，写法不同的同一张图只缓存一份。"""
+    dedup = KG_DEDUP_DEFAULT if dedup is None else bool(dedup)
+    return _build_kg(project_id, dedup, _kg_generations[project_id])
+
+
+def invalidate_kg(project_id: str) -> None:
+    """项目的原始数据 / 去重结果变了：作废这个项目的构图缓存（旧代的条目不再命中，随 LRU 淘汰）。"""
+    _kg_generations[project_id] += 1
 
 
 @lru_cache(maxsize=8)
-def build_kg(project_id: str) -> Dict[str, Any]:
-    """从项目的 med_think_responses.jsonl 构建一个“疾病-症状”加权图。"""
-    samples = load_medthink_samples(project_id)
+@metrics.timed("build_kg")
+def _build_kg(project_id: str, dedup: bool, generation: int) -> Dict[str, Any]:
+    """从项目的 med_think_responses.jsonl 构建一个“疾病-症状”加权图（读特征库，不再跑抽取正则）。"""
+    features = load_medthink_features(project_id)
+    skip_ids = (dedup_service.load_duplicate_members(project_id) or set()) if dedup else set()
 
     disease_counter = Counter()
     symptom_counter = Counter()
     edge_counter = Counter()  # (disease, symptom) -> cnt
+    disease_index: Dict[str, int] = {}
+    sample_diseases: List[List[int]] = []  # 每个样本的疾病下标，用于共现矩阵
+    comorbid_counter = Counter()  # 疾病出现的样本数（含没抽到症状的样本）
 
-    for s in samples:
-        diseases = [
-            _norm_text(d)
-            for d in (s.get("diagnosis_list") or [])
-            if _norm_text(d)
-        ]
+    for sid, f in features.items():
+        if sid in skip_ids:
+            continue
+        diseases = f.get("diagnoses") or []
         if not diseases:
             continue
+        # 合并症和症状无关：没抽到症状的样本也要进共现矩阵
+        sample_diseases.append([disease_index.setdefault(d, len(disease_index)) for d in diseases])
+        comorbid_counter.update(diseases)
 
-        emr = s.get("emr_text") or ""
-        chief = _extract_section(emr, "主诉")
-        hpi = _extract_section(emr, "现病史")
-        pe = _extract_section(emr, "体格检查")
-        feat = _extract_section(emr, "病例特点")
-        symptom_text = "\n".join([chief, hpi, pe, feat]).strip()
-        symptoms = _extract_symptoms(symptom_text)
+        symptoms = f.get("symptoms") or []
         if not symptoms:
             continue
 
@@ -782,6 +890,7 @@ def build_kg(project_id: str) -> Dict[str, Any]:
     nodes = {}
     edges = []
     adj = defaultdict(set)
+    adj_by_type = {"HAS_SYMPTOM": defaultdict(set), "CO_OCCURS_WITH": defaultdict(set)}
 
     def ensure_node(node_id: str, ntype: str, count: int):
         if node_id not in nodes:
@@ -799,27 +908,110 @@ def build_kg(project_id: str) -> Dict[str, Any]:
         edges.append({"id": edge_id, "source": d, "target": sym, "type": "HAS_SYMPTOM", "weight": w})
         adj[d].add(sym)
         adj[sym].add(d)
-
-    return {
+        adj_by_type["HAS_SYMPTOM"][d].add(sym)
+        adj_by_type["HAS_SYMPTOM"][sym].add(d)
+    symptom_edges = len(edges)
+
+    # 疾病共现（合并症）：样本×疾病 稀疏矩阵 XᵀX，附带 PMI / lift
+    min_co_count = 3
+    disease_names = list(disease_index)
+    for i, j, cnt, pmi, lift in kg_analytics.cooccurrence_pairs(sample_diseases, len(disease_names), min_co_count):
+        a, b = disease_names[i], disease_names[j]
+        # 只出现在没抽到症状的样本里的疾病，此前没有节点
+        ensure_node(a, "disease", comorbid_counter[a])
+        ensure_node(b, "disease", comorbid_counter[b])
+        edges.append({
+            "id": f"{a}__CO_OCCURS_WITH__{b}",
+            "source": a,
+            "target": b,
+            "type": "CO_OCCURS_WITH",
+            "weight": cnt,
+            "pmi": round(pmi, 4),
+            "lift": round(lift, 4),
+        })
+        adj[a].add(b)
+        adj[b].add(a)
+        adj_by_type["CO_OCCURS_WITH"][a].add(b)
+        adj_by_type["CO_OCCURS_WITH"][b].add(a)
+
+    # 图内容的指纹：布局等派生结果按它缓存，重建后内容不变就还能命中。
+    # 节点的 count 也要算进去：默认视图按 count 选节点，边不变时节点集合也可能变
+    fp = hashlib.sha1()
+    for nid in sorted(nodes):
+        fp.update(f"{nid}\t{nodes[nid].get('count')}\n".encode("utf-8"))
+    for e in edges:
+        fp.update(f"{e['id']}\t{e['weight']}\n".encode("utf-8"))
+    version = fp.hexdigest()[:12]
+
+    kg = {
         "project_id": project_id,
+        "version": version,
         "stats": {
             "disease_nodes": len([n for n in nodes.values() if n["type"] == "disease"]),
             "symptom_nodes": len([n for n in nodes.values() if n["type"] == "symptom"]),
-            "edges": len(edges),
+            "edges": symptom_edges,  # 仍只计 HAS_SYMPTOM 边，和加共现边之前含义一致
+            "cooccur_edges": len(edges) - symptom_edges,
             "min_sym_freq": min_sym_freq,
+            "min_co_count": min_co_count,
+            "dedup": dedup,
+            "skipped_duplicates": len(skip_ids),
+            "version": version,
         },
         "nodes": nodes,
         "edges": edges,
         "adj": {k: list(v) for k, v in adj.items()},
+        "adj_by_type": {t: {k: list(v) for k, v in a.items()} for t, a in adj_by_type.items()},
     }
 
+    # 预先算好默认视图（不带 center、参数取默认值）的服务端布局
+    view = _default_view(kg)
+    kg_layout.get_layout(
+        _layout_key(project_id, kg, None, 0, KG_DEFAULT_VIEW_NODES, None),
+        [n["id"] for n in view["nodes"]],
+        view["edges"],
+    )
+    return kg
+
+
+metrics.register_lru_cache("build_kg", _build_kg)
+
+
+def _parse_edge_types(edge_types: Optional[str]) -> Optional[List[str]]:
+    """查询参数 edge_types=HAS_SYMPTOM,CO_OCCURS_WITH -> 列表；空表示不过滤。"""
+    if not edge_types:
+        return None
+    types = [t.strip() for t in edge_types.split(",") if t.strip()]
+    return types or None
 
-def _subgraph(kg: Dict[str, Any], center: str, depth: int = 1, max_nodes: int = 120):
+
+def _adjacency(kg: Dict[str, Any], edge_types: Optional[Collection[str]] = None) -> Dict[str, List[str]]:
+    """按边类型取邻接表；不过滤（或选了全部类型）时直接用合并好的 adj。"""
+    by_type = kg.get("adj_by_type") or {}
+    if not edge_types or set(edge_types) >= set(by_type):
+        return kg.get("adj") or {}
+    types = [t for t in edge_types if t in by_type]
+    if len(types) == 1:
+        return by_type[types[0]]
+    merged: Dict[str, List[str]] = defaultdict(list)
+    for t in types:
+        for k, vs in by_type[t].items():
+            merged[k].extend(vs)
+    return merged
+
+
+@metrics.timed("subgraph")
+def _subgraph(
+    kg: Dict[str, Any],
+    center: str,
+    depth: int = 1,
+    max_nodes: int = 120,
+    edge_types: Optional[Collection[str]] = None,
+):
     center = _norm_text(center)
     if not center or center not in kg["nodes"]:
         return {"nodes": [], "edges": []}
 
-    adj = kg.get("adj") or {}
+    adj = _adjacency(kg, edge_types)
     visited = {center}
     frontier = {center}
 
@@ -840,10 +1032,12 @@ def _subgraph(kg: Dict[str, Any], center: str, depth: int = 1, max_nodes: int =
 
     node_list = [kg["nodes"][nid] for nid in visited if nid in kg["nodes"]]
     node_set = set(visited)
+    type_set = set(edge_types) if edge_types else None
     edge_list = [
         e
         for e in kg["edges"]
         if e["source"] in node_set and e["target"] in node_set
+        and (type_set is None or e["type"] in type_set)
     ]
     return {"nodes": node_list, "edges": edge_list}
 
@@ -872,110 +1066,671 @@ def kg_search(project_id: str, q: str, type: Optional[str] = None, limit: int =
     return {"items": items[: max(1, min(limit, 50))]}  # limit 上限 50
 
 
+def _compact_graph(graph: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    把 {nodes, edges} 转成列式格式，字符串只出现一次：
+      strings: 前 n_nodes 个是节点 id（label 与 id 相同），之后是类型名
+      nodes:   type[i] / count[i]（以及布局时的 x[i] / y[i]）对应 strings[i]
+      edges:   source / target 是节点下标，type 是 strings 下标；edge id 可由
+               `${source}__${type}__${target}` 还原
+    """
+    nodes = graph["nodes"]
+    edges = graph["edges"]
+    strings: List[str] = [n["id"] for n in nodes]
+    node_idx = {nid: i for i, nid in enumerate(strings)}
+    type_idx: Dict[str, int] = {}
+
+    def t_idx(t: str) -> int:
+        i = type_idx.get(t)
+        if i is None:
+            i = type_idx[t] = len(strings)
+            strings.append(t)
+        return i
+
+    edge_cols: Dict[str, List[Any]] = {
+        "source": [node_idx[e["source"]] for e in edges],
+        "target": [node_idx[e["target"]] for e in edges],
+        "type": [t_idx(e["type"]) for e in edges],
+        "weight": [int(e.get("weight") or 0) for e in edges],
+    }
+    # 共现边的 PMI / lift：有才带，其他边为 null
+    for col in ("pmi", "lift"):
+        if any(col in e for e in edges):
+            edge_cols[col] = [e.get(col) for e in edges]
+
+    node_cols: Dict[str, List[Any]] = {
+        "type": [t_idx(n["type"]) for n in nodes],
+        "count": [int(n.get("count") or 0) for n in nodes],
+    }
+    # 服务端布局坐标（layout=server）
+    if nodes and "x" in nodes[0]:
+        node_cols["x"] = [n["x"] for n in nodes]
+        node_cols["y"] = [n["y"] for n in nodes]
+
+    out = {
+        "format": "compact-v1",
+        "center": graph.get("center"),
+        "stats": graph.get("stats"),
+        "n_nodes": len(nodes),
+        "strings": strings,
+        "nodes": node_cols,
+        "edges": edge_cols,
+    }
+    if graph.get("layout"):
+        out["layout"] = graph["layout"]
+    return out
+
+
+def _encoded_json_response(payload: Dict[str, Any], accept_encoding: str, min_size: int = 1024) -> Response:
+    """紧凑 JSON 序列化，并按 Accept-Encoding 协商 br / gzip 压缩（小响应不压）。"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    headers = {"Vary": "Accept-Encoding"}
+    accepted = {x.split(";")[0].strip().lower() for x in accept_encoding.split(",")}
+    if len(body) >= min_size:
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=5)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _default_view(
+    kg: Dict[str, Any],
+    max_nodes: int = KG_DEFAULT_VIEW_NODES,
+    edge_types: Optional[Collection[str]] = None,
+) -> Dict[str, Any]:
+    """Top 疾病 + Top 症状，再各自带出一部分邻居。"""
+    top_d = sorted(
+        [n for n in kg["nodes"].values() if n.get("type") == "disease"],
+        key=lambda x: -int(x.get("count") or 0),
+    )[:10]
+    top_s = sorted(
+        [n for n in kg["nodes"].values() if n.get("type") == "symptom"],
+        key=lambda x: -int(x.get("count") or 0),
+    )[:12]
+    seed = [n["id"] for n in top_d + top_s]
+    # 把 seed 合并成一个子图（depth=1）
+    visited = set(seed)
+    adj = _adjacency(kg, edge_types)
+    for u in list(seed):
+        for v in adj.get(u, [])[:20]:
+            visited.add(v)
+            if len(visited) >= max_nodes:
+                break
+        if len(visited) >= max_nodes:
+            break
+
+    node_list = [kg["nodes"][nid] for nid in visited if nid in kg["nodes"]]
+    node_set = set(visited)
+    edge_list = [
+        e for e in kg["edges"]
+        if e["source"] in node_set and e["target"] in node_set and (not edge_types or e["type"] in edge_types)
+    ]
+    return {"nodes": node_list, "edges": edge_list}
+
+
+def _layout_key(
+    project_id: str,
+    kg: Dict[str, Any],
+    center: Optional[str],
+    depth: int,
+    max_nodes: int,
+    edge_types: Optional[Collection[str]],
+):
+    types = tuple(sorted(edge_types)) if edge_types else None
+    return (project_id, kg["version"], center, depth, max_nodes, types)
+
+
 @app.get("/api/v1/projects/{project_id}/kg/graph")
 def kg_graph(
     project_id: str,
+    request: Request,
     center: Optional[str] = None,
     depth: int = 1,
-    max_nodes: int = 120,
+    max_nodes: int = KG_DEFAULT_VIEW_NODES,
+    edge_types: Optional[str] = None,
+    fmt: Annotated[Optional[str], Query(alias="format")] = None,
+    layout: Optional[str] = None,
 ):
+    """
+    edge_types：只看某些类型的边，逗号分隔（HAS_SYMPTOM / CO_OCCURS_WITH），默认全部。
+    layout=server 时节点带上服务端算好的 x / y（见 app/services/kg_layout.py），前端用 preset 布局即可。
+    format=compact 时返回列式紧凑格式（见 _compact_graph），并按 Accept-Encoding 压缩；
+    不传则保持原来的 nodes / edges 字典列表。
+    """
     kg = build_kg(project_id)
+    types = _parse_edge_types(edge_types)
     # 默认：返回“Top 疾病 + Top 症状”的小图，避免首次加载太大
     if not center:
-        top_d = sorted(
-            [n for n in kg["nodes"].values() if n.get("type") == "disease"],
-            key=lambda x: -int(x.get("count") or 0),
-        )[:10]
-        top_s = sorted(
-            [n for n in kg["nodes"].values() if n.get("type") == "symptom"],
-            key=lambda x: -int(x.get("count") or 0),
-        )[:12]
-        seed = [n["id"] for n in top_d + top_s]
-        # 把 seed 合并成一个子图（depth=1）
-        visited = set(seed)
-        adj = kg.get("adj") or {}
-        for u in list(seed):
-            for v in adj.get(u, [])[:20]:
-                visited.add(v)
-                if len(visited) >= max_nodes:
+        sg = _default_view(kg, max_nodes=max_nodes, edge_types=types)
+        result = {"center": None, **sg, "stats": kg["stats"]}
+        layout_key = _layout_key(project_id, kg, None, 0, max_nodes, types)
+    else:
+        depth = max(0, min(depth, 3))
+        max_nodes = max(30, min(max_nodes, 400))
+        sg = _subgraph(kg, center=center, depth=depth, max_nodes=max_nodes, edge_types=types)
+        result = {"center": _norm_text(center), **sg, "stats": kg["stats"]}
+        layout_key = _layout_key(project_id, kg, result["center"], depth, max_nodes, types)
+
+    if layout == "server" and result["nodes"]:
+        pos, cached = kg_layout.get_layout(layout_key, [n["id"] for n in result["nodes"]], result["edges"])
+        # kg["nodes"] 里的节点是缓存对象，复制后再加坐标
+        result["nodes"] = [{**n, "x": pos[n["id"]][0], "y": pos[n["id"]][1]} for n in result["nodes"]]
+        result["layout"] = {"name": "stress", "cached": cached}
+
+    if fmt == "compact":
+        return _encoded_json_response(_compact_graph(result), request.headers.get("accept-encoding", ""))
+    return result
+
+
+def _parse_symptom_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = [x.strip() for x in value.split(",") if x.strip()]
+    return [_norm_text(x) for x in (value or []) if _norm_text(x)]
+
+
+def _match_symptom_nodes(kg: Dict[str, Any], symptoms: List[str]) -> Dict[str, str]:
+    """输入症状 -> 症状节点 id（精确优先，其次子串匹配）；匹配不上的不出现在结果里。"""
+    symptom_nodes = [n for n in kg["nodes"].values() if n.get("type") == "symptom"]
+    matched = {}
+    with metrics.timer("symptom_linking"):
+        for s in symptoms:
+            # 精确优先
+            if s in kg["nodes"] and kg["nodes"][s].get("type") == "symptom":
+                matched[s] = s
+                continue
+            # 子串召回
+            for n in symptom_nodes:
+                if s in n["label"]:
+                    matched[s] = n["id"]
                     break
-            if len(visited) >= max_nodes:
-                break
+    return matched
+
+
+_propagation_lock = threading.Lock()
 
-        node_list = [kg["nodes"][nid] for nid in visited if nid in kg["nodes"]]
-        node_set = set(visited)
-        edge_list = [e for e in kg["edges"] if e["source"] in node_set and e["target"] in node_set]
-        return {"center": None, "nodes": node_list, "edges": edge_list, "stats": kg["stats"]}
 
-    sg = _subgraph(kg, center=center, depth=max(0, min(depth, 3)), max_nodes=max(30, min(max_nodes, 400)))
-    return {"center": _norm_text(center), **sg, "stats": kg["stats"]}
+def _propagation_index(kg: Dict[str, Any]) -> kg_analytics.PropagationIndex:
+    """传播用的预计算矩阵挂在 kg 上，随 build_kg 缓存一起失效。"""
+    index = kg.get("_propagation")
+    if index is None:
+        with _propagation_lock:
+            index = kg.get("_propagation")
+            if index is None:
+                with metrics.timer("propagation_index"):
+                    index = kg_analytics.PropagationIndex(kg)
+                kg["_propagation"] = index
+    return index
 
 
 @app.post("/api/v1/projects/{project_id}/kg/diagnose")
 def kg_diagnose(project_id: str, body: Dict[str, Any]):
     """输入多个症状，返回可能的疾病排序（MVP：按边权求和）。"""
     kg = build_kg(project_id)
-    symptoms_in = body.get("symptoms") or []
-    if isinstance(symptoms_in, str):
-        symptoms_in = [x.strip() for x in symptoms_in.split(",") if x.strip()]
-
-    symptoms = [_norm_text(x) for x in symptoms_in if _norm_text(x)]
+    symptoms = _parse_symptom_list(body.get("symptoms"))
     if not symptoms:
         return {"items": []}
 
-    # 找到“症状节点”里可匹配的（支持子串匹配）
-    symptom_nodes = [n for n in kg["nodes"].values() if n.get("type") == "symptom"]
-    matched = {}
-    for s in symptoms:
-        # 精确优先
-        if s in kg["nodes"] and kg["nodes"][s].get("type") == "symptom":
-            matched[s] = s
-            continue
-        # 子串召回
-        for n in symptom_nodes:
-            if s in n["label"]:
-                matched[s] = n["id"]
-                break
-
+    matched = _match_symptom_nodes(kg, symptoms)
     matched_sym_nodes = sorted(set(matched.values()))
     if not matched_sym_nodes:
         return {"items": []}
 
-    # 建 disease->symptom weight map
-    d2s = defaultdict(dict)
-    for e in kg["edges"]:
-        if e["type"] != "HAS_SYMPTOM":
-            continue
-        d2s[e["source"]][e["target"]] = int(e.get("weight") or 0)
-
-    scores = []
-    for disease, smap in d2s.items():
-        score = 0
-        hits = []
-        for sym in matched_sym_nodes:
-            w = smap.get(sym)
-            if w:
-                score += w
-                hits.append({"symptom": sym, "weight": w})
-        if score > 0:
-            hits.sort(key=lambda x: -x["weight"])
-            scores.append({
-                "disease": disease,
-                "score": score,
-                "hit_count": len(hits),
-                "hits": hits[:10],
-            })
-
-    scores.sort(key=lambda x: (-x["score"], -x["hit_count"], x["disease"]))
+    with metrics.timer("scoring"):
+        # 建 disease->symptom weight map
+        d2s = defaultdict(dict)
+        for e in kg["edges"]:
+            if e["type"] != "HAS_SYMPTOM":
+                continue
+            d2s[e["source"]][e["target"]] = int(e.get("weight") or 0)
+
+        scores = []
+        for disease, smap in d2s.items():
+            score = 0
+            hits = []
+            for sym in matched_sym_nodes:
+                w = smap.get(sym)
+                if w:
+                    score += w
+                    hits.append({"symptom": sym, "weight": w})
+            if score > 0:
+                hits.sort(key=lambda x: -x["weight"])
+                scores.append({
+                    "disease": disease,
+                    "score": score,
+                    "hit_count": len(hits),
+                    "hits": hits[:10],
+                })
+
+        scores.sort(key=lambda x: (-x["score"], -x["hit_count"], x["disease"]))
     return {
         "matched": {"input": symptoms, "mapped": matched},
         "items": scores[:15],
     }
 
 
+@app.post("/api/v1/projects/{project_id}/kg/triage")
+def kg_triage(project_id: str, body: Dict[str, Any]):
+    """
+    交互式分诊：以已确认的症状为种子做个性化 PageRank（可经共现边传到相关疾病），
+    并按期望信息增益推荐下一个最该问的症状。
+    body：{"symptoms": [...], "absent": [...], "alpha": 0.15, "top_k": 15, "candidates": 30, "suggest": 5}
+    absent 是患者否认的症状，会压低对应疾病的后验，也不会再被推荐。
+    """
+    symptoms = _parse_symptom_list(body.get("symptoms"))
+    absent = _parse_symptom_list(body.get("absent"))
+    if not symptoms:
+        return {"items": [], "suggestions": []}
+
+    try:
+        alpha = float(body.get("alpha", 0.15))
+        top_k = int(body.get("top_k", 15))
+        n_candidates = int(body.get("candidates", 30))
+        n_suggest = int(body.get("suggest", 5))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="alpha / top_k / candidates / suggest must be numbers")
+    if not 0.0 < alpha < 1.0:
+        raise HTTPException(status_code=400, detail="alpha must be in (0, 1)")
+
+    kg = build_kg(project_id)
+    index = _propagation_index(kg)
+    matched = _match_symptom_nodes(kg, symptoms)
+    matched_absent = _match_symptom_nodes(kg, absent) if absent else {}
+    present_nodes = sorted(set(matched.values()))
+    if not present_nodes:
+        return {"matched": {"input": symptoms, "mapped": matched}, "items": [], "suggestions": []}
+
+    t0 = time.perf_counter()
+    with metrics.timer("triage"):
+        result = index.triage(
+            present_nodes,
+            absent=sorted(set(matched_absent.values()) - set(present_nodes)),
+            alpha=alpha,
+            top_k=max(1, min(top_k, 100)),
+            n_candidates=max(2, min(n_candidates, 500)),
+            n_suggest=max(0, min(n_suggest, 50)),
+        )
+    return {
+        "matched": {"input": symptoms, "mapped": matched, "absent": matched_absent},
+        "items": result["items"],
+        "suggestions": result["suggestions"],
+        "stats": {
+            "iterations": result["iterations"],
+            "entropy": result.get("entropy"),
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3),
+        },
+    }
+
+
+@app.post("/api/v1/projects/{project_id}/qc/dedup")
+def run_dedup(project_id: str, body: Optional[Dict[str, Any]] = None):
+    """
+    MinHash-LSH 近重复检测：重复簇写入 qc/dup_clusters.json，
+    非代表样本作为 rule_near_duplicate 问题写入 qc_issues.jsonl。
+    body 可选：{"threshold": 0.8, "num_perm": 128, "bands": 16}
+    """
+    body = body or {}
+    samples = load_medthink_samples(project_id)
+    try:
+        result = dedup_service.detect_project_duplicates(
+            project_id,
+            samples,
+            threshold=float(body.get("threshold", 0.8)),
+            num_perm=int(body.get("num_perm", 128)),
+            bands=int(body.get("bands", 16)),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    counts = qc_service.replace_rule_issues(project_id, dedup_service.DUP_RULE_NAME, result["issues"])
+    # 去重结果变了，按簇计数的图要重建
+    invalidate_kg(project_id)
+    return {
+        "stats": result["stats"],
+        "issues_total": counts["total"],
+        "issues_new": counts["new"],
+        "clusters": result["clusters"][:50],
+    }
+
+
 @app.post("/api/v1/projects/{project_id}/kg/refresh")
 def kg_refresh(project_id: str):
-    """清空构图缓存（当你替换/追加 jsonl 后使用）。"""
-    build_kg.cache_clear()
+    """清掉这个项目的构图缓存并重建（当你替换/追加 jsonl 后使用）。"""
+    invalidate_kg(project_id)
     kg = build_kg(project_id)
     return {"ok": True, "stats": kg["stats"]}
+
+
+# ====================== 列式批量导出 ======================
+
+def _export(project_id: str, dataset: str, fmt: str, force: bool = False) -> Dict[str, Any]:
+    try:
+        with metrics.timer("export"):
+            return export_service.export_dataset(
+                project_id, dataset, fmt, get_kg=lambda: build_kg(project_id), force=force
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/v1/projects/{project_id}/export")
+def export_project(project_id: str, body: Optional[Dict[str, Any]] = None):
+    """
+    把多个数据集导出为 Parquet / Arrow 文件（源数据没变的直接复用）。
+    body: {"datasets": [...], "format": "parquet" | "arrow", "force": false}；datasets 缺省为全部。
+    """
+    body = body or {}
+    fmt = body.get("format") or "parquet"
+    datasets = body.get("datasets") or list(export_service.DATASETS)
+    force = bool(body.get("force"))
+    return {"items": [_export(project_id, d, fmt, force) for d in datasets]}
+
+
+@app.get("/api/v1/projects/{project_id}/export/{dataset}")
+def download_export(
+    project_id: str,
+    dataset: str,
+    fmt: Annotated[str, Query(alias="format")] = "parquet",
+):
+    """下载一个数据集的导出文件（需要时先导出），文件按块流式返回。"""
+    entry = _export(project_id, dataset, fmt)
+    return FileResponse(
+        export_service.get_export_path(project_id, dataset, fmt),
+        media_type=export_service.MEDIA_TYPES[fmt],
+        filename=f"{project_id}_{entry['file']}",
+        headers={"X-Export-Rows": str(entry["rows"]), "X-Export-Cached": str(entry["cached"]).lower()},
+    )
+
+
+# ====================== 数据集版本 ======================
+# dataset 是项目目录下的相对路径：labeling/labeling_inputs.jsonl、raw/med_think_responses.jsonl
+
+def _dataset_call(fn, *args):
+    try:
+        return fn(*args)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/v1/projects/{project_id}/versions")
+def list_dataset_versions(project_id: str, dataset: str = "labeling/labeling_inputs.jsonl"):
+    versions = _dataset_call(dataset_service.list_versions, project_id, dataset)
+    return {"items": [v.summary() for v in versions[::-1]], "total": len(versions)}
+
+
+@app.post("/api/v1/projects/{project_id}/versions")
+def commit_dataset_version(project_id: str, body: Dict[str, Any]):
+    """
+    把数据集当前文件记成新版本（只存变化的块），并返回相对上一版本的变化计数。
+    body: {"dataset": "labeling/labeling_inputs.jsonl", "message": "..."}
+    """
+    dataset = body.get("dataset") or "labeling/labeling_inputs.jsonl"
+    with metrics.timer("dataset_commit"):
+        v, created = _dataset_call(dataset_service.commit_version, project_id, dataset, body.get("message") or "")
+    result = {**v.summary(), "created": created}
+    if created and v.parent is not None:
+        d = _dataset_call(dataset_service.diff_versions, project_id, dataset, v.parent, v.version)
+        result["changes"] = {k: len(d[k]) for k in ("added", "modified", "removed")}
+    return result
+
+
+@app.get("/api/v1/projects/{project_id}/versions/diff")
+def diff_dataset_versions(project_id: str, dataset: str, from_version: int, to_version: int):
+    """两个版本间新增 / 修改 / 删除的 sample_id（只读两边不同的块）。"""
+    with metrics.timer("dataset_diff"):
+        return _dataset_call(dataset_service.diff_versions, project_id, dataset, from_version, to_version)
+
+
+@app.post("/api/v1/projects/{project_id}/versions/checkout")
+def checkout_dataset_version(project_id: str, body: Dict[str, Any]):
+    """把数据集文件恢复成指定版本。body: {"dataset": "...", "version": 3}"""
+    dataset = body.get("dataset") or "labeling/labeling_inputs.jsonl"
+    try:
+        version = int(body["version"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="version is required and must be an integer")
+    v = _dataset_call(dataset_service.checkout_version, project_id, dataset, version)
+    # 原始数据换了版本，构图缓存作废（特征库按分片大小 / mtime 自己会发现）
+    invalidate_kg(project_id)
+    return v.summary()
+
+
+# ====================== 工作流节点 ======================
+# 每个节点就是把对应接口的逻辑包一层；sources / outputs 见 node_execution_service。
+
+def _raw_shards(project_id: str, config: Dict[str, Any]) -> List[Path]:
+    return medthink_service.list_shards(project_id)
+
+
+def _labeling_inputs(project_id: str, config: Dict[str, Any]) -> List[Path]:
+    return [get_labeling_path(project_id)]
+
+
+def _llm_output_path(project_id: str) -> Path:
+    return DATA_ROOT / "projects" / project_id / "llm" / "symptoms.jsonl"
+
+
+@node_execution_service.register_node(
+    "preprocess", sources=_raw_shards, outputs=_labeling_inputs, description="raw 分片 -> labeling_inputs.jsonl"
+)
+def _node_preprocess(project_id: str, config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    r = preprocessing_service.run_preprocessing(
+        project_id,
+        workers=config.get("workers"),
+        chunk_lines=int(config.get("chunk_lines") or preprocessing_service.CHUNK_LINES),
+    )
+    return {k: r[k] for k in ("run_id", "written", "errors", "errors_by_kind", "chunks_total")}
+
+
+@node_execution_service.register_node("sync_features", sources=_raw_shards, description="新到 / 变化的分片入特征库")
+def _node_sync_features(project_id: str, config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    return medthink_service.sync_features(project_id, workers=config.get("workers"))
+
+
+@node_execution_service.register_node(
+    "dedup",
+    sources=_raw_shards,
+    outputs=lambda project_id, config: [dedup_service.get_clusters_path(project_id)],
+    description="MinHash-LSH 近重复检测",
+)
+def _node_dedup(project_id: str, config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    r = run_dedup(project_id, config)
+    return {"stats": r["stats"], "issues_total": r["issues_total"], "issues_new": r["issues_new"]}
+
+
+@node_execution_service.register_node(
+    "build_kg",
+    sources=lambda project_id, config: _raw_shards(project_id, config) + [dedup_service.get_clusters_path(project_id)],
+    description="构建知识图谱（含默认视图布局和传播矩阵）",
+)
+def _node_build_kg(project_id: str, config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    invalidate_kg(project_id)
+    kg = build_kg(project_id, config.get("dedup"))
+    if config.get("propagation", True):
+        _propagation_index(kg)
+    return kg["stats"]
+
+
+@node_execution_service.register_node(
+    "qc",
+    # 模型标签从特征库（raw 分片）取
+    sources=lambda project_id, config: _labeling_inputs(project_id, config) + _raw_shards(project_id, config),
+    description="跑已注册的 QC 规则",
+)
+def _node_qc(project_id: str, config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    return run_qc(project_id, config)
+
+
+@node_execution_service.register_node(
+    "llm_extract",
+    sources=_labeling_inputs,
+    outputs=lambda project_id, config: [_llm_output_path(project_id)],
+    description="LLM 抽取样本症状，写入 llm/symptoms.jsonl",
+)
+def _node_llm_extract(project_id: str, config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """config: {"sample_ids": [...], "limit": 20, "concurrency": 4}；不给 sample_ids 时取前 limit 条。"""
+    records = load_labeling_records(project_id)
+    wanted = config.get("sample_ids")
+    if wanted:
+        wanted = {str(x) for x in wanted}
+        records = [r for r in records if str(r["sample_id"]) in wanted]
+    else:
+        records = records[: int(config.get("limit") or 20)]
+
+    def one(r: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return {"sample_id": str(r["sample_id"]), **llm_parse_symptoms(r.get("raw_text") or "")}
+        except Exception as e:
+            return {"sample_id": str(r["sample_id"]), "error": f"{type(e).__name__}: {e}"}
+
+    # LLM 调用是 IO 等待，线程并发即可
+    with ThreadPoolExecutor(max_workers=max(1, int(config.get("concurrency") or 4))) as pool:
+        rows = list(pool.map(one, records))
+    path = _llm_output_path(project_id)
+    atomic_write_jsonl(path, rows)
+    return {"samples": len(rows), "errors": sum(1 for r in rows if "error" in r), "output": str(path)}
+
+
+def _export_targets(config: Dict[str, Any]) -> Tuple[str, List[str]]:
+    return config.get("format") or "parquet", list(config.get("datasets") or export_service.DATASETS)
+
+
+def _export_outputs(project_id: str, config: Dict[str, Any]) -> List[Path]:
+    fmt, datasets = _export_targets(config)
+    return [export_service.get_export_path(project_id, d, fmt) for d in datasets]
+
+
+def _export_sources(project_id: str, config: Dict[str, Any]) -> List[Path]:
+    """各数据集读到的文件，和 export_service._source 对应；图谱数据集跟 build_kg 节点读的一样。"""
+    _, datasets = _export_targets(config)
+    paths: List[Path] = []
+    for d in datasets:
+        if d == "labeling_records":
+            paths.append(get_labeling_path(project_id))
+        elif d == "annotations":
+            paths.append(labeling_service.get_annotations_path(project_id))
+        elif d == "qc_issues":
+            paths.append(qc_service.get_qc_issues_path(project_id))
+        else:
+            paths += _raw_shards(project_id, config)
+            if d != "medthink_samples":
+                paths.append(dedup_service.get_clusters_path(project_id))
+    return list(dict.fromkeys(paths))
+
+
+@node_execution_service.register_node(
+    "export",
+    version=3,
+    sources=_export_sources,
+    outputs=_export_outputs,
+    description="导出 Parquet / Arrow 文件",
+)
+def _node_export(project_id: str, config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """config: {"format": "parquet", "datasets": [...], "dedup": null}；dedup 不给时沿用上游 build_kg 节点的设置。"""
+    fmt, datasets = _export_targets(config)
+    dedup = config.get("dedup")
+    if dedup is None:
+        # build_kg 节点的 output 就是 kg["stats"]，里面记着构图时实际用的 dedup
+        dedup = next(
+            (out["dedup"] for out in inputs.values() if isinstance(out, dict) and "min_sym_freq" in out),
+            None,
+        )
+    items = {}
+    for d in datasets:
+        e = export_service.export_dataset(project_id, d, fmt, get_kg=lambda: build_kg(project_id, dedup))
+        items[d] = {"file": e["file"], "rows": e["rows"], "cached": e["cached"]}
+    return items
+
+
+# ====================== 工作流接口 ======================
+
+def _load_workflow(project_id: str, workflow_id: str) -> Workflow:
+    try:
+        return workflow_service.load_workflow(project_id, workflow_id)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/v1/workflow/node-types")
+def list_workflow_node_types():
+    return {"items": node_execution_service.list_node_types()}
+
+
+@app.get("/api/v1/projects/{project_id}/workflows/{workflow_id}")
+def get_workflow(project_id: str, workflow_id: str):
+    wf = _load_workflow(project_id, workflow_id)
+    return {**wf.to_dict(), "order": workflow_service.validate(wf)}
+
+
+@app.put("/api/v1/projects/{project_id}/workflows/{workflow_id}")
+def put_workflow(project_id: str, workflow_id: str, body: Dict[str, Any]):
+    """保存工作流定义：{"name": "...", "nodes": [{"id", "type", "depends_on", "config", "title"}]}"""
+    try:
+        wf = Workflow.from_dict({**body, "workflow_id": workflow_id, "project_id": project_id})
+        workflow_service.save_workflow(wf)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"invalid workflow: {e}")
+    return {**wf.to_dict(), "order": workflow_service.validate(wf)}
+
+
+@app.post("/api/v1/projects/{project_id}/workflows/{workflow_id}/run")
+def run_workflow(project_id: str, workflow_id: str, body: Optional[Dict[str, Any]] = None):
+    """
+    按 DAG 执行工作流；输入没变的节点直接复用上次结果（status=cached）。
+    body 可选：{"max_workers": 4, "force": false | ["node_id", ...]}
+    """
+    body = body or {}
+    wf = _load_workflow(project_id, workflow_id)
+    try:
+        with metrics.timer("workflow"):
+            run = workflow_service.run_workflow(wf, max_workers=body.get("max_workers"), force=body.get("force") or False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return run.to_dict()
+
+
+@app.get("/api/v1/projects/{project_id}/workflows/{workflow_id}/runs")
+def list_workflow_runs(project_id: str, workflow_id: str, limit: int = 20):
+    try:
+        runs = workflow_service.list_runs(project_id, workflow_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [r.to_dict() for r in runs[::-1][: max(0, limit)]], "total": len(runs)}
+
+
+# ====================== 启动预热 ======================
+
+def _all_projects() -> List[str]:
+    root = DATA_ROOT / "projects"
+    if not root.is_dir():
+        return []
+    return [p.name for p in sorted(root.iterdir()) if p.is_dir() and medthink_service.list_shards(p.name)]
+
+
+def _warm_propagation(project_id: str) -> None:
+    _propagation_index(build_kg(project_id))
+
+
+def start_warmup():
+    """
+    KG_WARMUP_PROJECTS 里的项目在后台线程预热：特征库同步 + 构图（含默认视图布局）+ 传播矩阵。
+    不阻塞启动，进度看 /readyz。
+    """
+    projects = configured_projects(_all_projects)
+    if len(projects) > _build_kg.cache_info().maxsize:
+        logger.warning(
+            "warming %d projects, only the last %d stay cached", len(projects), _build_kg.cache_info().maxsize
+        )
+    warmup.start(projects, [("kg", build_kg), ("propagation", _warm_propagation)])
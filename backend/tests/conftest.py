@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# main / config 在 import 时读数据目录：测试一律用临时目录，不碰 backend/data
+os.environ.setdefault("MEDITAG_DATA_ROOT", tempfile.mkdtemp(prefix="meditag_test_"))
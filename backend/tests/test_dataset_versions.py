@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from app.core.config import DATA_ROOT
+from app.services import dataset_service
+from benchmarks.synth_data import generate_project
+
+DATASET = "labeling/labeling_inputs.jsonl"
+
+
+@pytest.fixture()
+def small_chunks(monkeypatch):
+    # 默认块 256KB 起步，测试数据只有几百 KB：调小让文件切成多块
+    monkeypatch.setattr(dataset_service, "MIN_CHUNK_BYTES", 4 * 1024)
+    monkeypatch.setattr(dataset_service, "AVG_CHUNK_BYTES", 8 * 1024)
+    monkeypatch.setattr(dataset_service, "MAX_CHUNK_BYTES", 64 * 1024)
+
+
+def test_cdc_diff_and_checkout(small_chunks):
+    project_id = "ds_versions"
+    generate_project(DATA_ROOT, project_id, 400, n_diseases=30)
+    path = dataset_service.dataset_path(project_id, DATASET)
+    v1_bytes = path.read_bytes()
+    v1, created = dataset_service.commit_version(project_id, DATASET, "initial")
+    assert created and v1.version == 1 and len(v1.chunks) > 5
+    assert dataset_service.commit_version(project_id, DATASET)[1] is False
+
+    # 改中间一条、删一条、末尾加一条
+    rows = [json.loads(x) for x in v1_bytes.decode("utf-8").splitlines()]
+    modified_id = rows[200]["sample_id"]
+    removed_id = rows[300]["sample_id"]
+    rows[200]["labels"] = ["人工改过的标签"]
+    del rows[300]
+    rows.append(dict(rows[0], sample_id="NEW-1"))
+    path.write_text("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows), encoding="utf-8")
+    v2, _ = dataset_service.commit_version(project_id, DATASET, "edit")
+
+    # 只有改动附近的块是新存的，其余和 v1 共用
+    assert 0 < v2.new_chunks <= 4
+    d = dataset_service.diff_versions(project_id, DATASET, 1, 2)
+    assert (d["added"], d["modified"], d["removed"]) == (["NEW-1"], [modified_id], [removed_id])
+    assert d["chunks_shared"] >= len(v1.chunks) - 4
+    assert dataset_service.changed_sample_ids(project_id, DATASET, 1, 2) == {"NEW-1", modified_id, removed_id}
+
+    v2_bytes = path.read_bytes()
+    dataset_service.checkout_version(project_id, DATASET, 1)
+    assert path.read_bytes() == v1_bytes
+    dataset_service.checkout_version(project_id, DATASET, 2)
+    assert path.read_bytes() == v2_bytes
+    with pytest.raises(FileNotFoundError):
+        dataset_service.checkout_version(project_id, DATASET, 3)
@@ -0,0 +1,38 @@
+from app.services.dedup_service import find_near_duplicates
+
+BASE = (
+    "病患id:{pid}｜日期:{date}｜主诉：反复胸闷胸痛3年，加重伴气促2天。现病史：患者3年前劳累后出现胸骨后压榨样疼痛，"
+    "休息数分钟可缓解，2天前症状加重，夜间不能平卧，伴咳嗽咳白色泡沫痰。既往高血压病史10年，规律服药。"
+    "查体：血压150/90mmHg，双肺底可闻及湿啰音，心率98次/分，律齐。"
+)
+OTHER = (
+    "病患id:{pid}｜日期:{date}｜主诉：多饮多尿消瘦半年。现病史：半年前无明显诱因出现口干多饮，每日饮水约三千毫升，"
+    "尿量明显增多，体重下降五公斤，偶有视物模糊及双足麻木。空腹血糖12.3mmol/L，糖化血红蛋白9.1%。"
+)
+
+
+def test_minhash_lsh_clusters_near_duplicates_only():
+    texts = [
+        BASE.format(pid="P001", date="2024-01-02"),
+        OTHER.format(pid="P002", date="2024-01-03"),
+        # 只换了病患 id / 日期：归一化后完全相同
+        BASE.format(pid="P003", date="2024-03-09"),
+        # 改了一个数字：近重复
+        BASE.format(pid="P004", date="2024-05-01").replace("心率98", "心率96"),
+        OTHER.replace("多饮多尿", "反复头晕").replace("血糖12.3", "血压170").format(pid="P005", date="2024-01-03"),
+        "",
+    ]
+    clusters, stats = find_near_duplicates(texts, threshold=0.8)
+
+    assert clusters == [[0, 2, 3]]
+    assert stats["duplicates"] == 2
+    assert stats["skipped_empty"] == 1
+    # 改了关键词的同模板病历相似度不到阈值，不算重复
+    assert not any(1 in c or 4 in c for c in clusters)
+
+
+def test_minhash_threshold_controls_verification():
+    a = BASE.format(pid="P001", date="2024-01-02")
+    b = a.replace("高血压病史10年，规律服药", "糖尿病病史5年，未规律服药")
+    assert find_near_duplicates([a, b], threshold=0.99)[0] == []
+    assert find_near_duplicates([a, b], threshold=0.5)[0] == [[0, 1]]
@@ -0,0 +1,35 @@
+import datetime as dt
+
+import pyarrow.parquet as pq
+
+from app.services import export_service, qc_service
+from app.utils.file_utils import atomic_write_jsonl
+
+
+def _no_kg():
+    raise AssertionError("qc_issues export must not build the KG")
+
+
+def test_qc_issue_created_at_keeps_raw_string():
+    project_id = "export_qc"
+    atomic_write_jsonl(
+        qc_service.get_qc_issues_path(project_id),
+        [
+            {"id": "QC-0001", "sampleId": "S1", "projectId": project_id, "status": "open", "createdAt": "2024-05-01 09:21"},
+            {"id": "QC-0002", "sampleId": "S2", "projectId": project_id, "status": "open", "createdAt": "今天 09:21"},
+            {"id": "QC-0003", "sampleId": "S3", "projectId": project_id, "status": "open"},
+        ],
+    )
+    entry = export_service.export_dataset(project_id, "qc_issues", "parquet", get_kg=_no_kg)
+    assert entry["rows"] == 3 and not entry["cached"]
+
+    table = pq.read_table(export_service.get_export_path(project_id, "qc_issues", "parquet"))
+    rows = {r["id"]: r for r in table.to_pylist()}
+    assert rows["QC-0001"]["createdAt"] == dt.datetime(2024, 5, 1, 9, 21)
+    assert rows["QC-0001"]["createdAt_raw"] == "2024-05-01 09:21"
+    # 解析不了的时间原样留在 createdAt_raw，不丢
+    assert rows["QC-0002"]["createdAt"] is None
+    assert rows["QC-0002"]["createdAt_raw"] == "今天 09:21"
+    assert rows["QC-0003"]["createdAt"] is None and rows["QC-0003"]["createdAt_raw"] is None
+
+    assert export_service.export_dataset(project_id, "qc_issues", "parquet", get_kg=_no_kg)["cached"]
@@ -0,0 +1,48 @@
+import gzip
+import os
+
+from app.core.config import DATA_ROOT
+from app.services import feature_store, medthink_service
+from benchmarks.synth_data import generate_project
+
+
+def test_unchanged_shards_are_skipped_on_rebuild(monkeypatch):
+    project_id = "fs_shards"
+    generate_project(DATA_ROOT, project_id, 90, n_diseases=20, shards=3, compress="gz")
+    shards = medthink_service.list_shards(project_id)
+    assert len(shards) == 3
+
+    first = medthink_service.sync_features(project_id, workers=1)
+    assert first["ingested"] == [p.name for p in shards] and first["skipped"] == 0
+    total = len(feature_store.load_features(project_id))
+
+    parsed = []
+    real = medthink_service._ingest_job
+
+    def counting(pid, path):
+        parsed.append(os.path.basename(path))
+        return real(pid, path)
+
+    monkeypatch.setattr(medthink_service, "_ingest_job", counting)
+    assert medthink_service.sync_features(project_id, workers=1)["skipped"] == 3
+    assert parsed == []
+
+    # 改一个分片（去掉最后一行）：只重新入库这一片
+    changed = shards[1]
+    with gzip.open(changed, "rt", encoding="utf-8") as fh:
+        lines = fh.read().splitlines()
+    with gzip.open(changed, "wt", encoding="utf-8") as fh:
+        fh.write("\n".join(lines[:-1]) + "\n")
+    untouched = feature_store.get_shard_features_path(project_id, shards[0].name).stat().st_mtime_ns
+
+    r = medthink_service.sync_features(project_id, workers=1)
+    assert (r["ingested"], r["skipped"]) == ([changed.name], 2)
+    assert parsed == [changed.name]
+    assert feature_store.get_shard_features_path(project_id, shards[0].name).stat().st_mtime_ns == untouched
+    assert len(feature_store.load_features(project_id)) == total - 1
+
+    # 删掉的分片移出清单
+    shards[2].unlink()
+    r = medthink_service.sync_features(project_id, workers=1)
+    assert (r["ingested"], r["removed"]) == ([], [shards[2].name])
+    assert set(feature_store.read_manifest(project_id)["shards"]) == {shards[0].name, changed.name}
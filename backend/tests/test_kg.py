@@ -0,0 +1,56 @@
+import main
+from app.core.config import DATA_ROOT
+from benchmarks.synth_data import generate_project
+
+
+def test_build_kg_cache_normalizes_args_and_invalidates_per_project():
+    for project_id in ("kg_a", "kg_b"):
+        generate_project(DATA_ROOT, project_id, 50, n_diseases=10)
+    kg_a = main.build_kg("kg_a")
+    kg_b = main.build_kg("kg_b")
+    # 三种写法是同一个缓存条目
+    assert main.build_kg("kg_a", None) is kg_a
+    assert main.build_kg("kg_a", dedup=main.KG_DEDUP_DEFAULT) is kg_a
+
+    main.invalidate_kg("kg_a")
+    assert main.build_kg("kg_a") is not kg_a
+    assert main.build_kg("kg_b") is kg_b
+
+
+def _decode_compact(g):
+    """和前端 decodeCompactGraph 一样的还原逻辑。"""
+    s = g["strings"]
+    nodes = []
+    for i in range(g["n_nodes"]):
+        node = {"id": s[i], "label": s[i], "type": s[g["nodes"]["type"][i]], "count": g["nodes"]["count"][i]}
+        if "x" in g["nodes"]:
+            node["x"], node["y"] = g["nodes"]["x"][i], g["nodes"]["y"][i]
+        nodes.append(node)
+    edges = []
+    for i, (src, dst, t) in enumerate(zip(g["edges"]["source"], g["edges"]["target"], g["edges"]["type"])):
+        edge = {"id": f"{s[src]}__{s[t]}__{s[dst]}", "source": s[src], "target": s[dst], "type": s[t], "weight": g["edges"]["weight"][i]}
+        for col in ("pmi", "lift"):
+            if g["edges"].get(col) and g["edges"][col][i] is not None:
+                edge[col] = g["edges"][col][i]
+        edges.append(edge)
+    return {"center": g["center"], "nodes": nodes, "edges": edges, "stats": g["stats"], "layout": g.get("layout")}
+
+
+def test_compact_graph_round_trips():
+    from fastapi.testclient import TestClient
+
+    project_id = "kg_compact"
+    generate_project(DATA_ROOT, project_id, 200, n_diseases=20)
+    client = TestClient(main.app)
+    url = f"/api/v1/projects/{project_id}/kg/graph"
+    for params in ({}, {"layout": "server"}):
+        plain = client.get(url, params=params).json()
+        r = client.get(url, params={**params, "format": "compact"}, headers={"Accept-Encoding": "gzip"})
+        assert r.headers.get("content-encoding") == "gzip"
+        decoded = _decode_compact(r.json())
+
+        assert plain["edges"] and decoded["center"] == plain["center"] and decoded["stats"] == plain["stats"]
+        assert decoded["layout"] == plain.get("layout")
+        keys = ("id", "label", "type", "count", "x", "y")
+        assert decoded["nodes"] == [{k: n[k] for k in keys if k in n} for n in plain["nodes"]]
+        assert decoded["edges"] == plain["edges"]
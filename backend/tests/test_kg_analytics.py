@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.services import kg_analytics
+
+# 5 个样本、3 个疾病；第 5 个样本里疾病 0 重复出现，只算一次
+SAMPLES = [[0, 1], [0, 1, 2], [0, 2], [1], [0, 0, 1]]
+
+
+def test_incidence_matrix_dedups_within_sample():
+    x = kg_analytics.incidence_matrix(SAMPLES, 3).toarray()
+    assert x.tolist() == [[1, 1, 0], [1, 1, 1], [1, 0, 1], [0, 1, 0], [1, 1, 0]]
+
+
+def test_cooccurrence_matches_hand_computed_counts():
+    # 单病数 c = [4, 4, 2]；共现 c01 = 3, c02 = 2, c12 = 1；N = 5
+    expected = {(0, 1): (3, 3 * 5 / (4 * 4)), (0, 2): (2, 2 * 5 / (4 * 2)), (1, 2): (1, 1 * 5 / (4 * 2))}
+    pairs = kg_analytics.cooccurrence_pairs(SAMPLES, 3, min_count=1)
+    assert [(i, j) for i, j, *_ in pairs] == sorted(expected)
+    for i, j, count, pmi, lift in pairs:
+        want_count, want_lift = expected[(i, j)]
+        assert count == want_count
+        assert lift == pytest.approx(want_lift)
+        assert pmi == pytest.approx(math.log(want_lift))
+
+    # min_count 过滤掉只共现一次的 (1, 2)
+    assert [(i, j) for i, j, *_ in kg_analytics.cooccurrence_pairs(SAMPLES, 3, min_count=2)] == [(0, 1), (0, 2)]
+    assert kg_analytics.cooccurrence_pairs([], 3) == []
+
+
+def _toy_kg():
+    # 心绞痛 主要表现胸痛，心衰 主要表现气促，二者都常见乏力
+    nodes = {
+        "心绞痛": {"id": "心绞痛", "type": "disease", "count": 10},
+        "心衰": {"id": "心衰", "type": "disease", "count": 10},
+        "胸痛": {"id": "胸痛", "type": "symptom", "count": 9},
+        "乏力": {"id": "乏力", "type": "symptom", "count": 10},
+        "气促": {"id": "气促", "type": "symptom", "count": 9},
+    }
+    edges = [
+        {"source": "心绞痛", "target": "胸痛", "type": "HAS_SYMPTOM", "weight": 9},
+        {"source": "心绞痛", "target": "乏力", "type": "HAS_SYMPTOM", "weight": 5},
+        {"source": "心衰", "target": "乏力", "type": "HAS_SYMPTOM", "weight": 5},
+        {"source": "心衰", "target": "气促", "type": "HAS_SYMPTOM", "weight": 9},
+    ]
+    return {"nodes": nodes, "edges": edges}
+
+
+def test_personalized_pagerank_ranks_diseases_near_seed_first():
+    idx = kg_analytics.PropagationIndex(_toy_kg())
+    seed = idx.index["胸痛"]
+    r, iters = idx.personalized_pagerank([seed], tol=1e-8, max_iter=500)
+    assert iters < 500
+    assert r.sum() == pytest.approx(1.0)
+    # 收敛到不动点 r = α s + (1-α) P r（没有悬挂节点）
+    s = np.zeros(idx.n_nodes)
+    s[seed] = 1.0
+    assert np.allclose(r, 0.15 * s + 0.85 * (idx.transition @ r), atol=1e-7)
+    assert r[idx.index["心绞痛"]] > r[idx.index["心衰"]] > 0
+
+    result = idx.triage(["胸痛"])
+    assert [x["disease"] for x in result["items"]] == ["心绞痛", "心衰"]
+    # 否认胸痛后，只剩乏力的证据时心衰反超
+    assert idx.triage(["乏力"], absent=["胸痛"])["items"][0]["disease"] == "心衰"
+
+
+def test_information_gain_prefers_discriminating_symptom():
+    idx = kg_analytics.PropagationIndex(_toy_kg())
+    rows = idx.disease_row[[idx.index["心绞痛"], idx.index["心衰"]]]
+    cols, ig, p_yes = idx.information_gain(rows, np.array([0.5, 0.5]))
+    by_symptom = {idx.node_ids[idx.symptom_idx[c]]: (g, p) for c, g, p in zip(cols, ig, p_yes)}
+    # 乏力在两个病里的似然一样，问了也分不开
+    assert by_symptom["乏力"][0] == pytest.approx(0.0, abs=1e-9)
+    assert by_symptom["乏力"][1] == pytest.approx(0.5)
+    assert by_symptom["胸痛"][0] > 0.5 and by_symptom["气促"][0] > 0.5
+
+    # 已经问过胸痛：最值得问的是气促，乏力不推荐
+    suggestions = idx.triage(["胸痛"])["suggestions"]
+    assert [s["symptom"] for s in suggestions] == ["气促"]
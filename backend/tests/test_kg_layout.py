@@ -0,0 +1,46 @@
+from app.services import kg_layout
+
+NODES = ["a", "b", "c", "d"]
+EDGES = [{"source": "a", "target": "b"}, {"source": "b", "target": "c"}, {"source": "c", "target": "d"}]
+
+
+def test_layout_cache_hit_miss_and_eviction(monkeypatch):
+    monkeypatch.setattr(kg_layout, "_cache", kg_layout.LayoutCache(maxsize=2))
+    calls = []
+    real = kg_layout.layout_positions
+
+    def counting(node_ids, edges, seed=0):
+        calls.append(tuple(node_ids))
+        return real(node_ids, edges, seed)
+
+    monkeypatch.setattr(kg_layout, "layout_positions", counting)
+
+    pos, cached = kg_layout.get_layout("k1", NODES, EDGES)
+    assert not cached and set(pos) == set(NODES)
+    # 节点顺序不同也命中，坐标一样
+    again, cached = kg_layout.get_layout("k1", NODES[::-1], EDGES)
+    assert cached and again == pos
+    assert len(calls) == 1
+
+    # 同一个键但子图多了节点：当作未命中重算
+    _, cached = kg_layout.get_layout("k1", NODES + ["e"], EDGES)
+    assert not cached and len(calls) == 2
+
+    kg_layout.get_layout("k2", NODES, EDGES)
+    kg_layout.get_layout("k1", NODES, EDGES)  # k1 变成最近使用
+    kg_layout.get_layout("k3", NODES, EDGES)  # 挤掉最久没用的 k2
+    assert len(kg_layout._cache) == 2
+    assert kg_layout.get_layout("k1", NODES, EDGES)[1]
+    assert not kg_layout.get_layout("k2", NODES, EDGES)[1]
+
+
+def test_layout_is_deterministic_and_keeps_hops():
+    pos = kg_layout.layout_positions(NODES, EDGES)
+    assert pos == kg_layout.layout_positions(NODES, EDGES)
+
+    def dist(u, v):
+        return ((pos[u][0] - pos[v][0]) ** 2 + (pos[u][1] - pos[v][1]) ** 2) ** 0.5
+
+    # 链 a-b-c-d：相邻点约一跳，两端约三跳
+    assert abs(dist("a", "b") - kg_layout.EDGE_LENGTH) < 0.2 * kg_layout.EDGE_LENGTH
+    assert dist("a", "d") > 2.5 * kg_layout.EDGE_LENGTH
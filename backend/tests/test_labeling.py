@@ -0,0 +1,78 @@
+import pytest
+
+from app.services import labeling_service
+from app.services.labeling_service import LeaseExpiredError, TaskQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def annotations_path(tmp_path, monkeypatch):
+    path = tmp_path / "labeling" / "annotations.jsonl"
+    monkeypatch.setattr(labeling_service, "get_annotations_path", lambda project_id: path)
+    return path
+
+
+def _queue(n, replicas=1, clock=None):
+    return TaskQueue("p", [f"s{i}" for i in range(n)], replicas=replicas, lease_seconds=10, clock=clock or FakeClock())
+
+
+def test_replicas_go_to_distinct_annotators():
+    q = _queue(3, replicas=2)
+    a = [q.claim("a")["sample_id"] for _ in range(3)]
+    assert a == ["s0", "s1", "s2"]
+    assert q.claim("a") is None
+    b = [q.claim("b")["sample_id"] for _ in range(3)]
+    assert b == ["s0", "s1", "s2"]
+    assert q.claim("c") is None
+    assert q.stats()["pending_slots"] == 0
+
+
+def test_claim_does_not_rescan_own_samples():
+    q = _queue(1000, replicas=2)
+    for _ in range(500):
+        q.claim("fast")
+    # 游标已经走到第 500 个样本，前面的不再看
+    assert q._cursors["fast"] == 500
+    assert q.claim("fast")["sample_id"] == "s500"
+    assert q.claim("slow")["sample_id"] == "s0"
+
+
+def test_expired_lease_is_redistributed():
+    clock = FakeClock()
+    q = _queue(2, clock=clock)
+    lease = q.claim("a")
+    clock.now = 5
+    assert q.claim("b")["sample_id"] == "s1"
+    clock.now = 11
+    # b 的游标已经走过 s0，过期退回的名额仍能领到
+    assert q.claim("b")["sample_id"] == "s0"
+    with pytest.raises(LeaseExpiredError):
+        q.complete(lease["lease_id"], "a", {"label": "x"})
+
+
+def test_failed_append_keeps_lease(monkeypatch, annotations_path):
+    q = _queue(1)
+    lease = q.claim("a")
+
+    def broken(ann):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(q, "_append", broken)
+    with pytest.raises(OSError):
+        q.complete(lease["lease_id"], "a", {"label": "x"})
+    assert q.stats()["completed"] == 0
+    assert q.stats()["active_leases"] == 1
+
+    monkeypatch.undo()
+    monkeypatch.setattr(labeling_service, "get_annotations_path", lambda project_id: annotations_path)
+    ann = q.complete(lease["lease_id"], "a", {"label": "x"})
+    assert ann.sample_id == "s0"
+    assert q.stats()["finished_samples"] == 1
+    assert len(labeling_service.load_annotations("p")) == 1
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from app.core.config import DATA_ROOT
+from app.services import preprocessing_service
+from app.services.preprocessing_service import _convert_chunk
+from benchmarks.synth_data import generate_project
+
+
+def _good_record(custom_id="S1"):
+    return {
+        "custom_id": custom_id,
+        "request": {"messages": [{"role": "user", "content": "主诉：胸闷\n诊断结论：高血压"}]},
+        "response": '```json\n{"all_result": ["高血压"], "高血压": "<med_think>支持高血压</med_think>"}\n```',
+    }
+
+
+def _run_chunk(tmp_path, records):
+    part = tmp_path / "part-0000-000000.jsonl"
+    lines = [r if isinstance(r, str) else json.dumps(r, ensure_ascii=False) for r in records]
+    counts = _convert_chunk("p", "shard.jsonl", 1, lines, str(part))
+    rows = [json.loads(x) for x in part.read_text(encoding="utf-8").splitlines()]
+    err_path = part.with_suffix(".errors.jsonl")
+    errors = [json.loads(x) for x in err_path.read_text(encoding="utf-8").splitlines()] if err_path.exists() else []
+    return counts, rows, errors
+
+
+def test_malformed_shapes_are_recorded_and_skipped(tmp_path):
+    bad_request = dict(_good_record("S2"), request="oops")
+    dict_response = dict(_good_record("S3"), response={"all_result": ["高血压"]})
+    bad_messages = dict(_good_record("S4"), request={"messages": "hi"})
+    counts, rows, errors = _run_chunk(tmp_path, [_good_record(), bad_request, dict_response, bad_messages, "{"])
+
+    assert counts == {"lines": 5, "written": 1, "errors": 4}
+    assert [r["sample_id"] for r in rows] == ["S1"]
+    assert rows[0]["labels"] == ["高血压"] and rows[0]["title"] == "高血压"
+    assert [(e["sample_id"], e["kind"]) for e in errors] == [
+        ("S2", "bad_shape"),
+        ("S3", "bad_shape"),
+        ("S4", "bad_shape"),
+        (None, "invalid_json"),
+    ]
+
+
+def test_resume_after_interrupted_chunk_matches_clean_run(monkeypatch):
+    project_id = "pre_resume"
+    generate_project(DATA_ROOT, project_id, 500, n_diseases=50)
+    out = DATA_ROOT / "projects" / project_id / "labeling" / "labeling_inputs.jsonl"
+
+    clean = preprocessing_service.run_preprocessing(project_id, chunk_lines=100, restart=True)
+    expected = out.read_bytes()
+    out.unlink()
+
+    real = preprocessing_service._convert_chunk
+    calls = {"n": 0}
+
+    def crash_on_third(*args):
+        calls["n"] += 1
+        if calls["n"] == 3:
+            raise KeyboardInterrupt("simulated crash")
+        return real(*args)
+
+    monkeypatch.setattr(preprocessing_service, "_convert_chunk", crash_on_third)
+    with pytest.raises(KeyboardInterrupt):
+        preprocessing_service.run_preprocessing(project_id, chunk_lines=100)
+    assert not out.exists()
+    monkeypatch.setattr(preprocessing_service, "_convert_chunk", real)
+
+    resumed = preprocessing_service.run_preprocessing(project_id, chunk_lines=100)
+    assert resumed["chunks_resumed"] == 2
+    assert resumed["chunks_done"] == clean["chunks_total"] - 2
+    assert resumed["written"] == clean["written"]
+    assert out.read_bytes() == expected
@@ -0,0 +1,72 @@
+from app.services.qc_service import rule_label_vs_symptom
+
+
+def _sample(raw_text, labels=("需紧急就诊",), symptoms=None):
+    return {"sample_id": "s1", "labels": list(labels), "raw_text": raw_text, "symptoms": symptoms}
+
+
+def test_high_risk_acute_terms_not_in_extractor():
+    # 晕厥 / 冷汗 / 意识障碍 抽不成特征库症状，要按原文匹配
+    raw = '"主诉": "突发晕厥伴冷汗1小时", "现病史": "意识障碍"'
+    assert rule_label_vs_symptom(_sample(raw)) is None
+    assert rule_label_vs_symptom(_sample(raw, symptoms=[])) is None
+    assert rule_label_vs_symptom(_sample(raw, symptoms=["乏力"])) is None
+
+
+def test_high_risk_without_acute_symptoms_flagged():
+    raw = '"主诉": "否认胸痛，无呼吸困难", "现病史": "乏力3天"'
+    assert rule_label_vs_symptom(_sample(raw, symptoms=["乏力"])) == "标注为高危，但病历中未见急性症状"
+
+
+def test_high_risk_acute_from_extracted_symptoms():
+    assert rule_label_vs_symptom(_sample("", symptoms=["胸痛"])) is None
+
+
+def test_stable_with_acute_symptoms_flagged():
+    detail = rule_label_vs_symptom(_sample("突发胸痛伴晕厥", labels=("稳定",)))
+    assert detail is not None and "胸痛" in detail and "晕厥" in detail
+
+
+def test_model_vs_human_ignores_normalization_differences():
+    from app.services.qc_service import rule_model_vs_human
+
+    # 特征库里的诊断经过 norm_text（全角冒号 -> 半角），人工标签是原样
+    sample = {"labels": ["心律失常：多发房早、偶发室早"], "model_labels": ["心律失常:多发房早、偶发室早"]}
+    assert rule_model_vs_human(sample) is None
+    assert rule_model_vs_human({"labels": ["稳定"], "model_labels": ["高血压"]}) == "模型：高血压；人工：稳定"
+
+
+def test_seeded_issues_keep_review_status():
+    import shutil
+    from pathlib import Path
+
+    from app.services import qc_service
+
+    seeded = Path(__file__).resolve().parents[1] / "data" / "projects" / "p1" / "qc" / "qc_issues.jsonl"
+    path = qc_service.get_qc_issues_path("p1")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(seeded, path)
+    long_cot = "；".join(["胸痛劳累后加重休息缓解提示心绞痛"] * 5)
+    samples = [
+        {"sample_id": "EMR-0001", "labels": ["稳定"], "raw_text": "胸痛", "cot_text": long_cot},
+        {"sample_id": "EMR-0002", "labels": ["稳定"], "raw_text": "乏力", "cot_text": "太短"},
+        {"sample_id": "EMR-0003", "labels": ["稳定"], "raw_text": "心悸", "cot_text": long_cot, "model_labels": ["心律失常"]},
+    ]
+
+    report = qc_service.run_qc_rules("p1", samples, workers=1)
+    by_legacy = {i.get("legacyId") or i["id"]: i for i in qc_service.iter_jsonl(path)}
+    assert report["issues_new"] == 0
+    assert set(by_legacy) == {"QC-0001", "QC-0002", "QC-0003", "QC-0004"}
+
+    # 规则再次报出的迁移成规则 id，审核状态 / 审核人 / 创建时间沿用
+    confirmed = by_legacy["QC-0003"]
+    assert confirmed["id"] == qc_service._issue_id("EMR-0003", "rule_model_vs_human")
+    assert (confirmed["status"], confirmed["lastReviewer"], confirmed["createdAt"]) == ("confirmed", "质检员 B", "昨天 16:20")
+    assert by_legacy["QC-0002"]["createdAt"] == "今天 09:05"
+    # 规则没报的手工问题原样保留
+    assert by_legacy["QC-0001"]["id"] == "QC-0001" and by_legacy["QC-0001"]["lastReviewer"] == "质检员 A"
+    assert by_legacy["QC-0004"]["id"] == "QC-0004"
+
+    qc_service.run_qc_rules("p1", samples, workers=1, full=True)
+    again = {i.get("legacyId") or i["id"]: i for i in qc_service.iter_jsonl(path)}
+    assert again == by_legacy
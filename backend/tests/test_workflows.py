@@ -0,0 +1,151 @@
+import json
+
+import pytest
+
+from app.models.workflow import Workflow
+from app.models.workflow_node import WorkflowNode
+from app.services import node_execution_service, workflow_service
+
+CALLS = []
+
+
+@pytest.fixture(autouse=True)
+def project_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(node_execution_service, "get_project_dir", lambda project_id: tmp_path / project_id)
+    monkeypatch.setattr(workflow_service, "get_project_dir", lambda project_id: tmp_path / project_id)
+    CALLS.clear()
+    return tmp_path / "p"
+
+
+def _output_file(project_id, config):
+    return [node_execution_service.get_project_dir(project_id) / f"{config['name']}.out"]
+
+
+@node_execution_service.register_node("test_step", outputs=_output_file)
+def _step(project_id, config, inputs):
+    CALLS.append(config["name"])
+    path = _output_file(project_id, config)[0]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(config["name"], encoding="utf-8")
+    return {"name": config["name"], "inputs": sorted(inputs)}
+
+
+@node_execution_service.register_node("test_fail")
+def _fail(project_id, config, inputs):
+    CALLS.append("fail")
+    raise RuntimeError("boom")
+
+
+def _node(nid, depends_on=(), type="test_step"):
+    return WorkflowNode(id=nid, type=type, depends_on=list(depends_on), config={"name": nid})
+
+
+def _workflow(*nodes):
+    return Workflow(workflow_id="wf", project_id="p", nodes=list(nodes))
+
+
+def test_topo_order():
+    wf = _workflow(_node("c", ["a", "b"]), _node("b", ["a"]), _node("a"))
+    order = wf.topo_order()
+    assert order.index("a") < order.index("b") < order.index("c")
+
+
+def test_cycle_and_unknown_dependency_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        workflow_service.validate(_workflow(_node("a", ["b"]), _node("b", ["a"])))
+    with pytest.raises(ValueError, match="unknown node"):
+        workflow_service.validate(_workflow(_node("a", ["missing"])))
+    with pytest.raises(ValueError, match="unknown node type"):
+        workflow_service.validate(_workflow(_node("a", type="no_such_type")))
+
+
+def test_failed_node_skips_descendants_only():
+    wf = _workflow(
+        _node("bad", type="test_fail"),
+        _node("child", ["bad"]),
+        _node("grandchild", ["child"]),
+        _node("other"),
+    )
+    run = workflow_service.run_workflow(wf)
+    assert run.status == "failed"
+    assert run.nodes["bad"].status == "failed"
+    assert run.nodes["child"].status == "skipped"
+    assert run.nodes["grandchild"].status == "skipped"
+    assert run.nodes["other"].status == "success"
+    assert sorted(CALLS) == ["fail", "other"]
+
+
+def test_cache_hit_and_miss(project_dir):
+    wf = _workflow(_node("a"), _node("b", ["a"]))
+    first = workflow_service.run_workflow(wf)
+    assert [first.nodes[n].status for n in ("a", "b")] == ["success", "success"]
+    assert first.nodes["b"].output == {"name": "b", "inputs": ["a"]}
+
+    CALLS.clear()
+    second = workflow_service.run_workflow(wf)
+    assert [second.nodes[n].status for n in ("a", "b")] == ["cached", "cached"]
+    assert CALLS == []
+
+    # 删掉下游的产物：只有它自己重跑
+    (project_dir / "b.out").unlink()
+    third = workflow_service.run_workflow(wf)
+    assert [third.nodes[n].status for n in ("a", "b")] == ["cached", "success"]
+
+    # 删掉上游的产物：上游重跑后产物摘要变了，下游也要重跑
+    CALLS.clear()
+    (project_dir / "a.out").unlink()
+    rerun = workflow_service.run_workflow(wf)
+    assert [rerun.nodes[n].status for n in ("a", "b")] == ["success", "success"]
+    assert CALLS == ["a", "b"]
+
+    # config 变了：键变了，下游跟着重跑
+    CALLS.clear()
+    wf.nodes[0].config["extra"] = 1
+    fourth = workflow_service.run_workflow(wf)
+    assert [fourth.nodes[n].status for n in ("a", "b")] == ["success", "success"]
+    assert CALLS == ["a", "b"]
+
+    CALLS.clear()
+    forced = workflow_service.run_workflow(wf, force=["a"])
+    assert CALLS == ["a", "b"]
+    assert len(workflow_service.list_runs("p", "wf")) == 6
+    assert forced.status == "success"
+
+
+def test_default_workflow_keeps_rule_and_dedup_issues(monkeypatch):
+    import time
+
+    import main
+    from app.core.config import DATA_ROOT
+    from app.services import qc_service
+    from benchmarks.synth_data import generate_project
+
+    project_id = "wf_default"
+    generate_project(DATA_ROOT, project_id, 200, n_diseases=50)
+    raw = DATA_ROOT / "projects" / project_id / "raw" / "med_think_responses.jsonl"
+    lines = raw.read_text(encoding="utf-8").splitlines()
+    # 追加几条改了 id 的重复病历（去重一定会报），COT 截短（rule_cot_min_length 一定会报）
+    dups = []
+    for i, line in enumerate(lines[:5]):
+        rec = json.loads(line)
+        rec["custom_id"] = f"DUP-{i}"
+        rec["response"] = '```json\n{"all_result": ["高血压"], "高血压": "<med_think>支持高血压</med_think>"}\n```'
+        dups.append(json.dumps(rec, ensure_ascii=False))
+    raw.write_text("\n".join(lines + dups) + "\n", encoding="utf-8")
+
+    # 拉长读到写之间的窗口：QC 和去重两个分支并发时，没有锁必然互相覆盖
+    real_write = qc_service.atomic_write_jsonl
+
+    def slow_write(path, rows):
+        time.sleep(0.3)
+        return real_write(path, rows)
+
+    monkeypatch.setattr(qc_service, "atomic_write_jsonl", slow_write)
+    run = workflow_service.run_workflow(workflow_service.default_workflow(project_id), max_workers=4)
+    assert run.status == "success", {k: v.error for k, v in run.nodes.items()}
+
+    issues = list(qc_service.iter_jsonl(qc_service.get_qc_issues_path(project_id)))
+    rules = {i["ruleName"] for i in issues}
+    assert "rule_near_duplicate" in rules
+    assert "rule_cot_min_length" in rules
+    main.invalidate_kg(project_id)
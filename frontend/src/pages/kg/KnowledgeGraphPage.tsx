@@ -50,6 +50,7 @@ const KnowledgeGraphPage: React.FC = () => {
         type: n.type,
         count: n.count || 0,
       },
+      ...(typeof n.x === "number" && typeof n.y === "number" ? { position: { x: n.x, y: n.y } } : {}),
     }));
     const edges = (graph?.edges || []).map((e) => ({
       data: {
@@ -237,7 +238,9 @@ const KnowledgeGraphPage: React.FC = () => {
     if (!cy) return;
     cy.elements().remove();
     cy.add(elements);
-    cy.layout({ name: "cose", animate: false }).run();
+    // 服务端给了坐标就直接用（preset），否则退回浏览器里的 cose 力导向
+    const hasPositions = elements.nodes.length > 0 && elements.nodes.every((n) => n.position);
+    cy.layout(hasPositions ? { name: "preset", fit: true } : { name: "cose", animate: false }).run();
 
 
     const c = currentCenterRef.current;
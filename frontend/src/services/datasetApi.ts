@@ -0,0 +1,84 @@
+// frontend/src/services/datasetApi.ts
+import { http } from "./http";
+
+// 项目目录下的相对路径，如 labeling/labeling_inputs.jsonl、raw/med_think_responses.jsonl
+export type DatasetPath = string;
+
+export interface DatasetVersion {
+  project_id: string;
+  dataset: DatasetPath;
+  version: number;
+  sha256: string;
+  bytes: number;
+  records: number;
+  chunk_count: number;
+  parent: number | null;
+  new_chunks: number;
+  new_bytes: number;
+  chunker: { min: number; avg: number; max: number };
+  message: string;
+  created_at: string;
+}
+
+export interface CommitVersionResponse extends DatasetVersion {
+  created: boolean;
+  changes?: { added: number; modified: number; removed: number };
+}
+
+export interface DatasetDiff {
+  dataset: DatasetPath;
+  from: number;
+  to: number;
+  chunks_shared: number;
+  chunks_read: number;
+  added: string[];
+  modified: string[];
+  removed: string[];
+  unkeyed_records: number;
+}
+
+const DEFAULT_DATASET = "labeling/labeling_inputs.jsonl";
+
+export async function fetchDatasetVersions(
+  projectId: string,
+  dataset: DatasetPath = DEFAULT_DATASET
+): Promise<{ items: DatasetVersion[]; total: number }> {
+  return http<{ items: DatasetVersion[]; total: number }>(
+    `/api/v1/projects/${projectId}/versions?dataset=${encodeURIComponent(dataset)}`
+  );
+}
+
+export async function commitDatasetVersion(
+  projectId: string,
+  body: { dataset?: DatasetPath; message?: string }
+): Promise<CommitVersionResponse> {
+  return http<CommitVersionResponse>(`/api/v1/projects/${projectId}/versions`, {
+    method: "POST",
+    body: JSON.stringify(body),
+  });
+}
+
+export async function diffDatasetVersions(
+  projectId: string,
+  dataset: DatasetPath,
+  fromVersion: number,
+  toVersion: number
+): Promise<DatasetDiff> {
+  const qs = new URLSearchParams({
+    dataset,
+    from_version: String(fromVersion),
+    to_version: String(toVersion),
+  });
+  return http<DatasetDiff>(`/api/v1/projects/${projectId}/versions/diff?${qs.toString()}`);
+}
+
+export async function checkoutDatasetVersion(
+  projectId: string,
+  dataset: DatasetPath,
+  version: number
+): Promise<DatasetVersion> {
+  return http<DatasetVersion>(`/api/v1/projects/${projectId}/versions/checkout`, {
+    method: "POST",
+    body: JSON.stringify({ dataset, version }),
+  });
+}
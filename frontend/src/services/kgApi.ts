@@ -9,21 +9,33 @@ export interface KgNode {
   label: string;
   type: KgNodeType;
   count?: number;
+  // layout=server 时服务端算好的坐标
+  x?: number;
+  y?: number;
 }
 
+export type KgEdgeType = "HAS_SYMPTOM" | "CO_OCCURS_WITH";
+
 export interface KgEdge {
   id: string;
   source: string;
   target: string;
-  type: "HAS_SYMPTOM";
+  type: KgEdgeType;
   weight?: number;
+  // 仅 CO_OCCURS_WITH（疾病共现）边有
+  pmi?: number;
+  lift?: number;
 }
 
 export interface KgStats {
   disease_nodes: number;
   symptom_nodes: number;
+  // 只计 HAS_SYMPTOM 边；疾病共现边数见 cooccur_edges
   edges: number;
+  cooccur_edges?: number;
   min_sym_freq: number;
+  min_co_count?: number;
+  version?: string;
 }
 
 export interface KgGraphResponse {
@@ -31,6 +43,7 @@ export interface KgGraphResponse {
   nodes: KgNode[];
   edges: KgEdge[];
   stats: KgStats;
+  layout?: { name: string; cached: boolean };
 }
 
 export interface KgSearchResponse {
@@ -58,13 +71,63 @@ export function fetchKgStats(projectId: string) {
   return http<KgStats>(`/api/v1/projects/${projectId}/kg/stats`);
 }
 
-export function fetchKgGraph(projectId: string, params?: { center?: string; depth?: number; max_nodes?: number }) {
+// format=compact 的列式响应：字符串只传一次，节点 / 边是并列的整数数组
+export interface KgGraphCompactResponse {
+  format: "compact-v1";
+  center: string | null;
+  stats: KgStats;
+  layout?: { name: string; cached: boolean };
+  n_nodes: number;
+  strings: string[];
+  nodes: { type: number[]; count: number[]; x?: number[]; y?: number[] };
+  edges: {
+    source: number[];
+    target: number[];
+    type: number[];
+    weight: number[];
+    pmi?: (number | null)[];
+    lift?: (number | null)[];
+  };
+}
+
+export function decodeCompactGraph(g: KgGraphCompactResponse): KgGraphResponse {
+  const nodes: KgNode[] = [];
+  for (let i = 0; i < g.n_nodes; i++) {
+    const id = g.strings[i];
+    const node: KgNode = { id, label: id, type: g.strings[g.nodes.type[i]] as KgNodeType, count: g.nodes.count[i] };
+    if (g.nodes.x && g.nodes.y) {
+      node.x = g.nodes.x[i];
+      node.y = g.nodes.y[i];
+    }
+    nodes.push(node);
+  }
+  const edges: KgEdge[] = [];
+  for (let i = 0; i < g.edges.source.length; i++) {
+    const source = g.strings[g.edges.source[i]];
+    const target = g.strings[g.edges.target[i]];
+    const type = g.strings[g.edges.type[i]] as KgEdge["type"];
+    const edge: KgEdge = { id: `${source}__${type}__${target}`, source, target, type, weight: g.edges.weight[i] };
+    const pmi = g.edges.pmi?.[i];
+    const lift = g.edges.lift?.[i];
+    if (pmi != null) edge.pmi = pmi;
+    if (lift != null) edge.lift = lift;
+    edges.push(edge);
+  }
+  return { center: g.center, nodes, edges, stats: g.stats, layout: g.layout };
+}
+
+export async function fetchKgGraph(projectId: string, params?: { center?: string; depth?: number; max_nodes?: number; edge_types?: KgEdgeType[] }) {
   const q = new URLSearchParams();
   if (params?.center) q.set("center", params.center);
+  if (params?.edge_types?.length) q.set("edge_types", params.edge_types.join(","));
+  // 服务端算好布局，浏览器不用再跑力导向
+  q.set("layout", "server");
   if (typeof params?.depth === "number") q.set("depth", String(params.depth));
   if (typeof params?.max_nodes === "number") q.set("max_nodes", String(params.max_nodes));
-  const suffix = q.toString() ? `?${q.toString()}` : "";
-  return http<KgGraphResponse>(`/api/v1/projects/${projectId}/kg/graph${suffix}`);
+  // 浏览器会自动带 Accept-Encoding 并解压 gzip / br
+  q.set("format", "compact");
+  const g = await http<KgGraphCompactResponse>(`/api/v1/projects/${projectId}/kg/graph?${q.toString()}`);
+  return decodeCompactGraph(g);
 }
 
 export function searchKg(projectId: string, q: string, type?: KgNodeType) {
@@ -104,3 +167,36 @@ export function diagnoseFromText(projectId: string, text: string) {
 
 
 
+
+// 交互式分诊：个性化 PageRank 排序 + 按信息增益推荐下一个要问的症状
+export interface TriageItem {
+  disease: string;
+  score: number;
+  posterior: number;
+  hits: { symptom: string; likelihood: number }[];
+}
+
+export interface TriageSuggestion {
+  symptom: string;
+  information_gain: number;
+  p_present: number;
+}
+
+export interface TriageResponse {
+  matched?: { input: string[]; mapped: Record<string, string>; absent: Record<string, string> };
+  items: TriageItem[];
+  suggestions: TriageSuggestion[];
+  stats?: { iterations: number; entropy: number | null; elapsed_ms: number };
+}
+
+export function triage(
+  projectId: string,
+  symptoms: string[],
+  absent: string[] = [],
+  params?: { alpha?: number; top_k?: number; candidates?: number; suggest?: number }
+) {
+  return http<TriageResponse>(`/api/v1/projects/${projectId}/kg/triage`, {
+    method: "POST",
+    body: JSON.stringify({ symptoms, absent, ...params }),
+  });
+}
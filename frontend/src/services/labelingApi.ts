@@ -110,3 +110,88 @@ export async function generateCotForSample(
     }
   );
 }
+
+// 5) 任务分发：领取 / 续租 / 释放 / 提交（租约过期返回 409）
+export interface LabelingLease {
+  lease_id: string;
+  project_id: string;
+  sample_id: string;
+  annotator: string;
+  expires_in: number;
+  heartbeats: number;
+  replica?: number;
+  replicas?: number;
+}
+
+export interface LabelingQueueStats {
+  project_id: string;
+  samples: number;
+  replicas: number;
+  lease_seconds: number;
+  pending_slots: number;
+  active_leases: number;
+  completed: number;
+  finished_samples: number;
+}
+
+export interface CompleteTaskBody {
+  annotator: string;
+  label?: string | null;
+  cot_text?: string | null;
+  source?: "human" | "model" | "mixed";
+}
+
+export async function fetchLabelingQueue(projectId: string): Promise<LabelingQueueStats> {
+  return http<LabelingQueueStats>(`/api/v1/projects/${projectId}/labeling/queue`);
+}
+
+export async function configureLabelingQueue(
+  projectId: string,
+  body: { replicas?: number; lease_seconds?: number }
+): Promise<LabelingQueueStats> {
+  return http<LabelingQueueStats>(`/api/v1/projects/${projectId}/labeling/queue`, {
+    method: "POST",
+    body: JSON.stringify(body),
+  });
+}
+
+export async function claimLabelingTask(
+  projectId: string,
+  annotator: string
+): Promise<{ task: LabelingLease | null }> {
+  return http<{ task: LabelingLease | null }>(`/api/v1/projects/${projectId}/labeling/tasks/claim`, {
+    method: "POST",
+    body: JSON.stringify({ annotator }),
+  });
+}
+
+export async function heartbeatLabelingTask(
+  projectId: string,
+  leaseId: string,
+  annotator: string
+): Promise<LabelingLease> {
+  return http<LabelingLease>(`/api/v1/projects/${projectId}/labeling/tasks/${leaseId}/heartbeat`, {
+    method: "POST",
+    body: JSON.stringify({ annotator }),
+  });
+}
+
+export async function releaseLabelingTask(projectId: string, leaseId: string, annotator: string) {
+  return http<{ lease_id: string; sample_id: string; released: boolean }>(
+    `/api/v1/projects/${projectId}/labeling/tasks/${leaseId}/release`,
+    {
+      method: "POST",
+      body: JSON.stringify({ annotator }),
+    }
+  );
+}
+
+export async function completeLabelingTask(projectId: string, leaseId: string, body: CompleteTaskBody) {
+  return http<CompleteTaskBody & { project_id: string; sample_id: string; lease_id: string; created_at: string }>(
+    `/api/v1/projects/${projectId}/labeling/tasks/${leaseId}/complete`,
+    {
+      method: "POST",
+      body: JSON.stringify(body),
+    }
+  );
+}
@@ -25,6 +25,7 @@ export interface QcIssue {
   status: "pending" | "confirmed" | "ignored";
   createdAt: string;
   lastReviewer?: string;
+  detail?: string;
 }
 
 export interface QcIssuesResponse {
@@ -43,3 +44,32 @@ export async function fetchQcIssues(
 ): Promise<QcIssuesResponse> {
   return http<QcIssuesResponse>(`/api/v1/projects/${projectId}/qc/issues`);
 }
+
+export interface QcRuleStats {
+  evaluated: number;
+  flagged: number;
+  seconds: number;
+  samples_per_sec: number | null;
+}
+
+export interface QcRunReport {
+  project_id: string;
+  total_samples: number;
+  evaluated_samples: number;
+  skipped_samples: number;
+  issues_total: number;
+  issues_new: number;
+  workers: number;
+  seconds: number;
+  rules: Record<string, QcRuleStats>;
+}
+
+export async function runQc(
+  projectId: string,
+  options: { full?: boolean; workers?: number } = {}
+): Promise<QcRunReport> {
+  return http<QcRunReport>(`/api/v1/projects/${projectId}/qc/run`, {
+    method: "POST",
+    body: JSON.stringify(options),
+  });
+}
@@ -0,0 +1,90 @@
+// frontend/src/services/workflowApi.ts
+import { http } from "./http";
+
+export interface WorkflowNodeDef {
+  id: string;
+  type: string;
+  depends_on: string[];
+  config: Record<string, unknown>;
+  title: string;
+}
+
+export interface WorkflowDef {
+  workflow_id: string;
+  project_id: string;
+  name: string;
+  nodes: WorkflowNodeDef[];
+  order: string[];
+}
+
+export type NodeRunStatus = "pending" | "running" | "success" | "cached" | "failed" | "skipped";
+
+export interface NodeRun {
+  node_id: string;
+  node_type: string;
+  status: NodeRunStatus;
+  cache_key: string | null;
+  started_at: string | null;
+  seconds: number | null;
+  output: Record<string, unknown> | null;
+  output_digest: string | null;
+  error: string | null;
+}
+
+export interface WorkflowRun {
+  run_id: string;
+  workflow_id: string;
+  project_id: string;
+  status: "running" | "success" | "failed";
+  started_at: string;
+  finished_at: string | null;
+  seconds: number | null;
+  max_workers: number;
+  nodes: Record<string, NodeRun>;
+}
+
+export interface WorkflowNodeType {
+  type: string;
+  version: number;
+  description: string;
+}
+
+export async function fetchWorkflowNodeTypes(): Promise<{ items: WorkflowNodeType[] }> {
+  return http<{ items: WorkflowNodeType[] }>(`/api/v1/workflow/node-types`);
+}
+
+export async function fetchWorkflow(projectId: string, workflowId = "default"): Promise<WorkflowDef> {
+  return http<WorkflowDef>(`/api/v1/projects/${projectId}/workflows/${workflowId}`);
+}
+
+export async function saveWorkflow(
+  projectId: string,
+  workflowId: string,
+  body: { name?: string; nodes: Omit<WorkflowNodeDef, "title">[] }
+): Promise<WorkflowDef> {
+  return http<WorkflowDef>(`/api/v1/projects/${projectId}/workflows/${workflowId}`, {
+    method: "PUT",
+    body: JSON.stringify(body),
+  });
+}
+
+export async function runWorkflow(
+  projectId: string,
+  workflowId = "default",
+  body: { max_workers?: number; force?: boolean | string[] } = {}
+): Promise<WorkflowRun> {
+  return http<WorkflowRun>(`/api/v1/projects/${projectId}/workflows/${workflowId}/run`, {
+    method: "POST",
+    body: JSON.stringify(body),
+  });
+}
+
+export async function fetchWorkflowRuns(
+  projectId: string,
+  workflowId = "default",
+  limit = 20
+): Promise<{ items: WorkflowRun[]; total: number }> {
+  return http<{ items: WorkflowRun[]; total: number }>(
+    `/api/v1/projects/${projectId}/workflows/${workflowId}/runs?limit=${limit}`
+  );
+}